@@ -18,7 +18,7 @@ import container
 from . import core
 from . import exceptions
 from container.config import AnsibleContainerConductorConfig
-from container.utils import list_to_ordereddict
+from container.utils import list_to_ordereddict, decode_conductor_payload
 
 from logging import config
 LOGGING = {
@@ -81,10 +81,27 @@ class HostCommand(object):
                                         u'Conductor. Format each variable as a key=value string.',
                                    default=[])
 
+        if cmd in ('build', 'run', 'stop', 'restart', 'destroy'):
+            subparser.add_argument('--event-log', action='store',
+                                   help=u'Write a JSON event for each playbook, task and task result '
+                                        u'to this file, one per line, and show compact progress in '
+                                        u'place of Ansible\'s output.',
+                                   dest='event_log', default=None)
+
         if cmd in ('run', 'stop', 'restart', 'destroy'):
             subparser.add_argument('--production', action='store_true',
                                help=u'Run with the production configuration.',
                                default=False, dest='production')
+            subparser.add_argument('--native', action='store_true',
+                                   help=u'Manage containers directly through the engine\'s API, handling '
+                                        u'services in parallel in order of their dependencies, rather '
+                                        u'than through the orchestration playbook.',
+                                   default=False, dest='native')
+            subparser.add_argument('--targets', action='store', nargs='+',
+                                   help=u'With --native and the k8s or openshift engines, apply to each '
+                                        u'of these targets from the k8s_targets setting at the same time, '
+                                        u'rendering the resources once.',
+                                   default=None, dest='targets')
 
         if cmd in ('deploy', 'push'):
             subparser.add_argument('--username', action='store',
@@ -144,6 +161,11 @@ class HostCommand(object):
                                     u'changes have been made necessitating rebuild. '
                                     u'You may disable conductor caching with this flag.',
                                dest='conductor_cache', default=True)
+        subparser.add_argument('--no-requirements-cache', action='store_false',
+                               help=u'Install ansible-requirements.txt and requirements.yml while '
+                                    u'building the Conductor image, rather than with pip and Galaxy '
+                                    u'caches kept in Docker volumes.',
+                               dest='requirements_cache', default=True)
         subparser.add_argument('--no-container-cache', action='store_false',
                                help=u'Ansible Container caches image layers during builds '
                                     u'and reuses existing layers if it determines no '
@@ -159,6 +181,20 @@ class HostCommand(object):
                                help=u'Specify the host path that should be mounted to the conductor at /src.'
                                     u'Defaults to the directory from which ansible-container was invoked.',
                                dest='src_mount_path', default=None)
+        subparser.add_argument('--in-process', action='store_true',
+                               help=u'Apply roles through Ansible\'s Python API within the Conductor, '
+                                    u'reusing loaded plugins and inventory between roles, rather than '
+                                    u'starting ansible-playbook for each one.',
+                               dest='in_process', default=False)
+        subparser.add_argument('--checkpoint-every', action='store', type=int,
+                               help=u'While applying a role, commit a checkpoint of the build container '
+                                    u'every N tasks. If the role fails, the next build resumes from the '
+                                    u'latest checkpoint rather than starting the role over.',
+                               dest='checkpoint_every', default=None)
+        subparser.add_argument('--checkpoint-tag', action='store',
+                               help=u'Commit a checkpoint of the build container after any task '
+                                    u'carrying this tag.',
+                               dest='checkpoint_tag', default=None)
         subparser.add_argument('ansible_options', action='store',
                                help=u'Provide additional commandline arguments to '
                                     u'Ansible in executing your playbook. If you '
@@ -198,6 +234,14 @@ class HostCommand(object):
         subparser.add_argument('--ask-vault-pass', action='store_true',
                                help=u'Asks for the fault file password at run time',
                                dest='ask_vault_pass')
+        subparser.add_argument('--wait', action='store_true',
+                               help=u'With the k8s and openshift engines, wait for each deployment to '
+                                    u'finish rolling out, reporting its progress, and fail as soon as '
+                                    u'a container can\'t start.',
+                               default=False, dest='wait')
+        subparser.add_argument('--wait-timeout', action='store', type=int,
+                               help=u'Seconds to wait for deployments to be ready. Defaults to 600.',
+                               default=None, dest='wait_timeout')
         self.subcmd_common_parsers(parser, subparser, 'run')
 
 
@@ -231,6 +275,19 @@ class HostCommand(object):
 
     def subcmd_install_parser(self, parser, subparser):
         subparser.add_argument('roles', nargs='+', action='store')
+        subparser.add_argument('--role-cache', action='store', dest='role_cache',
+                               help=u'Directory where downloaded role archives are kept, and reused '
+                                    u'by later installs in any project. Defaults to '
+                                    u'~/.ansible-container/roles.',
+                               default=os.path.join('~', '.ansible-container', 'roles'))
+        subparser.add_argument('--role-archives', action='store', dest='role_archives',
+                               help=u'Directory of role archives, named <role>-<version>.tar.gz, '
+                                    u'to install roles from before trying Galaxy.',
+                               default=None)
+        subparser.add_argument('--offline', action='store_true', dest='offline',
+                               help=u'Install roles only from the role cache and --role-archives, '
+                                    u'without contacting Galaxy.',
+                               default=False)
 
     def subcmd_import_parser(self, parser, subparser):
         # Commenting out until we can solidify the "import" interface
@@ -380,18 +437,24 @@ def conductor_commandline():
     parser.add_argument('--engine', action='store', help=u'Engine name.', required=True)
     parser.add_argument('--params', action='store', required=False,
                         help=u'Encoded parameters for command.')
-    parser.add_argument('--config', action='store', required=True,
+    parser.add_argument('--config', action='store', required=False,
                         help=u'Encoded Ansible Container config.')
     parser.add_argument('--encoding', action='store', choices=['b64json'],
                         help=u'Encoding used for parameters.', default='b64json')
+    parser.add_argument('--payload', action='store', required=False,
+                        help=u'Path to the compressed config and parameters for command.')
 
     args = parser.parse_args()
 
-    decoding_fn = globals()['decode_%s' % args.encoding]
-    if args.params:
-        params = decoding_fn(args.params)
+    if args.payload:
+        with open(args.payload, 'rb') as f:
+            containers_config, params = decode_conductor_payload(f.read())
+    elif args.config:
+        decoding_fn = globals()['decode_%s' % args.encoding]
+        containers_config = list_to_ordereddict(decoding_fn(args.config))
+        params = decoding_fn(args.params) if args.params else {}
     else:
-        params = {}
+        parser.error(u'one of the arguments --payload --config is required')
 
     if params.get('debug'):
         LOGGING['loggers']['container']['level'] = 'DEBUG'
@@ -409,8 +472,7 @@ def conductor_commandline():
         logger.error('Error copying build context: %s', p_obj.stderr.read())
         sys.exit(p_obj.returncode)
 
-    containers_config = decoding_fn(args.config)
-    conductor_config = AnsibleContainerConductorConfig(list_to_ordereddict(containers_config),
+    conductor_config = AnsibleContainerConductorConfig(containers_config,
                                                        skip_services=args.command in BYPASS_SERVICE_PROCESSING)
     logger.debug('Starting Ansible Container Conductor: %s', args.command, services=conductor_config.services)
     getattr(core, 'conductorcmd_%s' % args.command)(
@@ -15,6 +15,7 @@ import os
 import re
 import ruamel
 import shutil
+import stat
 import sys
 import subprocess
 import tarfile
@@ -26,6 +27,14 @@ try:
 except ImportError:
     from pipes import quote
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 import requests
 
 from six import iteritems, text_type
@@ -40,6 +49,10 @@ from .utils import resolve_config_path
 from . import __version__, host_only, conductor_only, ENV
 from .config import DEFAULT_CONDUCTOR_BASE
 from container.utils.loader import load_engine
+from container.utils import slim
+from container.utils.ignore import PathIgnorer
+from container.utils.merkle import TreeHasher
+from container.plugins.callback import CALLBACK_PLUGINS_PATH
 
 if ENV == 'conductor':
     from container.utils.galaxy import AnsibleContainerGalaxy
@@ -127,24 +140,16 @@ def hostcmd_init(base_path, project=None, force=False, config_file=None, **kwarg
         logger.info('Ansible Container initialized.')
 
 @host_only
-def hostcmd_prebake(distros, debug=False, cache=True, ignore_errors=False):
-    logger.info('Prebaking distros...', distros=distros, cache=cache)
+def hostcmd_prebake(distros, debug=False, cache=True, ignore_errors=False, workers=None, slim=True):
+    logger.info('Prebaking distros...', distros=distros, cache=cache, slim=slim)
     engine_obj = load_engine(['BUILD_CONDUCTOR'], 'docker', os.getcwd(), {}, debug=debug)
     from .docker.engine import PREBAKED_DISTROS
-    for distro in (distros or PREBAKED_DISTROS):
-        logger.info('Now prebaking Conductor image for %s', distro)
-        try:
-            engine_obj.build_conductor_image(os.getcwd(),
-                                             distro,
-                                             prebaking=True,
-                                             cache=cache)
-        except Exception as e:
-            logger.exception('Failure building prebaked image for %s', distro)
-            if ignore_errors:
-                continue
-        except KeyboardInterrupt:
-            if ignore_errors:
-                continue
+    engine_obj.prebake_conductor_images(os.getcwd(),
+                                        distros or sorted(PREBAKED_DISTROS),
+                                        cache=cache,
+                                        workers=workers,
+                                        ignore_errors=ignore_errors,
+                                        slim=slim)
 
 
 @host_only
@@ -181,7 +186,8 @@ def hostcmd_build(base_path, project_name, engine_name, vars_files=None, config_
             base_path,
             config.conductor_base,
             cache=conductor_cache,
-            environment=env_vars
+            environment=env_vars,
+            build_cache=kwargs.get('requirements_cache', True)
         )
     else:
         logger.warning(u'%s does not support building the Conductor image.',
@@ -200,6 +206,7 @@ def hostcmd_build(base_path, project_name, engine_name, vars_files=None, config_
 
     kwargs['cache'] = kwargs['cache'] and kwargs['container_cache']
     kwargs['config_vars'] = config.get('defaults')
+    kwargs['settings'] = config.get('settings', {})
     engine_obj.await_conductor_command(
         'build', dict(config), base_path, kwargs, save_container=save_container)
 
@@ -472,6 +479,10 @@ def hostcmd_install(base_path, project_name, engine_name, config_file=None, **kw
     engine_obj = load_engine(['INSTALL'],
                              engine_name, config.project_name,
                              config['services'], **kwargs)
+    for path_key in ('role_cache', 'role_archives'):
+        if kwargs.get(path_key):
+            kwargs[path_key] = os.path.normpath(os.path.abspath(os.path.expanduser(kwargs[path_key])))
+    kwargs.update(host_user_uid=os.getuid(), host_user_gid=os.getgid())
     engine_obj.await_conductor_command('install',
                                        dict(config),
                                        base_path,
@@ -544,26 +555,65 @@ def resolve_push_to(push_to, default_url, default_namespace):
 
 
 @conductor_only
-def set_path_ownership(path, uid, gid):
+def _scan_dir(path):
+    """ Yield the path and lstat result of each entry in a directory """
+    if scandir is not None:
+        for entry in scandir(path):
+            yield entry.path, entry.stat(follow_symlinks=False)
+    else:
+        for name in os.listdir(path):
+            entry_path = os.path.join(path, name)
+            yield entry_path, os.lstat(entry_path)
+
+
+@conductor_only
+def set_path_ownership(path, uid, gid, recursive=True):
     """
-    Starting with the path, recursively set ownership of files and subdirectories.
+    Set ownership of the path and, when recursive, of its files and subdirectories. Entries
+    already owned by uid:gid are skipped, and symlinks are changed rather than followed.
     :param path: Root path
     :param uid: User ID
     :param gid: Group ID
-    :return: None
+    :param recursive: Also walk the contents of path, if it's a directory
+    :return: number of entries whose ownership changed
     """
-    os.chown(path, uid, gid)
-    for root, dirs, files in os.walk(path):
-        for d in dirs:
-            os.chown(os.path.join(root, d), uid, gid)
-        for f in files:
-            os.chown(os.path.join(root, f), uid, gid)
+    def set_ownership(entry_path, entry_stat):
+        if entry_stat.st_uid == uid and entry_stat.st_gid == gid:
+            return 0
+        os.lchown(entry_path, uid, gid)
+        return 1
+
+    path_stat = os.lstat(path)
+    touched = set_ownership(path, path_stat)
+    if recursive and stat.S_ISDIR(path_stat.st_mode):
+        dirs = [path]
+        while dirs:
+            for entry_path, entry_stat in _scan_dir(dirs.pop()):
+                touched += set_ownership(entry_path, entry_stat)
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    dirs.append(entry_path)
+    return touched
+
+
+def _enable_callback_plugins(env, callbacks):
+    """
+    Make Ansible Container's callback plugins available to ansible-playbook, and whitelist
+    the requested ones in addition to any already configured.
+    """
+    plugin_paths = [CALLBACK_PLUGINS_PATH]
+    if env.get('ANSIBLE_CALLBACK_PLUGINS'):
+        plugin_paths.append(env['ANSIBLE_CALLBACK_PLUGINS'])
+    env['ANSIBLE_CALLBACK_PLUGINS'] = ':'.join(plugin_paths)
+    whitelist = [c for c in env.get('ANSIBLE_CALLBACK_WHITELIST', '').split(',') if c]
+    whitelist += [c for c in callbacks if c not in whitelist]
+    env['ANSIBLE_CALLBACK_WHITELIST'] = ','.join(whitelist)
 
 
 @conductor_only
 def run_playbook(playbook, engine, service_map, ansible_options='', local_python=False, debug=False,
                  deployment_output_path=None, tags=None, build=False, vault_password=None,
-                 vault_password_file=None, **kwargs):
+                 vault_password_file=None, start_at_task=None, callbacks=None, extra_env=None, runner=None,
+                 **kwargs):
     uid, gid = kwargs.get('host_user_uid', 1), kwargs.get('host_user_gid', 1)
     return_code = 0
     inventory_path, vault_pass_path, playbook_path = '', '', ''
@@ -586,9 +636,14 @@ def run_playbook(playbook, engine, service_map, ansible_options='', local_python
                     # Use local Python runtime
                     ofs.write('%s ansible_host="%s"\n' % (service_name, container_id))
 
-
-        set_path_ownership(output_dir, uid, gid)
-
+        # Only the files written here need handing over to the host user. Walking all of
+        # /src would touch every file in the project before every playbook run.
+        touched = 0
+        for path in (playbook_path, inventory_path):
+            touched += set_path_ownership(path, uid, gid, recursive=False)
+        if deployment_output_path:
+            touched += set_path_ownership(deployment_output_path, uid, gid)
+        logger.debug(u'Set ownership of generated files', touched=touched, uid=uid, gid=gid)
 
         if vault_password_file:
             vault_password_file = '--vault-password-file {}'.format(vault_password_file)
@@ -613,11 +668,31 @@ def run_playbook(playbook, engine, service_map, ansible_options='', local_python
         else:
             pass
 
+        if start_at_task:
+            ansible_args['ansible_options'] += ' --start-at-task={} '.format(quote(start_at_task))
+
+        if runner is not None and runner.supports(callbacks, extra_env, kwargs.get('event_log')):
+            options = ' '.join([ansible_args[key] for key in ('debug_maybe', 'ansible_options', 'build_args',
+                                                             'orchestrate_args', 'vault_password_file')])
+            return runner.run(playbook_path, service_map, ansible_options=options,
+                              python_interpreter=None if local_python else engine.python_interpreter_path)
+        elif runner is not None:
+            # Callbacks are configured through the environment, which only a fresh process picks up
+            logger.debug(u'Running ansible-playbook in a subprocess in order to load callbacks',
+                         callbacks=callbacks)
+
         # env = os.environ.copy()
         # env['ANSIBLE_REMOTE_TEMP'] = '/tmp/.ansible-${USER}/tmp'
 
         env = {}
         env.update(os.environ)
+        if kwargs.get('event_log'):
+            # In place of the default stdout callback, so only the compact progress is shown
+            env['ANSIBLE_STDOUT_CALLBACK'] = 'ac_events'
+        if callbacks or kwargs.get('event_log'):
+            _enable_callback_plugins(env, callbacks or [])
+        if extra_env:
+            env.update(extra_env)
 
         ansible_cmd = ('{ansible_playbook} '
                        '{debug_maybe} '
@@ -663,14 +738,17 @@ def run_playbook(playbook, engine, service_map, ansible_options='', local_python
 @conductor_only
 def apply_role_to_container(role, container_id, service_name, engine, vars={},
                             local_python=False, ansible_options='',
-                            debug=False):
+                            debug=False, checkpoint_env=None, start_at_task=None, runner=None,
+                            event_log=None):
     playbook = generate_playbook_for_role(service_name, vars, role)
     container_metadata = engine.inspect_container(container_id)
     onbuild = container_metadata['Config']['OnBuild']
     # FIXME: Actually do stuff if onbuild is not null
 
     rc = run_playbook(playbook, engine, {service_name: container_id}, ansible_options=ansible_options,
-                      local_python=local_python, debug=debug, build=True)
+                      local_python=local_python, debug=debug, build=True, start_at_task=start_at_task,
+                      callbacks=['ac_checkpoint'] if checkpoint_env else None, extra_env=checkpoint_env,
+                      runner=runner, event_log=event_log)
     if rc:
         logger.error('Error applying role!', playbook=playbook, engine=engine,
             exit_code=rc)
@@ -771,14 +849,42 @@ def _run_intermediate_build_container(engine, container_name, cur_image_id, serv
                                         **run_kwargs)
     return container_id
 
+def _slim_build_container(engine, container_id, service_name, service, settings):
+    """
+    Remove package indexes, caches and temp files from the build container before its
+    changes are committed. Returns the number of bytes removed, or None when slimming
+    is not enabled for the service.
+    """
+    settings_slim, service_slim = settings.get('slim'), service.get('slim')
+    if not settings_slim and not service_slim:
+        return None
+    os_release = engine.get_container_os_release(container_id)
+    paths = slim.get_slim_paths(os_release, settings_slim=settings_slim,
+                                service_slim=service_slim, service_name=service_name)
+    if not paths:
+        return None
+    logger.debug(u'Slimming build container', service=service_name, paths=paths,
+                 distro=os_release.get('ID'))
+    return engine.slim_container(container_id, paths)
+
 
 @conductor_only
 def conductorcmd_build(engine_name, project_name, services, cache=True, local_python=False,
                        ansible_options='', debug=False, config_vars=None, **kwargs):
     engine = load_engine(['BUILD'], engine_name, project_name, services, **kwargs)
     logger.info(u'%s integration engine loaded. Build starting.', engine.display_name, project=project_name)
+    settings = kwargs.get('settings') or {}
+    checkpoint_every = kwargs.get('checkpoint_every')
+    checkpoint_tag = kwargs.get('checkpoint_tag')
     services_to_build = kwargs.get('services_to_build') or services.keys()
     logger.debug("Services to build", services_to_build=services_to_build)
+    # Shared by every service, so content common to several roles is hashed once per build
+    tree_hasher = TreeHasher(PathIgnorer.from_project('/src'))
+    runner = None
+    if kwargs.get('in_process'):
+        # Imported here, as it pulls in Ansible's executor
+        from container.utils.executor import InProcessPlaybookRunner
+        runner = InProcessPlaybookRunner()
     for service_name, service in services.items():
         if service_name not in services_to_build:
             logger.debug('Skipping service %s...', service_name)
@@ -791,11 +897,15 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
         fingerprint_hash = hashlib.sha256('%s::' % cur_image_id)
         # The variables handed to us are also important to cacheability
         fingerprint_hash.update(text_type(config_vars))
+        # As is what slimming removes from each layer
+        fingerprint_hash.update(slim.get_slim_fingerprint(settings.get('slim'), service.get('slim'),
+                                                          service_name))
         logger.debug(u'Base fingerprint hash = %s', fingerprint_hash.hexdigest(),
                      service=service_name, hash=fingerprint_hash.hexdigest())
 
         # Presume cache is still good unless we're not caching at all
         cache_busted = not cache
+        total_bytes_saved = 0
 
         cur_container_id = engine.get_container_id_for_service(service_name)
         if cur_container_id:
@@ -804,9 +914,11 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
 
         if service.get('roles'):
             for role in service['roles']:
+                start_at_task, checkpoint_index = None, 0
                 cur_image_fingerprint = fingerprint_hash.hexdigest()
                 role_name = role if not isinstance(role, dict) else role.get('role')
-                role_fingerprint = get_role_fingerprint(role, service_name, config_vars)
+                role_fingerprint = get_role_fingerprint(role, service_name, config_vars,
+                                                        hasher=tree_hasher)
                 fingerprint_hash.update(role_fingerprint)
                 logger.info('Fingerprint for this layer: %s', fingerprint_hash.hexdigest(),
                             service=service_name, role=role_name, parent_image_id=cur_image_id,
@@ -841,7 +953,19 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
                                     fingerprint=fingerprint_hash.hexdigest(),
                                     cur_image_id=cur_image_id)
                         cache_busted = True
-                        if int_container_id:
+                        checkpoint = engine.get_latest_checkpoint(fingerprint_hash.hexdigest())
+                        if checkpoint:
+                            # A previous attempt at this layer failed part way through, leaving
+                            # a checkpoint behind. Pick up from there.
+                            checkpoint_image_id, start_at_task, checkpoint_index = checkpoint
+                            logger.info(u'Resuming role %s from checkpoint %s at task "%s"',
+                                        role_name, checkpoint_index, start_at_task,
+                                        service=service_name, checkpoint_image_id=checkpoint_image_id)
+                            container_id = _run_intermediate_build_container(
+                                engine, int_container_name, checkpoint_image_id, service_name, service,
+                                local_python=local_python
+                            )
+                        elif int_container_id:
                             # There is still an intermediate build container.
                             logger.info(u'Reusing intermediate build container '
                                         u'%s to reapply role %s.',
@@ -879,16 +1003,37 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
                     time.sleep(0.2)
                 logger.debug('Container confirmed running', id=container_id)
 
+                checkpoint_env = None
+                if checkpoint_every or checkpoint_tag:
+                    checkpoint_env = dict(
+                        ANSIBLE_CONTAINER_CHECKPOINT_ENGINE=engine_name,
+                        ANSIBLE_CONTAINER_CHECKPOINT_PROJECT=project_name,
+                        ANSIBLE_CONTAINER_CHECKPOINT_CONTAINER=container_id,
+                        ANSIBLE_CONTAINER_CHECKPOINT_FINGERPRINT=fingerprint_hash.hexdigest(),
+                        ANSIBLE_CONTAINER_CHECKPOINT_EVERY=text_type(checkpoint_every or 0),
+                        ANSIBLE_CONTAINER_CHECKPOINT_TAG=checkpoint_tag or '',
+                        ANSIBLE_CONTAINER_CHECKPOINT_INDEX=text_type(checkpoint_index),
+                    )
                 rc = apply_role_to_container(role, container_id, service_name,
                                              engine, vars=config_vars,
                                              local_python=local_python,
                                              ansible_options=ansible_options,
-                                             debug=debug)
-                logger.debug('Playbook run finished.', exit_code=rc)
+                                             debug=debug,
+                                             checkpoint_env=checkpoint_env,
+                                             start_at_task=start_at_task,
+                                             runner=runner,
+                                             event_log=kwargs.get('event_log'))
+                logger.debug('Playbook run finished.', exit_code=rc, stats=getattr(rc, 'stats', None))
                 if rc:
                     raise RuntimeError('Build failed.')
                 logger.info(u'Applied role to service', service=service_name, role=role_name)
 
+                bytes_saved = _slim_build_container(engine, container_id, service_name, service, settings)
+                if bytes_saved is not None:
+                    logger.info(u'Slimmed layer before commit', service=service_name, role=role_name,
+                                bytes_saved=bytes_saved)
+                    total_bytes_saved += bytes_saved
+
                 engine.stop_container(container_id, forcefully=True)
                 is_last_role = role is service['roles'][-1]
                 if is_last_role and kwargs.get('flatten'):
@@ -905,11 +1050,16 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
                     logger.info(u'Committed layer as image', service=service_name,
                                 image=image_id, role=role_name,
                                 fingerprint=fingerprint_hash.hexdigest(),)
+                if checkpoint_env or start_at_task:
+                    engine.remove_checkpoints(fingerprint_hash.hexdigest(), keep=image_id)
                 # engine.delete_container(container_id)
                 cur_image_id = image_id
             # Tag the image also as latest:
             engine.tag_image_as_latest(service_name, cur_image_id)
             logger.info(u'Build complete.', service=service_name)
+            if total_bytes_saved:
+                logger.info(u'Layer slimming removed %s bytes', total_bytes_saved, service=service_name,
+                            bytes_saved=total_bytes_saved)
             logger.info(u'Cleaning up stale build artifacts.', service=service_name)
             intermediate_containers = list(engine.get_intermediate_containers_for_service(service_name))
             logger.debug(u'Containers vs. artifacts', artifact_breadcrumbs=artifact_breadcrumbs,
@@ -925,6 +1075,40 @@ def conductorcmd_build(engine_name, project_name, services, cache=True, local_py
     logger.info(u'All images successfully built.')
 
 
+def _orchestrate_natively(engine, desired_state, **kwargs):
+    """
+    When requested with --native, and the engine supports it, orchestrate services through the
+    engine's API instead of a playbook. Returns True if it did.
+    """
+    if kwargs.get('targets') and not (kwargs.get('native') and engine.CAP_DEPLOY_TARGETS):
+        raise AnsibleContainerConfigException(
+            u'--targets requires --native, and an engine that supports targets, such as k8s or openshift.')
+    if not kwargs.get('native'):
+        return False
+    if not engine.CAP_NATIVE_ORCHESTRATION:
+        logger.warning(u'%s does not support native orchestration. Using the orchestration playbook.',
+                       engine.display_name, engine=engine.display_name)
+        return False
+    if desired_state in ('start', 'restart'):
+        engine.write_secrets(**kwargs)
+    engine.orchestrate(desired_state, **kwargs)
+    return True
+
+
+def _wait_for_rollout(engine, wait=False, wait_timeout=None, targets=None, **kwargs):
+    """
+    When requested with --wait, and the engine supports it, wait for the services just started
+    to be ready.
+    """
+    if not wait:
+        return
+    if not engine.CAP_WAIT_FOR_ROLLOUT:
+        logger.warning(u'%s does not support waiting for services to be ready.',
+                       engine.display_name, engine=engine.display_name)
+        return
+    engine.wait_for_rollout(timeout=wait_timeout, targets=targets)
+
+
 @conductor_only
 def conductorcmd_run(engine_name, project_name, services, **kwargs):
     engine = load_engine(['RUN'], engine_name, project_name, services, **kwargs)
@@ -936,12 +1120,19 @@ def conductorcmd_run(engine_name, project_name, services, **kwargs):
         [service for service, service_desc in services.items()
          if service_desc.get('roles')])
 
-    playbook = engine.generate_orchestration_playbook(**kwargs)
+    if _orchestrate_natively(engine, 'start', **kwargs):
+        _wait_for_rollout(engine, **kwargs)
+        logger.info(u'All services running.')
+        return
+
+    secrets_written = engine.write_secrets(**kwargs)
+    playbook = engine.generate_orchestration_playbook(secrets_written=secrets_written, **kwargs)
     rc = run_playbook(playbook, engine, services, tags=['start'], **kwargs)
     if rc:
         raise AnsibleContainerException(
             'Error executing the run command. Not all containers may be running.'
         )
+    _wait_for_rollout(engine, **kwargs)
     logger.info(u'All services running.', playbook_rc=rc)
 
 
@@ -950,7 +1141,11 @@ def conductorcmd_restart(engine_name, project_name, services, **kwargs):
     engine = load_engine(['RUN'], engine_name, project_name, services, **kwargs)
     logger.info(u'Engine integration loaded. Preparing to restart containers.',
                 engine=engine.display_name)
-    playbook = engine.generate_orchestration_playbook(**kwargs)
+    if _orchestrate_natively(engine, 'restart', **kwargs):
+        logger.info(u'All services restarted.')
+        return
+    secrets_written = engine.write_secrets(**kwargs)
+    playbook = engine.generate_orchestration_playbook(secrets_written=secrets_written, **kwargs)
     rc = run_playbook(playbook, engine, services, tags=['restart'], **kwargs)
     if rc:
         raise AnsibleContainerException(
@@ -964,6 +1159,9 @@ def conductorcmd_stop(engine_name, project_name, services, **kwargs):
     engine = load_engine(['RUN'], engine_name, project_name, services, **kwargs)
     logger.info(u'Engine integration loaded. Preparing to stop all containers.',
                 engine=engine.display_name)
+    if _orchestrate_natively(engine, 'stop', **kwargs):
+        logger.info(u'All services stopped.')
+        return
     playbook = engine.generate_orchestration_playbook(**kwargs)
     rc = run_playbook(playbook, engine, services, tags=['stop'], **kwargs)
     if rc:
@@ -979,12 +1177,16 @@ def conductorcmd_destroy(engine_name, project_name, services, **kwargs):
     logger.info(u'Engine integration loaded. Preparing to stop+delete all '
                 u'containers and built images.',
                 engine=engine.display_name)
+    if _orchestrate_natively(engine, 'destroy', **kwargs):
+        logger.info(u'All services destroyed.')
+        return
     playbook = engine.generate_orchestration_playbook(**kwargs)
     rc = run_playbook(playbook, engine, services, tags=['destroy'], **kwargs)
     if rc:
         raise AnsibleContainerException(
             'Error executing the destroy command. Not all containers and images may have been removed.'
         )
+    engine.remove_project_images()
     logger.info(u'All services destroyed.', playbook_rc=rc)
 
 @conductor_only
@@ -1018,15 +1220,25 @@ def conductorcmd_deploy(engine_name, project_name, services, **kwargs):
         logger.error(u'Failure writing deployment playbook', exc_info=True)
         raise
 
-    set_path_ownership(deployment_output_path, uid, gid)
+    touched = set_path_ownership(deployment_output_path, uid, gid)
+    logger.debug(u'Set ownership of deployment output', touched=touched, uid=uid, gid=gid)
 
 @conductor_only
 def conductorcmd_install(engine_name, project_name, services, **kwargs):
     roles = kwargs.pop('roles', None)
     logger.debug("Installing roles", roles=roles)
     if roles:
-        galaxy = AnsibleContainerGalaxy()
-        galaxy.install(roles)
+        galaxy = AnsibleContainerGalaxy(cache_path=kwargs.get('role_cache'),
+                                        archive_dirs=[kwargs['role_archives']] if kwargs.get('role_archives') else None,
+                                        offline=kwargs.get('offline', False))
+        try:
+            galaxy.install(roles)
+        finally:
+            if kwargs.get('role_cache') and os.path.isdir(kwargs['role_cache']):
+                # The cache is bind mounted from the host, and the Conductor runs as root
+                uid, gid = kwargs.get('host_user_uid', 1), kwargs.get('host_user_gid', 1)
+                touched = set_path_ownership(kwargs['role_cache'], uid, gid)
+                logger.debug(u'Set ownership of role cache', touched=touched, uid=uid, gid=gid)
 
 @conductor_only
 def conductorcmd_push(engine_name, project_name, services, **kwargs):
@@ -10,8 +10,10 @@ logger = getLogger(__name__)
 import base64
 import datetime
 import functools
+import hashlib
 import time
 import inspect
+import io
 import json
 import os
 import re
@@ -19,6 +21,8 @@ import shutil
 import sys
 import tarfile
 
+from multiprocessing.pool import ThreadPool
+
 from ruamel.yaml.comments import CommentedMap
 from six import reraise, iteritems, string_types, PY3
 
@@ -33,9 +37,13 @@ import container
 from container import host_only, conductor_only
 from container.engine import BaseEngine
 from container import utils, exceptions
-from container.utils import (logmux, text, ordereddict_to_list, roles_to_install, modules_to_install,
-                             ansible_config_exists, create_file)
+from container.utils import (logmux, text, encode_conductor_payload, ordereddict_to_list, roles_to_install,
+                             modules_to_install, ansible_config_exists, create_file, slim,
+                             CONDUCTOR_PAYLOAD_VERSION)
+from container.utils.events import EventLog
 from .secrets import DockerSecretsMixin
+from .orchestrator import (DockerOrchestrator, DEFAULT_WORKERS, DIGEST_LABEL_KEY, container_digest,
+                           labels_to_dict, repository_matches, removal_waves, format_bytes)
 
 try:
     import docker
@@ -64,6 +72,24 @@ FILES_PATH = os.path.normpath(
 
 DOCKER_VERSION = '17.04.0-ce'
 
+# Prebaked Conductor images built at the same time
+DEFAULT_PREBAKE_WORKERS = 4
+
+# Volumes holding pip's wheel cache and installed Galaxy roles across Conductor builds. They
+# are mounted while installing the project's requirements, so never end up in the image.
+PIP_CACHE_VOLUME = 'ansible_container_pip_cache'
+GALAXY_CACHE_VOLUME = 'ansible_container_galaxy_cache'
+GALAXY_CACHE_PATH = '/_ansible/cache/roles'
+
+# The project's files a Conductor image is built from
+CONDUCTOR_INPUT_FILES = ('ansible.cfg', 'ansible-requirements.txt', 'requirements.yml')
+
+# Conductor images are tagged here by a digest of their inputs, and shared between projects
+CONDUCTOR_SHARED_REPOSITORY = 'container-conductor'
+
+# Written into the Conductor container before it starts, rather than passed on its command line
+CONDUCTOR_PAYLOAD_PATH = '/_ansible/conductor-payload.json.z'
+
 DOCKER_DEFAULT_CONFIG_PATH = os.path.join(os.environ.get('HOME', ''), '.docker', 'config.json')
 
 DOCKER_CONFIG_FILEPATH_CASCADE = [
@@ -92,6 +118,83 @@ PREBAKED_DISTROS = {
     'alpine:3.4': []
 }
 
+# Keyword arguments accepted by docker-py when creating and running a container
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+CONTAINER_ARGS = frozenset(_getargspec(ContainerApiMixin.create_container)[0] + RUN_HOST_CONFIG_KWARGS)
+
+
+class ServiceIndex(object):
+    """
+    Lookups built once from the service definitions, so that resolving the image name,
+    container name or run arguments for a service doesn't rescan every service. The index
+    is never modified after it's built; lookups that hand back mutable values return copies.
+    """
+
+    def __init__(self, project_name, services):
+        self.project_name = project_name
+        self._image_names = {}
+        self._container_names = {}
+        self._run_kwargs = {}
+        self._run_kwargs_errors = {}
+        for name, service in iteritems(services or {}):
+            self._container_names[name] = u'%s_%s' % (project_name, name)
+            if service.get('containers'):
+                for c in service['containers']:
+                    container_service_name = u'%s-%s' % (name, c['container_name'])
+                    if c.get('roles'):
+                        image_name = u'%s-%s' % (project_name.lower(), container_service_name.lower())
+                    else:
+                        image_name = c.get('from')
+                    self._add_image_name(container_service_name, image_name)
+            else:
+                if service.get('roles'):
+                    image_name = u'%s-%s' % (project_name.lower(), name.lower())
+                else:
+                    image_name = service.get('from')
+                self._add_image_name(name, image_name)
+            try:
+                self._run_kwargs[name] = self._filter_run_kwargs(service)
+            except Exception as exc:
+                # Only fatal if the service is actually run
+                self._run_kwargs_errors[name] = exc
+
+    def _add_image_name(self, service_name, image_name):
+        # Where names collide, the first definition providing an image wins
+        if image_name and service_name not in self._image_names:
+            self._image_names[service_name] = image_name
+
+    @staticmethod
+    def _filter_run_kwargs(service):
+        to_return = service.copy()
+        # remove keys that docker-compose format doesn't accept, or that can't
+        #  be used during the build phase
+        remove_keys = list(set(to_return.keys()) - CONTAINER_ARGS) + ['links']
+        for key in list(remove_keys):
+            try:
+                to_return.pop(key)
+            except KeyError:
+                pass
+        if to_return.get('ports'):
+            # convert ports from a list to a dict that docker-py likes
+            new_ports = build_port_bindings(to_return.get('ports'))
+            to_return['ports'] = new_ports
+        return to_return
+
+    def image_name(self, service_name):
+        return self._image_names.get(service_name)
+
+    def container_name(self, service_name):
+        return self._container_names.get(service_name) or u'%s_%s' % (self.project_name, service_name)
+
+    def run_kwargs(self, service_name):
+        if service_name in self._run_kwargs_errors:
+            raise self._run_kwargs_errors[service_name]
+        to_return = self._run_kwargs[service_name].copy()
+        if to_return.get('ports'):
+            to_return['ports'] = dict(to_return['ports'])
+        return to_return
+
+
 def log_runs(fn):
     @functools.wraps(fn)
     def __wrapped__(self, *args, **kwargs):
@@ -138,6 +241,7 @@ class Engine(BaseEngine, DockerSecretsMixin):
     CAP_RUN = True
     CAP_VERSION = True
     CAP_SIM_SECRETS = True
+    CAP_NATIVE_ORCHESTRATION = True
 
     COMPOSE_WHITELIST = (
         'links', 'depends_on', 'cap_add', 'cap_drop', 'command', 'devices',
@@ -157,8 +261,18 @@ class Engine(BaseEngine, DockerSecretsMixin):
 
     FINGERPRINT_LABEL_KEY = 'com.ansible.container.fingerprint'
     ROLE_LABEL_KEY = 'com.ansible.container.role'
+    CHECKPOINT_LABEL_KEY = 'com.ansible.container.checkpoint'
+    CHECKPOINT_TASK_LABEL_KEY = 'com.ansible.container.checkpoint.task'
+    CHECKPOINT_INDEX_LABEL_KEY = 'com.ansible.container.checkpoint.index'
+    CONDUCTOR_REQUIREMENTS_LABEL_KEY = 'com.ansible.container.conductor.requirements'
+    CONDUCTOR_PAYLOAD_LABEL_KEY = 'com.ansible.container.conductor.payload'
     LAYER_COMMENT = 'Built with Ansible Container (https://github.com/ansible/ansible-container)'
 
+    def __init__(self, project_name, services, debug=False, selinux=True, devel=False, **kwargs):
+        super(Engine, self).__init__(project_name, services, debug=debug, selinux=selinux, devel=devel,
+                                     **kwargs)
+        self.service_index = ServiceIndex(self.project_name, self.services)
+
     @property
     def client(self):
         if not self._client:
@@ -206,30 +320,12 @@ class Engine(BaseEngine, DockerSecretsMixin):
         return os.path.join(os.sep, 'docker', 'secrets')
 
     def container_name_for_service(self, service_name):
-        return u'%s_%s' % (self.project_name, service_name)
+        return self.service_index.container_name(service_name)
 
     def image_name_for_service(self, service_name):
         if service_name == 'conductor':
             return u'%s-%s' % (self.project_name.lower(), service_name.lower())
-        result = None
-        for name, service in iteritems(self.services):
-            if service.get('containers'):
-                for c in service['containers']:
-                    container_service_name = u"%s-%s" % (name, c['container_name'])
-                    if container_service_name == service_name:
-                        if c.get('roles'):
-                            result = u'%s-%s' % (self.project_name.lower(), container_service_name.lower())
-                        else:
-                            result = c.get('from')
-                        break
-            elif name == service_name:
-                if service.get('roles'):
-                    result = u'%s-%s' % (self.project_name.lower(), name.lower())
-                else:
-                    result = service.get('from')
-            if result:
-                break
-
+        result = self.service_index.image_name(service_name)
         if result is None:
             raise exceptions.AnsibleContainerConfigException(
                 u"Failed to resolve image for service {}. The service or container definition "
@@ -238,22 +334,7 @@ class Engine(BaseEngine, DockerSecretsMixin):
         return result
 
     def run_kwargs_for_service(self, service_name):
-        to_return = self.services[service_name].copy()
-        # remove keys that docker-compose format doesn't accept, or that can't
-        #  be used during the build phase
-        container_args = inspect.getargspec(ContainerApiMixin.create_container)[0] + RUN_HOST_CONFIG_KWARGS
-        remove_keys = list(set(to_return.keys()) - set(container_args)) + ['links']
-        logger.debug("Removing keys", keys=remove_keys)
-        for key in list(remove_keys):
-            try:
-                to_return.pop(key)
-            except KeyError:
-                pass
-        if to_return.get('ports'):
-            # convert ports from a list to a dict that docker-py likes
-            new_ports = build_port_bindings(to_return.get('ports'))
-            to_return['ports'] = new_ports
-        return to_return
+        return self.service_index.run_kwargs(service_name)
 
     @host_only
     def print_version_info(self):
@@ -357,6 +438,14 @@ class Engine(BaseEngine, DockerSecretsMixin):
                 os.mkdir(deployment_path, 0o755)
             volumes[deployment_path] = {'bind': deployment_path, 'mode': 'rw'}
 
+        if command == 'install':
+            if params.get('role_cache'):
+                if not os.path.isdir(params['role_cache']):
+                    os.makedirs(params['role_cache'], 0o755)
+                volumes[params['role_cache']] = {'bind': params['role_cache'], 'mode': 'rw'}
+            if params.get('role_archives'):
+                volumes[params['role_archives']] = {'bind': params['role_archives'], 'mode': 'ro'}
+
         roles_path = None
         if params.get('roles_path'):
             roles_path = params['roles_path']
@@ -418,19 +507,14 @@ class Engine(BaseEngine, DockerSecretsMixin):
         if not engine_name:
             engine_name = __name__.rsplit('.', 2)[-2]
 
-        serialized_params = base64.b64encode(json.dumps(params).encode("utf-8")).decode()
-        serialized_config = base64.b64encode(json.dumps(ordereddict_to_list(config)).encode("utf-8")).decode()
+        input_args, payload = self._conductor_input(image_id, config, params)
 
         run_kwargs = dict(
             name=self.container_name_for_service('conductor'),
             command=['conductor',
                      command,
                      '--project-name', self.project_name,
-                     '--engine', engine_name,
-                     '--params', serialized_params,
-                     '--config', serialized_config,
-                     '--encoding', 'b64json'],
-            detach=True,
+                     '--engine', engine_name] + input_args,
             user='root',
             volumes=volumes,
             environment=environ,
@@ -446,9 +530,10 @@ class Engine(BaseEngine, DockerSecretsMixin):
         if params.get('volume_driver'):
             run_kwargs['volume_driver'] = params['volume_driver']
 
-        logger.debug('Docker run:', image=image_id, params=run_kwargs)
+        logger.debug('Docker run:', image=image_id, params=run_kwargs,
+                     payload_size=len(payload) if payload else None)
         try:
-            container_obj = self.client.containers.run(
+            container_obj = self.client.containers.create(
                 image_id,
                 **run_kwargs
             )
@@ -459,11 +544,54 @@ class Engine(BaseEngine, DockerSecretsMixin):
                     u"this project already exists or wasn't cleaned up.")
             reraise(*sys.exc_info())
         else:
+            if payload:
+                # Copying the payload in works with remote daemons, where a host path can't be
+                # mounted, and keeps it out of the container's command line and `docker inspect`
+                container_obj.put_archive(os.path.dirname(CONDUCTOR_PAYLOAD_PATH),
+                                          self._payload_archive(payload))
+            container_obj.start()
             log_iter = container_obj.logs(stdout=True, stderr=True, stream=True)
             mux = logmux.LogMultiplexer()
-            mux.add_iterator(log_iter, plainLogger)
+            if params.get('event_log'):
+                mux.add_iterator(log_iter, EventLog(params['event_log'], plainLogger))
+            else:
+                mux.add_iterator(log_iter, plainLogger)
             return container_obj.id
 
+    def _conductor_input(self, image_id, config, params):
+        """
+        Return the command line arguments that hand the config and params to the Conductor,
+        and the payload to copy into it, if the Conductor image reads one.
+        """
+        payload_version = (self.get_image_labels(image_id) or {}).get(self.CONDUCTOR_PAYLOAD_LABEL_KEY)
+        if payload_version is None:
+            # Built by an earlier version of Ansible Container, which only reads --config and --params
+            logger.warning(u'The Conductor image predates payload files, so the config is passed on its '
+                           u'command line. Run `ansible-container build` to rebuild it.', image=image_id)
+            serialized_params = base64.b64encode(json.dumps(params).encode("utf-8")).decode()
+            serialized_config = base64.b64encode(
+                json.dumps(ordereddict_to_list(config)).encode("utf-8")).decode()
+            return ['--params', serialized_params,
+                    '--config', serialized_config,
+                    '--encoding', 'b64json'], None
+        if payload_version != str(CONDUCTOR_PAYLOAD_VERSION):
+            raise exceptions.AnsibleContainerConductorException(
+                u'The Conductor image reads payload version {}, but this version of Ansible Container '
+                u'writes version {}. Run `ansible-container build` to rebuild it.'.format(
+                    payload_version, CONDUCTOR_PAYLOAD_VERSION))
+        return ['--payload', CONDUCTOR_PAYLOAD_PATH], encode_conductor_payload(config, params)
+
+    @staticmethod
+    def _payload_archive(payload):
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w') as tar:
+            member = tarfile.TarInfo(os.path.basename(CONDUCTOR_PAYLOAD_PATH))
+            member.size = len(payload)
+            member.mode = 0o400
+            member.mtime = time.time()
+            tar.addfile(member, io.BytesIO(payload))
+        return tarball.getvalue()
+
     def await_conductor_command(self, command, config, base_path, params, save_container=False):
         conductor_id = self.run_conductor(command, config, base_path, params)
         try:
@@ -728,9 +856,17 @@ class Engine(BaseEngine, DockerSecretsMixin):
             else:
                 continue
             image_changes.append(u'VOLUME %s' % (mount_point,))
+        for low, high, protocol in utils.parse_port_ranges(metadata.pop('ports', [])):
+            # The daemon expands ranges itself, so they needn't be sent a port at a time
+            image_changes.append(u'EXPOSE %s/%s' % (low if low == high else u'%d-%d' % (low, high), protocol))
         image_config = utils.metadata_to_image_config(metadata)
         image_config.setdefault('Labels', {})[self.FINGERPRINT_LABEL_KEY] = fingerprint
         image_config['Labels'][self.ROLE_LABEL_KEY] = role_name
+        # A layer resumed from a checkpoint would otherwise inherit its labels, and be
+        # found, and removed, as a checkpoint itself
+        image_config['Labels'].update(self._cleared_labels(self.CHECKPOINT_LABEL_KEY,
+                                                           self.CHECKPOINT_TASK_LABEL_KEY,
+                                                           self.CHECKPOINT_INDEX_LABEL_KEY))
         commit_data = dict(
             repository=image_name if with_name else None,
             tag=image_version if with_name else None,
@@ -745,6 +881,102 @@ class Engine(BaseEngine, DockerSecretsMixin):
         image_obj = self.client.images.get(image_id)
         image_obj.tag(self.image_name_for_service(service_name), 'latest')
 
+    @log_runs
+    @conductor_only
+    def commit_checkpoint(self, container_id, fingerprint, start_at_task, index):
+        to_commit = self.client.containers.get(container_id)
+        # Nor should a checkpoint be mistaken for the finished layer it was built on
+        labels = self._cleared_labels(self.FINGERPRINT_LABEL_KEY, self.ROLE_LABEL_KEY)
+        labels.update({
+            self.CHECKPOINT_LABEL_KEY: fingerprint,
+            self.CHECKPOINT_TASK_LABEL_KEY: start_at_task,
+            self.CHECKPOINT_INDEX_LABEL_KEY: str(index)
+        })
+        commit_data = dict(
+            message=self.LAYER_COMMENT,
+            conf={'Labels': labels}
+        )
+        logger.debug('Committing checkpoint', params=commit_data)
+        return to_commit.commit(**commit_data).id
+
+    @staticmethod
+    def _cleared_labels(*keys):
+        # Labels are inherited from the image a container was run from, and can only be
+        # overridden on commit, not dropped
+        return dict((key, '') for key in keys)
+
+    def _get_checkpoint_images(self, fingerprint):
+        images = self.client.images.list(
+            all=True,
+            filters=dict(label='%s=%s' % (self.CHECKPOINT_LABEL_KEY, fingerprint)))
+        return sorted(images, key=lambda i: int(i.labels.get(self.CHECKPOINT_INDEX_LABEL_KEY, 0)))
+
+    def get_latest_checkpoint(self, fingerprint):
+        images = self._get_checkpoint_images(fingerprint)
+        if not images:
+            return None
+        latest = images[-1]
+        return (latest.id,
+                latest.labels[self.CHECKPOINT_TASK_LABEL_KEY],
+                int(latest.labels.get(self.CHECKPOINT_INDEX_LABEL_KEY, 0)))
+
+    def remove_checkpoints(self, fingerprint, keep=None):
+        # Newest first, as each checkpoint is a child of the one before it. Checkpoints the
+        # committed layer was built on can't be removed, but they share its layers anyway.
+        for image in reversed(self._get_checkpoint_images(fingerprint)):
+            if image.id == keep:
+                continue
+            try:
+                self.client.images.remove(image.id, force=True)
+            except docker_errors.APIError as exc:
+                logger.debug(u'Keeping checkpoint image', image=image.short_id, reason=str(exc))
+
+    def _exec_in_container(self, container_id, command):
+        container_obj = self.client.containers.get(container_id)
+        result = container_obj.exec_run(['sh', '-c', command], user='root')
+        # docker-py >= 3.0 returns an ExecResult tuple, earlier versions just the output
+        return text.to_text(getattr(result, 'output', result) or b'')
+
+    @conductor_only
+    def get_container_os_release(self, container_id):
+        os_release = {}
+        try:
+            output = self._exec_in_container(container_id, 'cat /etc/os-release 2>/dev/null')
+        except docker_errors.APIError as exc:
+            logger.debug(u'Unable to read /etc/os-release', container=container_id, error=str(exc))
+            return os_release
+        for line in output.splitlines():
+            if '=' in line:
+                key, value = line.split('=', 1)
+                os_release[key.strip()] = value.strip().strip('"\'')
+        return os_release
+
+    @conductor_only
+    def slim_container(self, container_id, paths):
+        if not paths:
+            return 0
+        container_data = self.inspect_container(container_id) or {}
+        mount_points = [m['Destination'] for m in container_data.get('Mounts', [])]
+        paths = slim.filter_mounted_paths(paths, mount_points)
+        if not paths:
+            return 0
+        globs = u' '.join(paths)
+        # Measure what's about to go, then remove it. Globs are expanded by the shell, and
+        # anything that doesn't match is silently skipped.
+        command = u'du -sk -- {0} 2>/dev/null; rm -rf -- {0} 2>/dev/null; true'.format(globs)
+        logger.debug(u'Slimming build container', container=container_id, command=command)
+        try:
+            output = self._exec_in_container(container_id, command)
+        except docker_errors.APIError as exc:
+            logger.warning(u'Unable to slim build container: %s', str(exc), container=container_id)
+            return 0
+        removed_kb = 0
+        for line in output.splitlines():
+            size = line.split(None, 1)[0] if line.strip() else ''
+            if size.isdigit():
+                removed_kb += int(size)
+        return removed_kb * 1024
+
     @conductor_only
     def _get_top_level_secrets(self):
         """
@@ -763,22 +995,26 @@ class Engine(BaseEngine, DockerSecretsMixin):
         return top_level_secrets
 
     @conductor_only
-    def generate_orchestration_playbook(self, url=None, namespace=None, vault_files=None, **kwargs):
+    def generate_orchestration_playbook(self, url=None, namespace=None, vault_files=None, secrets_written=False,
+                                        **kwargs):
         """
         Generate an Ansible playbook to orchestrate services.
         :param url: registry URL where images will be pulled from
         :param namespace: registry namespace
+        :param secrets_written: the secrets volume is already up to date, so leave out the secrets play
         :return: playbook dict
         """
         states = ['start', 'restart', 'stop', 'destroy']
         service_def = {}
         for service_name, service in iteritems(self.services):
             service_definition = {}
+            image_id = None
             if service.get('roles'):
                 if url and namespace:
                     # Reference previously pushed image
                     service_definition[u'image'] = '{}/{}/{}'.format(re.sub(r'/$', '', url), namespace,
                                                                      self.image_name_for_service(service_name))
+                    image_id = self.get_latest_image_id_for_service(service_name)
                 else:
                     # Check that the image was built
                     image = self.get_latest_image_for_service(service_name)
@@ -788,11 +1024,13 @@ class Engine(BaseEngine, DockerSecretsMixin):
                             u"build`".format(service_name)
                         )
                     service_definition[u'image'] = image.tags[0]
+                    image_id = image.id
             else:
                 try:
                     # Check if the image is already local
                     image = self.client.images.get(service['from'])
                     image_from = image.tags[0]
+                    image_id = image.id
                 except docker.errors.ImageNotFound:
                     image_from = service['from']
                     logger.warning(u"Image {} for service {} not found. "
@@ -803,6 +1041,13 @@ class Engine(BaseEngine, DockerSecretsMixin):
                 if extra in service:
                     service_definition[extra] = service[extra]
 
+            # The same digest native orchestration labels containers with. Compose recreates a
+            # container when its labels change, so only services whose image or definition
+            # changed are recreated, whichever way the project was started.
+            service_definition[u'labels'] = labels_to_dict(service.get('labels'))
+            service_definition[u'labels'][DIGEST_LABEL_KEY] = container_digest(
+                image_id or service_definition[u'image'], service)
+
             if 'secrets' in service:
                 service_secrets = []
                 for secret, secret_engines in iteritems(service[u'secrets']):
@@ -856,7 +1101,7 @@ class Engine(BaseEngine, DockerSecretsMixin):
 
         playbook = []
 
-        if self.secrets and self.CAP_SIM_SECRETS:
+        if self.secrets and self.CAP_SIM_SECRETS and not secrets_written:
             playbook.append(self.generate_secrets_play(vault_files=vault_files))
 
         playbook.append(CommentedMap([
@@ -869,27 +1114,108 @@ class Engine(BaseEngine, DockerSecretsMixin):
             playbook[len(playbook) - 1][u'vars_files'] = [os.path.normpath(os.path.abspath(v)) for v in vault_files]
         playbook[len(playbook) - 1][u'tasks'] = tasks
 
-        for service in list(self.services.keys()) + ['conductor']:
-            image_name = self.image_name_for_service(service)
-            for image in self.client.images.list(name=image_name):
-                logger.debug('Found image for service', tags=image.tags, id=image.short_id)
-                for tag in image.tags:
-                    logger.debug('Adding task to destroy image', tag=tag)
-                    playbook[len(playbook) - 1][u'tasks'].append({
-                        u'docker_image': {
-                            u'name': tag,
-                            u'state': u'absent',
-                            u'force': u'yes'
-                        },
-                        u'tags': u'destroy'
-                    })
-
         if self.secrets and self.CAP_SIM_SECRETS:
             playbook.append(self.generate_remove_volume_play())
 
         logger.debug(u'Created playbook to run project', playbook=playbook)
         return playbook
 
+    @conductor_only
+    def orchestrate(self, desired_state, remove_orphans=False, **kwargs):
+        orchestrator = DockerOrchestrator(self, self.services)
+        start = time.time()
+        if desired_state == 'start':
+            timings = orchestrator.start(remove_orphans=remove_orphans)
+        elif desired_state in ('restart', 'stop', 'destroy'):
+            timings = getattr(orchestrator, desired_state)()
+        else:
+            raise exceptions.AnsibleContainerException(u'Unknown desired state {}'.format(desired_state))
+        logger.info(u'Orchestration finished in %.2fs', time.time() - start, state=desired_state,
+                    services=len(timings), slowest=sorted(timings.items(), key=lambda t: -t[1])[:5])
+        return timings
+
+    def _project_images(self):
+        """
+        Images tagged for any service or the conductor, found with a single query filtered by
+        repository. Returns a dict of image ID to (parent ID, size, tags to remove, whether other
+        tags remain).
+        """
+        image_names = [self.image_name_for_service(service_name)
+                       for service_name in list(self.services.keys()) + ['conductor']]
+        images = {}
+        for summary in self.client.api.images(filters={'reference': image_names}):
+            repo_tags = [tag for tag in summary.get('RepoTags') or [] if tag != '<none>:<none>']
+            tags = [tag for tag in repo_tags if any(repository_matches(tag, name) for name in image_names)]
+            if tags:
+                images[summary['Id']] = (summary.get('ParentId'), summary.get('Size', 0), tags,
+                                         len(tags) < len(repo_tags))
+        return images
+
+    def _layers_size(self):
+        try:
+            return self.client.df().get('LayersSize')
+        except docker_errors.APIError:
+            return None
+
+    @conductor_only
+    def remove_project_images(self, workers=None, **kwargs):
+        """
+        Remove every tag of the project's services and conductor, as `docker rmi <tag>` would.
+        An image left without tags is then removed, unless a container still uses it, such as
+        the running Conductor. Children are removed before their parents, and up to `workers`
+        images are removed at a time.
+
+        :return: tuple of the number of images removed and the bytes reclaimed, or None if unknown
+        """
+        images = self._project_images()
+        if not images:
+            logger.info(u'No project images to remove')
+            return 0, 0
+        layers_size = self._layers_size()
+
+        def remove(image_id):
+            parent_id, size, tags, shared = images[image_id]
+            try:
+                # Forcing the removal of a tag only untags an image that a running container uses
+                for tag in tags:
+                    self.client.api.remove_image(tag, force=True)
+            except docker_errors.NotFound:
+                pass
+            except docker_errors.APIError as exc:
+                logger.warning(u'Unable to remove image', image=image_id, tags=tags, error=str(exc))
+                return 0
+            if shared:
+                # Left to its other tags
+                return 0
+            try:
+                self.client.api.remove_image(image_id)
+            except docker_errors.NotFound:
+                # Removed along with its last tag
+                pass
+            except docker_errors.APIError as exc:
+                logger.debug(u'Keeping untagged image in use', image=image_id, error=str(exc))
+                return 0
+            return 1
+
+        removed = 0
+        pool = ThreadPool(min(workers or DEFAULT_WORKERS, len(images)))
+        try:
+            for wave in removal_waves(dict((image_id, image[0]) for image_id, image in iteritems(images))):
+                removed += sum(pool.map(remove, wave))
+        finally:
+            pool.close()
+            pool.join()
+
+        reclaimed = None
+        if layers_size is not None:
+            after = self._layers_size()
+            if after is not None:
+                reclaimed = max(layers_size - after, 0)
+        logger.info(u'Removed %d image(s), reclaimed %s', removed,
+                    format_bytes(reclaimed) if reclaimed is not None else u'an unknown amount of space',
+                    images=removed, reclaimed_bytes=reclaimed)
+        return removed, reclaimed
+
     @conductor_only
     def push(self, image_id, service_name, tag=None, namespace=None, url=None, username=None, password=None,
              repository_prefix=None, **kwargs):
@@ -945,11 +1271,15 @@ class Engine(BaseEngine, DockerSecretsMixin):
                                    'conductor-src-dockerfile.j2', temp_dir,
                                    'Dockerfile',
                                    conductor_base=base_image,
-                                   docker_version=DOCKER_VERSION)
+                                   docker_version=DOCKER_VERSION,
+                                   payload_version=CONDUCTOR_PAYLOAD_VERSION)
 
         tarball.add(os.path.join(temp_dir, 'Dockerfile'),
                     arcname='Dockerfile')
+        Engine._add_prebake_docs(temp_dir, tarball)
 
+    @staticmethod
+    def _add_prebake_docs(temp_dir, tarball):
         utils.jinja_render_to_temp(TEMPLATES_PATH,
                                    'atomic-help.j2', temp_dir,
                                    'help.1',
@@ -963,6 +1293,23 @@ class Engine(BaseEngine, DockerSecretsMixin):
         tarball.add(os.path.join(temp_dir, 'LICENSE'),
                     arcname='LICENSE')
 
+    @staticmethod
+    def _add_conductor_source(base_path, temp_dir, tarball):
+        """ Add the project's build files and the Ansible Container source to a Conductor build context """
+        source_dir = os.path.normpath(base_path)
+
+        for filename in CONDUCTOR_INPUT_FILES:
+            file_path = os.path.join(source_dir, filename)
+            if os.path.exists(file_path):
+                tarball.add(file_path,
+                            arcname=os.path.join('build-src', filename))
+        # Make an empty file just to make sure the build-src dir has something
+        open(os.path.join(temp_dir, '.touch'), 'w')
+        tarball.add(os.path.join(temp_dir, '.touch'), arcname='build-src/.touch')
+
+        tarball.add(os.path.join(FILES_PATH, 'get-pip.py'),
+                    arcname='contrib/get-pip.py')
+
         container_dir = os.path.dirname(container.__file__)
         tarball.add(container_dir, arcname='container-src')
         package_dir = os.path.dirname(container_dir)
@@ -974,35 +1321,54 @@ class Engine(BaseEngine, DockerSecretsMixin):
                         if os.path.exists(os.path.join(package_dir, 'setup.py'))
                         else FILES_PATH)
         req_txt_dir = (package_dir
-                       if os.path.exists(
-            os.path.join(package_dir, 'conductor-requirements.txt'))
+                       if os.path.exists(os.path.join(package_dir, 'conductor-requirements.txt'))
                        else FILES_PATH)
         req_yml_dir = (package_dir
-                       if os.path.exists(
-            os.path.join(package_dir, 'conductor-requirements.yml'))
+                       if os.path.exists(os.path.join(package_dir, 'conductor-requirements.yml'))
                        else FILES_PATH)
         tarball.add(os.path.join(setup_py_dir, 'setup.py'),
                     arcname='container-src/conductor-build/setup.py')
         tarball.add(os.path.join(req_txt_dir, 'conductor-requirements.txt'),
-                    arcname='container-src/conductor-build/conductor'
-                            '-requirements.txt')
+                    arcname='container-src/conductor-build/conductor-requirements.txt')
         tarball.add(os.path.join(req_yml_dir, 'conductor-requirements.yml'),
                     arcname='container-src/conductor-build/conductor-requirements.yml')
 
-    def _prepare_conductor_manifest(self, base_path, base_image, temp_dir, tarball):
-        source_dir = os.path.normpath(base_path)
+    def _stream_build(self, fileobj, tag, cache=True, dockerfile=None, prefix=None):
+        """ Run a Docker build, logging its output at debug level and raising on the first error """
+        for line in self.client.api.build(fileobj=fileobj,
+                                          custom_context=True,
+                                          tag=tag,
+                                          rm=True,
+                                          decode=True,
+                                          nocache=not cache,
+                                          dockerfile=dockerfile):
+            try:
+                if line.get('status') == 'Downloading':
+                    # skip over lines that give spammy byte-by-byte
+                    # progress of downloads
+                    continue
+                elif 'errorDetail' in line:
+                    raise exceptions.AnsibleContainerException(
+                        "Error building conductor image: {0}".format(line['errorDetail']['message']))
+            except ValueError:
+                pass
+            except exceptions.AnsibleContainerException:
+                raise
 
-        for filename in ['ansible.cfg', 'ansible-requirements.txt',
-                         'requirements.yml']:
-            file_path = os.path.join(source_dir, filename)
-            if os.path.exists(filename):
-                tarball.add(file_path,
-                            arcname=os.path.join('build-src', filename))
-        # Make an empty file just to make sure the build-src dir has something
-        open(os.path.join(temp_dir, '.touch'), 'w')
-        tarball.add(os.path.join(temp_dir, '.touch'),
-                    arcname='build-src/.touch')
+            # this bypasses the fancy colorized logger for things that
+            # are just STDOUT of a process
+            output = text.to_text(line.get('stream', json.dumps(line))).rstrip()
+            plainLogger.debug(u'%s | %s' % (prefix, output) if prefix else output)
 
+    @staticmethod
+    def _conductor_volumes(distro):
+        volumes = ['/usr']
+        if distro in ('ubuntu', 'debian', 'alpine'):
+            volumes.append('/lib')
+        return volumes
+
+    def _local_conductor_base(self, base_image):
+        """ The distro and the prebaked Conductor image a project's Conductor image is built from """
         prebaked = base_image in reduce(lambda x, y: x + [y[0]] + y[1],
                                         PREBAKED_DISTROS.items(), [])
         if prebaked:
@@ -1019,82 +1385,197 @@ class Engine(BaseEngine, DockerSecretsMixin):
                 base_image.replace(':', '-'),
                 container.__version__
             )
+        return base_image, conductor_base
+
+    def shared_conductor_tag(self, base_path, base_image, build_cache=True):
+        """
+        Tag of the Conductor image shared by every project built from the same inputs: the
+        prebaked Conductor image, the project's ansible.cfg, ansible-requirements.txt and
+        requirements.yml, and the Dockerfile template. Project tags are aliases of it.
+
+        The prebaked Conductor image is pulled first if it isn't present, so the tag names the
+        image the build will use. Returns None if it can't be pulled.
+        """
+        base_image, conductor_base = self._local_conductor_base(base_image)
+        conductor_base_id = self.get_image_id_by_tag(conductor_base)
+        if not conductor_base_id:
+            logger.info('Pulling prebaked Conductor image', image=conductor_base)
+            try:
+                conductor_base_id = self.client.images.pull(*conductor_base.rsplit(':', 1)).id
+            except (docker_errors.APIError, docker_errors.ImageNotFound) as exc:
+                logger.warning('Unable to pull prebaked Conductor image', image=conductor_base,
+                               error=str(exc))
+                return None
+        digest = hashlib.sha256()
+        for part in (container.__version__, DOCKER_VERSION, conductor_base,
+                     conductor_base_id, str(bool(build_cache))):
+            digest.update(u'{}\n'.format(part).encode('utf-8'))
+        for path in [os.path.join(base_path, filename)
+                     for filename in CONDUCTOR_INPUT_FILES] + [os.path.join(TEMPLATES_PATH,
+                                                                           'conductor-local-dockerfile.j2')]:
+            digest.update(u'{}\n'.format(os.path.basename(path)).encode('utf-8'))
+            if os.path.exists(path):
+                with open(path, 'rb') as ifs:
+                    digest.update(hashlib.sha256(ifs.read()).digest())
+        return '%s:%s' % (CONDUCTOR_SHARED_REPOSITORY, digest.hexdigest()[:24])
+
+    def _prepare_conductor_manifest(self, base_path, base_image, temp_dir, tarball, build_cache=False,
+                                    cache=True):
+        """
+        Add the Dockerfile for the project's Conductor image to the build context. With
+        build_cache, the project's requirements are left out of the Dockerfile, and the
+        commands to install them, using the cache volumes, are returned instead.
+        """
+        source_dir = os.path.normpath(base_path)
+
+        for filename in ['ansible.cfg', 'ansible-requirements.txt',
+                         'requirements.yml']:
+            file_path = os.path.join(source_dir, filename)
+            if os.path.exists(filename):
+                tarball.add(file_path,
+                            arcname=os.path.join('build-src', filename))
+        # Make an empty file just to make sure the build-src dir has something
+        open(os.path.join(temp_dir, '.touch'), 'w')
+        tarball.add(os.path.join(temp_dir, '.touch'),
+                    arcname='build-src/.touch')
+
+        base_image, conductor_base = self._local_conductor_base(base_image)
 
         run_commands = []
         if modules_to_install(base_path):
-            run_commands.append('pip install --no-cache-dir -r /_ansible/build/ansible-requirements.txt')
+            if build_cache:
+                run_commands.append('pip install -r /_ansible/build/ansible-requirements.txt')
+            else:
+                run_commands.append('pip install --no-cache-dir -r /_ansible/build/ansible-requirements.txt')
         if roles_to_install(base_path):
-            run_commands.append('ansible-galaxy install -p /etc/ansible/roles -r /_ansible/build/requirements.yml')
+            # The roles cache is keyed by requirements.yml alone, so without cache, roles that
+            # aren't pinned to a version are installed afresh
+            if build_cache and cache:
+                # Roles are installed once per distinct requirements.yml, then copied into place.
+                # The cache volume is shared by every build on the host, so each install goes to
+                # a directory of its own, named for its container, and is renamed into place in
+                # one step. When another build got there first, its copy is used instead.
+                with open(os.path.join(source_dir, 'requirements.yml'), 'rb') as ifs:
+                    roles_cache = '%s/%s' % (GALAXY_CACHE_PATH, hashlib.sha256(ifs.read()).hexdigest())
+                run_commands.append(
+                    '(test -d {cache} || (partial={cache}.partial.${{HOSTNAME:-$$}} && rm -rf $partial && '
+                    '(ansible-galaxy install -p $partial -r /_ansible/build/requirements.yml || '
+                    '(rm -rf $partial && false)) && '
+                    '(python -c "import os, sys; os.rename(sys.argv[1], sys.argv[2])" $partial {cache} '
+                    '2>/dev/null || rm -rf $partial))) && '
+                    'cp -a {cache}/. /etc/ansible/roles/'.format(cache=roles_cache))
+            else:
+                run_commands.append('ansible-galaxy install -p /etc/ansible/roles -r /_ansible/build/requirements.yml')
         if ansible_config_exists(base_path):
             run_commands.append('cp /_ansible/build/ansible.cfg /etc/ansible/ansible.cfg')
         separator = ' && \\\r\n'
-        install_requirements = separator.join(run_commands)
+        install_requirements = separator.join(run_commands) if not build_cache else ''
+        # Volumes are declared when the requirements are committed, so they aren't masked
+        volumes = self._conductor_volumes(base_image.split(':')[0])
 
         utils.jinja_render_to_temp(TEMPLATES_PATH,
                                    'conductor-local-dockerfile.j2', temp_dir,
                                    'Dockerfile',
                                    install_requirements=install_requirements,
-                                   original_base=base_image,
+                                   volumes=[] if build_cache and run_commands else volumes,
                                    conductor_base=conductor_base,
                                    docker_version=DOCKER_VERSION)
         tarball.add(os.path.join(temp_dir, 'Dockerfile'),
                     arcname='Dockerfile')
+        return run_commands if build_cache else [], volumes
+
+    def _install_conductor_requirements(self, image_id, commands, volumes, tag, cache=True):
+        """
+        Install the project's requirements on top of a Conductor image in a container with the
+        pip and Galaxy cache volumes mounted, and commit the result as the Conductor image. The
+        commit is reused while the image and commands are unchanged, as Docker's layer cache would.
+        """
+        script = ' && '.join(commands)
+        digest = hashlib.sha256(u'{}\n{}'.format(image_id, script).encode('utf-8')).hexdigest()
+        if cache:
+            for image in self.client.images.list(
+                    filters=dict(label='%s=%s' % (self.CONDUCTOR_REQUIREMENTS_LABEL_KEY, digest))):
+                logger.info('Conductor requirements are unchanged. Using cached image.', image=image.short_id)
+                image.tag(tag)
+                return image.id
+
+        image = self.client.images.get(image_id)
+        logger.info('Installing project requirements into the Conductor image...')
+        to_commit = self.client.containers.run(
+            image_id,
+            command=['/bin/sh', '-c', script],
+            entrypoint=[],
+            volumes={PIP_CACHE_VOLUME: {'bind': '/root/.cache/pip', 'mode': 'rw'},
+                     GALAXY_CACHE_VOLUME: {'bind': GALAXY_CACHE_PATH, 'mode': 'rw'}},
+            detach=True)
+        try:
+            for line in to_commit.logs(stream=True, follow=True):
+                plainLogger.debug(text.to_text(line).rstrip())
+            status = to_commit.wait()
+            if isinstance(status, dict):
+                status = status.get('StatusCode')
+            if status:
+                raise exceptions.AnsibleContainerException(
+                    u'Installing requirements into the Conductor image failed with exit code {}:\n{}'.format(
+                        status, text.to_text(to_commit.logs(tail=20))))
+            config = image.attrs.get('Config') or {}
+            labels = dict(config.get('Labels') or {})
+            labels[self.CONDUCTOR_REQUIREMENTS_LABEL_KEY] = digest
+            repository, _, image_tag = tag.partition(':')
+            committed = to_commit.commit(
+                repository=repository,
+                tag=image_tag or None,
+                conf={'Labels': labels,
+                      'Cmd': config.get('Cmd'),
+                      'Entrypoint': config.get('Entrypoint')},
+                changes=u'\n'.join(u'VOLUME %s' % volume for volume in volumes))
+        finally:
+            to_commit.remove(force=True)
+        return committed.id
 
     @log_runs
     @host_only
-    def build_conductor_image(self, base_path, base_image, prebaking=False, cache=True, environment=None):
+    def build_conductor_image(self, base_path, base_image, prebaking=False, cache=True, environment=None,
+                              build_cache=True, slim=True):
+        """
+        Build the Conductor image, or a prebaked Conductor image for a distro. Unless build_cache
+        is False, the project's pip and Galaxy requirements are installed with caches kept in
+        Docker volumes, rather than downloaded afresh by the Dockerfile. Unless cache is False, a
+        Conductor image already built from the same inputs, by any project, is tagged for this
+        project instead of building another.
+
+        slim only applies when prebaking. Unless it is False, the prebaked image is built in two
+        stages, and ships without the build toolchain. A project's image is built on top of a
+        prebaked one, and has no stages of its own.
+        """
         if environment is None:
             environment = []
+        shared_tag = None
+        if not prebaking:
+            shared_tag = self.shared_conductor_tag(base_path, base_image, build_cache=build_cache)
+            shared_id = self.get_image_id_by_tag(shared_tag) if cache and shared_tag else None
+            if shared_id:
+                logger.info('Conductor inputs are unchanged. Using shared Conductor image.',
+                            image=shared_tag)
+                self.client.images.get(shared_id).tag(self.image_name_for_service('conductor'))
+                return shared_id
+        requirements_commands = []
         with utils.make_temp_dir() as temp_dir:
             logger.info('Building Docker Engine context...')
             tarball_path = os.path.join(temp_dir, 'context.tar')
             tarball_file = open(tarball_path, 'wb')
             tarball = tarfile.TarFile(fileobj=tarball_file,
                                       mode='w')
-            source_dir = os.path.normpath(base_path)
-
-            for filename in ['ansible.cfg', 'ansible-requirements.txt',
-                             'requirements.yml']:
-                file_path = os.path.join(source_dir, filename)
-                if os.path.exists(file_path):
-                    tarball.add(file_path,
-                                arcname=os.path.join('build-src', filename))
-            # Make an empty file just to make sure the build-src dir has something
-            open(os.path.join(temp_dir, '.touch'), 'w')
-            tarball.add(os.path.join(temp_dir, '.touch'), arcname='build-src/.touch')
-
-            tarball.add(os.path.join(FILES_PATH, 'get-pip.py'),
-                        arcname='contrib/get-pip.py')
-
-            container_dir = os.path.dirname(container.__file__)
-            tarball.add(container_dir, arcname='container-src')
-            package_dir = os.path.dirname(container_dir)
-
-            # For an editable install, the setup.py and requirements.* will be
-            # available in the package_dir. Otherwise, our custom sdist (see
-            # setup.py) would have moved them to FILES_PATH
-            setup_py_dir = (package_dir
-                            if os.path.exists(os.path.join(package_dir, 'setup.py'))
-                            else FILES_PATH)
-            req_txt_dir = (package_dir
-                           if os.path.exists(os.path.join(package_dir, 'conductor-requirements.txt'))
-                           else FILES_PATH)
-            req_yml_dir = (package_dir
-                           if os.path.exists(os.path.join(package_dir, 'conductor-requirements.yml'))
-                           else FILES_PATH)
-            tarball.add(os.path.join(setup_py_dir, 'setup.py'),
-                        arcname='container-src/conductor-build/setup.py')
-            tarball.add(os.path.join(req_txt_dir, 'conductor-requirements.txt'),
-                            arcname='container-src/conductor-build/conductor-requirements.txt')
-            tarball.add(os.path.join(req_yml_dir, 'conductor-requirements.yml'),
-                        arcname='container-src/conductor-build/conductor-requirements.yml')
+            self._add_conductor_source(base_path, temp_dir, tarball)
 
             utils.jinja_render_to_temp(TEMPLATES_PATH,
                                        'conductor-src-dockerfile.j2', temp_dir,
                                        'Dockerfile',
                                        conductor_base=base_image,
                                        docker_version=DOCKER_VERSION,
-                                       environment=environment)
+                                       environment=environment,
+                                       payload_version=CONDUCTOR_PAYLOAD_VERSION,
+                                       slim=slim and prebaking)
             tarball.add(os.path.join(temp_dir, 'Dockerfile'),
                         arcname='Dockerfile')
 
@@ -1107,11 +1588,10 @@ class Engine(BaseEngine, DockerSecretsMixin):
                 self.client.images.pull(*base_image.split(':', 1))
                 self._prepare_prebake_manifest(base_path, base_image, temp_dir,
                                                tarball)
-                tag = 'container-conductor-%s:%s' % (base_image.replace(':', '-'),
-                                                     container.__version__)
+                tag = self.prebaked_conductor_tag(base_image)
             else:
-                self._prepare_conductor_manifest(base_path, base_image, temp_dir,
-                                                 tarball)
+                requirements_commands, volumes = self._prepare_conductor_manifest(
+                    base_path, base_image, temp_dir, tarball, build_cache=build_cache, cache=cache)
                 tag = self.image_name_for_service('conductor')
             logger.debug('Context manifest:')
             for tarinfo_obj in tarball.getmembers():
@@ -1124,36 +1604,97 @@ class Engine(BaseEngine, DockerSecretsMixin):
             logger.info('Starting Docker build of Ansible Container Conductor image (please be patient)...')
             # FIXME: Error out properly if build of conductor fails.
             if self.debug:
-                for line in self.client.api.build(fileobj=tarball_file,
-                                                  custom_context=True,
-                                                  tag=tag,
-                                                  rm=True,
-                                                  decode=True,
-                                                  nocache=not cache):
-                    try:
-                        if line.get('status') == 'Downloading':
-                            # skip over lines that give spammy byte-by-byte
-                            # progress of downloads
-                            continue
-                        elif 'errorDetail' in line:
-                            raise exceptions.AnsibleContainerException(
-                                "Error building conductor image: {0}".format(line['errorDetail']['message']))
-                    except ValueError:
-                        pass
-                    except exceptions.AnsibleContainerException:
-                        raise
-
-                    # this bypasses the fancy colorized logger for things that
-                    # are just STDOUT of a process
-                    plainLogger.debug(text.to_text(line.get('stream', json.dumps(line))).rstrip())
-                return self.get_image_id_by_tag(tag)
+                self._stream_build(tarball_file, tag, cache=cache)
+                image_id = self.get_image_id_by_tag(tag)
             else:
                 image = self.client.images.build(fileobj=tarball_file,
                                                  custom_context=True,
                                                  tag=tag,
                                                  rm=True,
                                                  nocache=not cache)
-                return image.id
+                image_id = image.id
+            if not prebaking and requirements_commands:
+                image_id = self._install_conductor_requirements(image_id, requirements_commands,
+                                                                volumes, tag, cache=cache)
+            if shared_tag:
+                self.client.images.get(image_id).tag(*shared_tag.split(':', 1))
+            return image_id
+
+    @staticmethod
+    def prebaked_conductor_tag(distro):
+        return 'container-conductor-%s:%s' % (distro.replace(':', '-'), container.__version__)
+
+    @host_only
+    def prebake_conductor_images(self, base_path, distros, cache=True, workers=None, ignore_errors=False,
+                                 slim=True):
+        """
+        Build the prebaked Conductor images for several distros at once. The build context is
+        rendered once, holding a Dockerfile for each distro, and shared by every build. Unless
+        slim is False, each image is built in two stages, keeping compilers, headers and pip
+        caches in the first, so only the virtualenv and the Python runtime are shipped.
+
+        :return: list of (distro, image ID, seconds, bytes) tuples, with None for the image ID
+            and size of a failed build
+        """
+        workers = min(workers or DEFAULT_PREBAKE_WORKERS, len(distros))
+        with utils.make_temp_dir() as temp_dir:
+            logger.info('Building Docker Engine context...')
+            tarball_path = os.path.join(temp_dir, 'context.tar')
+            with open(tarball_path, 'wb') as tarball_file:
+                tarball = tarfile.TarFile(fileobj=tarball_file, mode='w')
+                self._add_conductor_source(base_path, temp_dir, tarball)
+                self._add_prebake_docs(temp_dir, tarball)
+                for distro in distros:
+                    dockerfile = 'Dockerfile.%s' % distro.replace(':', '-')
+                    utils.jinja_render_to_temp(TEMPLATES_PATH,
+                                               'conductor-src-dockerfile.j2', temp_dir,
+                                               dockerfile,
+                                               conductor_base=distro,
+                                               docker_version=DOCKER_VERSION,
+                                               environment=[],
+                                               payload_version=CONDUCTOR_PAYLOAD_VERSION,
+                                               slim=slim)
+                    tarball.add(os.path.join(temp_dir, dockerfile), arcname=dockerfile)
+                tarball.close()
+
+            def bake(distro):
+                tag = self.prebaked_conductor_tag(distro)
+                start = time.time()
+                logger.info('Now prebaking Conductor image for %s', distro)
+                try:
+                    self.client.images.pull(*distro.split(':', 1))
+                    with open(tarball_path, 'rb') as context:
+                        self._stream_build(context, tag, cache=cache,
+                                           dockerfile='Dockerfile.%s' % distro.replace(':', '-'),
+                                           prefix=distro)
+                    image = self.client.images.get(tag)
+                except (docker_errors.APIError, exceptions.AnsibleContainerException) as exc:
+                    logger.error('Failure building prebaked image for %s: %s', distro, exc)
+                    return distro, None, time.time() - start, None
+                elapsed = time.time() - start
+                logger.info('Prebaked Conductor image for %s in %.1fs', distro, elapsed,
+                            image=image.short_id, bytes=image.attrs.get('Size'))
+                return distro, image.id, elapsed, image.attrs.get('Size')
+
+            logger.info('Starting Docker builds of prebaked Conductor images (please be patient)...',
+                        distros=len(distros), workers=workers)
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(bake, distros)
+            finally:
+                pool.close()
+                pool.join()
+
+        plainLogger.info(u'%-20s %-19s %10s %10s' % (u'Distro', u'Image', u'Time', u'Size'))
+        for distro, image_id, elapsed, size in results:
+            plainLogger.info(u'%-20s %-19s %9.1fs %10s' % (
+                distro, image_id[7:19] if image_id else u'FAILED', elapsed,
+                format_bytes(size) if size is not None else u'-'))
+        failed = [distro for distro, image_id, _, _ in results if image_id is None]
+        if failed and not ignore_errors:
+            raise exceptions.AnsibleContainerException(
+                u'Failed to prebake Conductor images for: {}'.format(u', '.join(failed)))
+        return results
 
     def get_runtime_volume_id(self, mount_point):
         try:
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from container.utils.visibility import getLogger
+logger = getLogger(__name__)
+
+import hashlib
+import json
+import re
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from container import exceptions, __version__ as container_version
+from six import iteritems, string_types, text_type
+
+try:
+    from docker import errors as docker_errors
+except ImportError:
+    raise ImportError(
+        u'You must install Ansible Container with Docker(tm) support. '
+        u'Try:\npip install ansible-container==%s[docker]' % container_version)
+
+PROJECT_LABEL_KEY = 'com.ansible.container.project'
+SERVICE_LABEL_KEY = 'com.ansible.container.service'
+# Digest of the image and the service definition a container was created from
+DIGEST_LABEL_KEY = 'com.ansible.container.digest'
+# Labels set by Compose, so that containers started by the orchestration playbook are found too
+COMPOSE_PROJECT_LABEL_KEY = 'com.docker.compose.project'
+COMPOSE_SERVICE_LABEL_KEY = 'com.docker.compose.service'
+# Also set here, as Compose only manages containers that carry them
+COMPOSE_ONEOFF_LABEL_KEY = 'com.docker.compose.oneoff'
+COMPOSE_NUMBER_LABEL_KEY = 'com.docker.compose.container-number'
+
+DEFAULT_WORKERS = 8
+
+
+def compose_project_name(project_name):
+    """ The project name as Compose normalizes it, when naming networks and volumes """
+    return re.sub(r'[^a-z0-9]', '', project_name.lower())
+
+
+def service_dependencies(service):
+    """ Names of the services a service depends on, through depends_on or links """
+    depends_on = service.get('depends_on') or []
+    dependencies = set(depends_on.keys() if isinstance(depends_on, dict) else depends_on)
+    for link in service.get('links') or []:
+        dependencies.add(link.split(':', 1)[0])
+    return dependencies
+
+
+def dependency_waves(services):
+    """
+    Group services into waves, where each service depends only on services in earlier waves.
+    Dependencies on services not in the mapping, such as those left out by a
+    `run <service>`, are ignored.
+
+    :param services: dict of service name to service definition
+    :return: list of lists of service names
+    """
+    remaining = {}
+    for name, service in iteritems(services):
+        dependencies = service_dependencies(service)
+        missing = dependencies - set(services)
+        if missing:
+            logger.debug(u'Ignoring dependencies on services not being orchestrated',
+                         service=name, dependencies=sorted(missing))
+        remaining[name] = dependencies - missing
+    waves = []
+    done = set()
+    while remaining:
+        wave = sorted(name for name, dependencies in iteritems(remaining) if dependencies <= done)
+        if not wave:
+            raise exceptions.AnsibleContainerConfigException(
+                u'Circular dependency between services: {}'.format(u', '.join(sorted(remaining))))
+        waves.append(wave)
+        done.update(wave)
+        for name in wave:
+            remaining.pop(name)
+    return waves
+
+
+def container_digest(image_id, service):
+    """
+    Digest of everything a service's container is created from: the image, and the complete
+    service definition, including what isn't a create option, such as links and network_mode.
+    Both native orchestration and the orchestration playbook label containers with it.
+    """
+    payload = json.dumps({'image': image_id, 'service': service}, sort_keys=True, default=text_type)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def labels_to_dict(labels):
+    """ Compose labels, given as a mapping or a list of key=value strings, as a new dict """
+    if not isinstance(labels, dict):
+        return dict(label.split('=', 1) if '=' in label else (label, '') for label in labels or [])
+    return dict(labels)
+
+
+def repository_matches(repo_tag, image_name):
+    """ Whether a repo:tag belongs to an image name given with or without a tag """
+    if repo_tag == image_name:
+        return True
+    repository, sep, tag = repo_tag.rpartition(':')
+    return bool(sep) and '/' not in tag and repository == image_name
+
+
+def removal_waves(parents):
+    """
+    Order images for removal so that no image is removed before its children.
+
+    :param parents: dict of image ID to parent image ID
+    :return: list of lists of image IDs
+    """
+    remaining = dict(parents)
+    waves = []
+    while remaining:
+        has_children = set(parent for parent in remaining.values() if parent in remaining)
+        wave = sorted(image_id for image_id in remaining if image_id not in has_children)
+        if not wave:
+            # Not possible with real image history; remove what is left together
+            wave = sorted(remaining)
+        waves.append(wave)
+        for image_id in wave:
+            remaining.pop(image_id)
+    return waves
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024.0:
+            return u'%.1f %s' % (size, unit) if unit != 'B' else u'%d B' % size
+        size /= 1024.0
+    return u'%.1f TB' % size
+
+
+def _restart_policy(restart):
+    """ Translate a Compose restart value, like on-failure:3, to a Docker restart policy """
+    if not restart or restart == 'no':
+        return None
+    name, _, retries = restart.partition(':')
+    policy = {'Name': name}
+    if retries:
+        policy['MaximumRetryCount'] = int(retries)
+    return policy
+
+
+class DockerOrchestrator(object):
+    """
+    Starts, stops and removes service containers directly through the Docker API. Services
+    are handled in waves computed from depends_on and links, with each wave handled in
+    parallel, and the time taken for every service reported.
+    """
+
+    def __init__(self, engine, services, workers=None):
+        self.engine = engine
+        self.services = services or {}
+        self.workers = workers or DEFAULT_WORKERS
+        self.compose_project = compose_project_name(engine.project_name)
+        # What start did with each service: created, recreated, started or kept
+        self.outcomes = {}
+
+    @property
+    def client(self):
+        return self.engine.client
+
+    @property
+    def network_name(self):
+        return u'%s_default' % self.compose_project
+
+    def volume_name(self, name):
+        definition = (self.engine.volumes or {}).get(name) or {}
+        if definition.get('external'):
+            return definition['external'].get('name', name) if isinstance(definition['external'], dict) else name
+        return u'%s_%s' % (self.compose_project, name)
+
+    def _map(self, func, items):
+        if len(items) < 2 or self.workers < 2:
+            return [func(item) for item in items]
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _run_waves(self, waves, func, action):
+        timings = {}
+
+        def timed(service_name):
+            start = time.time()
+            try:
+                func(service_name)
+            except docker_errors.APIError as exc:
+                raise exceptions.AnsibleContainerException(
+                    u'Failed to {} service {}: {}'.format(action, service_name, exc))
+            elapsed = round(time.time() - start, 3)
+            logger.info(u'Service %s: %s in %.2fs', action, service_name, elapsed,
+                        service=service_name, seconds=elapsed)
+            return service_name, elapsed
+
+        for index, wave in enumerate(waves):
+            logger.debug(u'Orchestrating wave', action=action, wave=index + 1, services=wave)
+            timings.update(self._map(timed, wave))
+        return timings
+
+    def containers_for_service(self, service_name):
+        """ Containers for the service, whether created here or by Compose """
+        found = {}
+        for labels in ([u'%s=%s' % (PROJECT_LABEL_KEY, self.engine.project_name),
+                        u'%s=%s' % (SERVICE_LABEL_KEY, service_name)],
+                       [u'%s=%s' % (COMPOSE_PROJECT_LABEL_KEY, self.compose_project),
+                        u'%s=%s' % (COMPOSE_SERVICE_LABEL_KEY, service_name)]):
+            for container in self.client.containers.list(all=True, filters={'label': labels}):
+                found[container.id] = container
+        return list(found.values())
+
+    def _project_containers(self):
+        found = {}
+        for label in (u'%s=%s' % (PROJECT_LABEL_KEY, self.engine.project_name),
+                      u'%s=%s' % (COMPOSE_PROJECT_LABEL_KEY, self.compose_project)):
+            for container in self.client.containers.list(all=True, filters={'label': label}):
+                found[container.id] = container
+        return list(found.values())
+
+    def _image_for_service(self, service_name):
+        service = self.services[service_name]
+        if service.get('roles'):
+            image = self.engine.get_latest_image_for_service(service_name)
+            if image is None:
+                raise exceptions.AnsibleContainerMissingImage(
+                    u"Missing image for service '{}'. Run 'ansible-container build' to (re)create it."
+                    .format(service_name))
+            return image
+        try:
+            return self.client.images.get(service['from'])
+        except docker_errors.ImageNotFound:
+            logger.info(u'Pulling image for service', service=service_name, image=service['from'])
+            return self.client.images.pull(service['from'])
+
+    def _ensure_network(self):
+        for network in self.client.networks.list(names=[self.network_name]):
+            if network.name == self.network_name:
+                return network
+        logger.debug(u'Creating network', network=self.network_name)
+        return self.client.networks.create(self.network_name, driver='bridge',
+                                           labels={PROJECT_LABEL_KEY: self.engine.project_name})
+
+    def _ensure_volumes(self):
+        for name, definition in iteritems(self.engine.volumes or {}):
+            definition = definition or {}
+            if definition.get('external'):
+                continue
+            volume_name = self.volume_name(name)
+            try:
+                self.client.volumes.get(volume_name)
+            except docker_errors.NotFound:
+                logger.debug(u'Creating volume', volume=volume_name)
+                self.client.volumes.create(name=volume_name, driver=definition.get('driver', 'local'),
+                                           driver_opts=definition.get('driver_opts'),
+                                           labels={PROJECT_LABEL_KEY: self.engine.project_name})
+
+    def _volumes_for_service(self, service_name):
+        volumes = []
+        for volume in self.services[service_name].get('volumes') or []:
+            source, sep, rest = volume.partition(':')
+            if sep and source in (self.engine.volumes or {}):
+                volume = u'%s:%s' % (self.volume_name(source), rest)
+            volumes.append(volume)
+        if self.services[service_name].get('secrets') and self.engine.CAP_SIM_SECRETS:
+            volumes.append(u'%s:/run/secrets:ro' % self.engine.secrets_volume_name)
+        return volumes
+
+    def create_kwargs_for_service(self, service_name):
+        service = self.services[service_name]
+        create_kwargs = self.engine.run_kwargs_for_service(service_name)
+        labels = labels_to_dict(service.get('labels'))
+        labels.update({
+            PROJECT_LABEL_KEY: self.engine.project_name,
+            SERVICE_LABEL_KEY: service_name,
+            COMPOSE_PROJECT_LABEL_KEY: self.compose_project,
+            COMPOSE_SERVICE_LABEL_KEY: service_name,
+            COMPOSE_ONEOFF_LABEL_KEY: u'False',
+            COMPOSE_NUMBER_LABEL_KEY: u'1',
+        })
+        create_kwargs['labels'] = labels
+        volumes = self._volumes_for_service(service_name)
+        if volumes:
+            create_kwargs['volumes'] = volumes
+        restart_policy = _restart_policy(service.get('restart'))
+        if restart_policy:
+            create_kwargs['restart_policy'] = restart_policy
+        if service.get('logging'):
+            create_kwargs['log_config'] = {'type': service['logging'].get('driver'),
+                                           'config': service['logging'].get('options') or {}}
+        if not service.get('network_mode'):
+            # As with Compose, the container is only attached to the project's network, and
+            # not to the default bridge as well
+            create_kwargs['network'] = self.network_name
+        return create_kwargs
+
+    def _create_container(self, service_name, image, create_kwargs):
+        service = self.services[service_name]
+        container = self.client.containers.create(
+            image.id,
+            name=self.engine.container_name_for_service(service_name),
+            detach=True,
+            **create_kwargs)
+        if not service.get('network_mode'):
+            links = []
+            for link in service.get('links') or []:
+                name, _, alias = link.partition(':')
+                links.append((self.engine.container_name_for_service(name), alias or name))
+            # The container is created on the network without its aliases and links, which can
+            # only be set when connecting it. Compose reconnects the same way.
+            self.client.api.disconnect_container_from_network(container.id, self.network_name)
+            self.client.api.connect_container_to_network(container.id, self.network_name,
+                                                         aliases=[service_name], links=links or None)
+        return container
+
+    def _start_service(self, service_name):
+        image = self._image_for_service(service_name)
+        create_kwargs = self.create_kwargs_for_service(service_name)
+        digest = container_digest(image.id, self.services[service_name])
+        create_kwargs['labels'][DIGEST_LABEL_KEY] = digest
+        container = None
+        outdated = False
+        for existing in self.containers_for_service(service_name):
+            if container is None and (existing.labels or {}).get(DIGEST_LABEL_KEY) == digest:
+                container = existing
+            else:
+                logger.debug(u'Removing outdated container', service=service_name, container=existing.name)
+                existing.remove(force=True)
+                outdated = True
+        if container is None:
+            container = self._create_container(service_name, image, create_kwargs)
+            outcome = 'recreated' if outdated else 'created'
+        else:
+            outcome = 'kept'
+        if container.status != 'running':
+            container.start()
+            if outcome == 'kept':
+                outcome = 'started'
+        self.outcomes[service_name] = outcome
+
+    def _restart_service(self, service_name):
+        running = [c for c in self.containers_for_service(service_name) if c.status == 'running']
+        if running:
+            for container in running:
+                container.restart()
+        else:
+            self._start_service(service_name)
+
+    def _stop_service(self, service_name):
+        for container in self.containers_for_service(service_name):
+            if container.status == 'running':
+                container.stop()
+
+    def _remove_service(self, service_name):
+        for container in self.containers_for_service(service_name):
+            container.remove(v=True, force=True)
+
+    def remove_orphans(self):
+        for container in self._project_containers():
+            labels = container.labels or {}
+            service_name = labels.get(SERVICE_LABEL_KEY) or labels.get(COMPOSE_SERVICE_LABEL_KEY)
+            if service_name not in self.services:
+                logger.info(u'Removing orphan container', container=container.name, service=service_name)
+                container.remove(v=True, force=True)
+
+    def start(self, remove_orphans=False):
+        self._ensure_network()
+        self._ensure_volumes()
+        self.outcomes = {}
+        timings = self._run_waves(dependency_waves(self.services), self._start_service, 'started')
+        if remove_orphans:
+            self.remove_orphans()
+        self._log_outcomes()
+        return timings
+
+    def _log_outcomes(self):
+        by_outcome = {}
+        for service_name, outcome in iteritems(self.outcomes):
+            by_outcome.setdefault(outcome, []).append(service_name)
+        for outcome in ('created', 'recreated', 'started', 'kept'):
+            if by_outcome.get(outcome):
+                logger.info(u'%s %d service(s): %s', outcome.capitalize(), len(by_outcome[outcome]),
+                            u', '.join(sorted(by_outcome[outcome])))
+
+    def restart(self):
+        self._ensure_network()
+        self._ensure_volumes()
+        return self._run_waves(dependency_waves(self.services), self._restart_service, 'restarted')
+
+    def stop(self):
+        # Stop dependents before the services they depend on
+        return self._run_waves(list(reversed(dependency_waves(self.services))), self._stop_service, 'stopped')
+
+    def destroy(self):
+        timings = self._run_waves(list(reversed(dependency_waves(self.services))), self._remove_service,
+                                  'removed')
+        for volume_name in [self.volume_name(name) for name, definition in iteritems(self.engine.volumes or {})
+                            if not (definition or {}).get('external')]:
+            self._remove_volume(volume_name)
+        for network in self.client.networks.list(names=[self.network_name]):
+            if network.name == self.network_name:
+                try:
+                    network.remove()
+                except docker_errors.APIError as exc:
+                    logger.warning(u'Unable to remove network', network=self.network_name, error=str(exc))
+        self.engine.remove_project_images(workers=self.workers)
+        if self.engine.secrets and self.engine.CAP_SIM_SECRETS:
+            self._remove_volume(self.engine.secrets_volume_name)
+        return timings
+
+    def _remove_volume(self, volume_name):
+        try:
+            self.client.volumes.get(volume_name).remove(force=True)
+        except docker_errors.NotFound:
+            pass
+        except docker_errors.APIError as exc:
+            logger.warning(u'Unable to remove volume', volume=volume_name, error=str(exc))
@@ -4,10 +4,15 @@ from __future__ import absolute_import
 from container.utils.visibility import getLogger
 logger = getLogger(__name__)
 
+import io
 import os
-from container import exceptions, __version__ as container_version
+import tarfile
+import time
+
+from container import conductor_only, exceptions, __version__ as container_version
+from container.utils import text
 from ruamel.yaml.comments import CommentedMap
-from six import iteritems
+from six import iteritems, string_types, text_type
 
 try:
     from docker import errors as docker_errors
@@ -57,9 +62,15 @@ class DockerSecretsMixin(object):
             logger.debug("Created Docker volume", volume_id=volume_obj.id)
         return volume_obj.id
 
-    def generate_secrets_play(self, vault_files=None):
+    SECRET_FILE_MODE = 0o444
+    SECRET_DIR_MODE = 0o755
+
+    def _get_secrets_to_disk(self):
+        """
+        Map each secret key to the variable holding its value, and the paths within the secrets
+        volume where it should be written.
+        """
         secrets_to_disk = {}
-        play = None
 
         if self.secrets:
             # Get the top-level secret definitions
@@ -86,6 +97,113 @@ class DockerSecretsMixin(object):
                             if docker_secret.get('source') and docker_secret.get('target'):
                                 secrets_to_disk[docker_secret['source']]['paths'].append(
                                     os.path.join(self.secrets_mount_path, docker_secret['target']))
+        return secrets_to_disk
+
+    @staticmethod
+    def _load_vault_variables(vault_files, vault_password=None, vault_password_file=None):
+        """ Decrypt and merge the variables in each vault file, returning the loader and variables """
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.parsing.vault import VaultSecret, get_file_vault_secret
+
+        loader = DataLoader()
+        if vault_password_file:
+            secret = get_file_vault_secret(filename=vault_password_file, loader=loader)
+            secret.load()
+            loader.set_vault_secrets([('default', secret)])
+        elif vault_password:
+            loader.set_vault_secrets([('default', VaultSecret(text.to_bytes(vault_password)))])
+        variables = {}
+        for vault_file in vault_files or []:
+            variables.update(loader.load_from_file(vault_file) or {})
+        return loader, variables
+
+    def render_secrets(self, vault_files=None, vault_password=None, vault_password_file=None):
+        """
+        Resolve the value of every secret from the vault files, all in one pass.
+        :return: dict mapping each path within the secrets volume to the secret's value, as bytes
+        """
+        from ansible.template import Templar
+
+        loader, variables = self._load_vault_variables(vault_files, vault_password=vault_password,
+                                                       vault_password_file=vault_password_file)
+        templar = Templar(loader=loader, variables=variables)
+        rendered = {}
+        for secret_name, secret in iteritems(self._get_secrets_to_disk()):
+            value = templar.template(u'{{ %s }}' % secret['variable'])
+            if not isinstance(value, string_types):
+                value = text_type(value)
+            for path in secret['paths']:
+                rendered[path] = text.to_bytes(value)
+        return rendered
+
+    def _secrets_archive(self, files):
+        """
+        Build a tar archive of files, keyed by their path within the secrets volume, along with
+        each parent directory the files need.
+        """
+        now = time.time()
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            dirs = set()
+            for path in sorted(files):
+                rel_path = os.path.relpath(path, self.secrets_mount_path)
+                parent = os.path.dirname(rel_path)
+                while parent and parent not in dirs:
+                    dirs.add(parent)
+                    parent = os.path.dirname(parent)
+            for dir_name in sorted(dirs):
+                info = tarfile.TarInfo(dir_name)
+                info.type = tarfile.DIRTYPE
+                info.mode = self.SECRET_DIR_MODE
+                info.mtime = now
+                tar.addfile(info)
+            for path in sorted(files):
+                info = tarfile.TarInfo(os.path.relpath(path, self.secrets_mount_path))
+                info.size = len(files[path])
+                info.mode = self.SECRET_FILE_MODE
+                info.mtime = now
+                tar.addfile(info, io.BytesIO(files[path]))
+        return buf.getvalue()
+
+    def _secret_is_current(self, path, value):
+        try:
+            if os.stat(path).st_mode & 0o777 != self.SECRET_FILE_MODE:
+                return False
+            with open(path, 'rb') as ifs:
+                return ifs.read() == value
+        except (IOError, OSError):
+            return False
+
+    @conductor_only
+    def write_secrets(self, vault_files=None, vault_password=None, vault_password_file=None, **kwargs):
+        """
+        Render every secret, and write those that are new or changed into the secrets volume
+        with a single upload through the Docker archive API. The volume is mounted into the
+        Conductor at secrets_mount_path, so current values are read from there.
+        :return: True if the secrets volume is up to date, and the secrets play can be skipped
+        """
+        if not (self.secrets and self.CAP_SIM_SECRETS):
+            return False
+        rendered = self.render_secrets(vault_files=vault_files, vault_password=vault_password,
+                                       vault_password_file=vault_password_file)
+        changed = dict((path, value) for path, value in iteritems(rendered)
+                       if not self._secret_is_current(path, value))
+        logger.info(u'Writing secrets to Docker volume', volume=self.secrets_volume_name,
+                    changed=len(changed), unchanged=len(rendered) - len(changed))
+        if changed:
+            conductor_id = self.get_container_id_for_service('conductor')
+            try:
+                self.client.api.put_archive(conductor_id, self.secrets_mount_path,
+                                            self._secrets_archive(changed))
+            except docker_errors.APIError as exc:
+                raise exceptions.AnsibleContainerException(
+                    "Error writing secrets to volume {}: {}".format(self.secrets_volume_name, str(exc))
+                )
+        return True
+
+    def generate_secrets_play(self, vault_files=None):
+        play = None
+        secrets_to_disk = self._get_secrets_to_disk()
 
         if secrets_to_disk:
             tasks = []
@@ -93,9 +211,20 @@ class DockerSecretsMixin(object):
             for secret_name, secret in iteritems(secrets_to_disk):
                 for path in secret['paths']:
                     tasks.append({
-                        'name': 'Write secret to Docker volume',
-                        'shell': "mkdir -p " + secret['subdir'] + " && echo '{{ " + secret['variable'] + " }}' >" +
-                                 path,
+                        'name': 'Create directory for secret {} at {}'.format(secret_name, path),
+                        'file': {
+                            'path': os.path.dirname(path),
+                            'state': 'directory'
+                        },
+                        'tags': ['start', 'restart', 'stop']
+                    })
+                    tasks.append({
+                        'name': 'Write secret {} to {}'.format(secret_name, path),
+                        'copy': {
+                            'content': "{{ " + secret['variable'] + " }}",
+                            'dest': path,
+                            'mode': '0{:o}'.format(self.SECRET_FILE_MODE)
+                        },
                         'tags': ['start', 'restart', 'stop']
                     })
 
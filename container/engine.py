@@ -33,6 +33,9 @@ class BaseEngine(object):
     CAP_RUN = False
     CAP_VERSION = False
     CAP_SIM_SECRETS = False
+    CAP_NATIVE_ORCHESTRATION = False
+    CAP_WAIT_FOR_ROLLOUT = False
+    CAP_DEPLOY_TARGETS = False
 
     def __init__(self, project_name, services, debug=False, selinux=True, devel=False, **kwargs):
         self.project_name = project_name
@@ -178,6 +181,68 @@ class BaseEngine(object):
     def tag_image_as_latest(self, service_name, image_id):
         raise NotImplementedError()
 
+    @conductor_only
+    def commit_checkpoint(self, container_id, fingerprint, start_at_task, index):
+        """
+        Commit a running build container part way through a role. The checkpoint is
+        labeled with the fingerprint of the layer being built, and the task to resume at.
+        """
+        raise NotImplementedError()
+
+    def get_latest_checkpoint(self, fingerprint):
+        """Return a tuple of image_id, start_at_task, index for the most recent checkpoint, or None"""
+        raise NotImplementedError()
+
+    def remove_checkpoints(self, fingerprint, keep=None):
+        """Remove the checkpoints of a layer once it is committed, other than the image ID keep"""
+        raise NotImplementedError()
+
+    @conductor_only
+    def get_container_os_release(self, container_id):
+        """Return the key/value pairs found in /etc/os-release inside a running container"""
+        raise NotImplementedError()
+
+    @conductor_only
+    def slim_container(self, container_id, paths):
+        """
+        Remove the given paths (shell globs) from a running build container prior to
+        committing it. Returns the number of bytes removed.
+        """
+        raise NotImplementedError()
+
+    @conductor_only
+    def orchestrate(self, desired_state, remove_orphans=False, **kwargs):
+        """
+        Bring services to the desired state (start, restart, stop or destroy) directly through the
+        engine's API, rather than through the orchestration playbook. Returns a dict of seconds
+        taken per service, or per resource for engines that manage resources.
+        """
+        raise NotImplementedError()
+
+    @conductor_only
+    def wait_for_rollout(self, timeout=None, **kwargs):
+        """
+        Wait for the deployments started by run to be ready, failing early on any that can't
+        start. Returns a dict of seconds taken for each service to be ready.
+        """
+        raise NotImplementedError()
+
+    @conductor_only
+    def write_secrets(self, vault_files=None, vault_password=None, vault_password_file=None, **kwargs):
+        """
+        Make secrets available to containers started by the orchestration playbook, ahead of running it.
+        Returns True when the playbook no longer needs to write them itself.
+        """
+        raise NotImplementedError()
+
+    @conductor_only
+    def remove_project_images(self, workers=None, **kwargs):
+        """
+        Remove images built for the project, after its containers have been destroyed.
+        Returns a tuple of the number of images removed and the bytes reclaimed.
+        """
+        raise NotImplementedError()
+
     @conductor_only
     def generate_orchestration_playbook(self, url=None, namespace=None, local_images=True):
         """
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+Apply Kubernetes and OpenShift resources straight to the API server, in waves of independent
+resources, with the resources in each wave applied concurrently over one pooled connection.
+"""
+
+from __future__ import absolute_import
+
+from container.utils.visibility import getLogger
+logger = getLogger(__name__)
+
+import base64
+import copy
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from ruamel import yaml
+from six import iteritems, text_type
+
+from container import exceptions
+
+DEFAULT_WORKERS = 8
+
+# Annotation holding the digest of the definition a resource was last applied from
+DIGEST_ANNOTATION_KEY = 'com.ansible.container.digest'
+
+# Kinds served by the OpenShift API, rather than the Kubernetes core API, for apiVersion v1
+OPENSHIFT_KINDS = frozenset(['DeploymentConfig', 'Route', 'Project', 'ProjectRequest'])
+# Kinds that don't live in a namespace
+CLUSTER_KINDS = frozenset(['Namespace', 'Project', 'ProjectRequest', 'PersistentVolume'])
+
+_VERSION_RE = re.compile(r'^v\d+((alpha|beta)\d+)?$')
+
+
+def camel_kind(kind):
+    """ Resource kind from the snake case form used in module names and templates, like deployment_config """
+    if '_' not in kind and kind[:1].isupper():
+        return kind
+    return ''.join(part.capitalize() for part in kind.split('_'))
+
+
+def resource_path(api_version, kind, namespace=None, name=None):
+    """ Path to a resource, or its collection when name is None """
+    if '/' in api_version:
+        path = '/apis/%s' % api_version
+    elif kind in OPENSHIFT_KINDS:
+        path = '/oapi/%s' % api_version
+    else:
+        path = '/api/%s' % api_version
+    if namespace and kind not in CLUSTER_KINDS:
+        path += '/namespaces/%s' % namespace
+    path += '/%ss' % kind.lower()
+    if name:
+        path += '/%s' % name
+    return path
+
+
+def resource_digest(resource):
+    """ Canonical digest of a resource definition, leaving out the digest annotation itself """
+    resource = copy.deepcopy(resource)
+    metadata = resource.get('metadata') or {}
+    annotations = metadata.get('annotations') or {}
+    annotations.pop(DIGEST_ANNOTATION_KEY, None)
+    if not annotations:
+        metadata.pop('annotations', None)
+    payload = json.dumps(resource, sort_keys=True, separators=(',', ':'), default=text_type)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def summarize(results):
+    """ Count the resources created, updated, unchanged and deleted by a WaveApplier run """
+    groups = {'created': 'created', 'patched': 'updated', 'replaced': 'updated',
+              'unchanged': 'unchanged', 'deleted': 'deleted', 'absent': 'unchanged'}
+    summary = dict.fromkeys(('created', 'updated', 'unchanged', 'deleted'), 0)
+    for kind, name, outcome, seconds in results:
+        summary[groups[outcome]] += 1
+    return summary
+
+
+def resource_from_task(task):
+    """
+    Translate a task for one of the Ansible Kubernetes or OpenShift modules, as generated for
+    the orchestration playbook, into a tuple of the desired state, the resource and whether
+    to replace rather than patch it.
+    """
+    module_name = [key for key in task if key not in ('name', 'tags')][0]
+    params = task[module_name]
+    parts = module_name.split('_')[1:]
+    version_index = [i for i, part in enumerate(parts) if _VERSION_RE.match(part)][0]
+    group = '_'.join(parts[:version_index])
+    api_version = '%s/%s' % (group, parts[version_index]) if group else parts[version_index]
+    kind = camel_kind('_'.join(parts[version_index + 1:]))
+    state = params.get('state', 'present')
+
+    if params.get('resource_definition'):
+        resource = copy.deepcopy(dict(params['resource_definition']))
+        resource['apiVersion'] = resource.get('apiVersion') or api_version
+        resource['kind'] = camel_kind(resource.get('kind') or kind)
+    else:
+        resource = {'apiVersion': api_version, 'kind': kind, 'metadata': {'name': params['name']}}
+        if params.get('namespace'):
+            resource['metadata']['namespace'] = params['namespace']
+        if kind == 'Project' and state == 'present':
+            # Projects are created by making a request for one
+            resource['kind'] = 'ProjectRequest'
+            if params.get('display_name'):
+                resource['displayName'] = params['display_name']
+            if params.get('description'):
+                resource['description'] = params['description']
+    return state, resource, bool(params.get('force', False))
+
+
+def retarget_waves(waves, namespace, display_name=None, description=None):
+    """
+    Copy of rendered waves for another namespace or project. Labels and selectors are left as
+    they are, so resources match each other the same way in every target.
+    """
+    retargeted = []
+    for wave in waves:
+        retargeted.append([])
+        for state, resource, force in wave:
+            resource = copy.deepcopy(resource)
+            metadata = resource.setdefault('metadata', {})
+            if resource['kind'] in ('Namespace', 'Project', 'ProjectRequest'):
+                metadata['name'] = namespace
+                if resource['kind'] == 'ProjectRequest':
+                    for key, value in (('displayName', display_name), ('description', description)):
+                        if value:
+                            resource[key] = value
+            elif resource['kind'] not in CLUSTER_KINDS:
+                metadata['namespace'] = namespace
+            retargeted[-1].append((state, resource, force))
+    return retargeted
+
+
+class K8sApiClient(object):
+    """ A pooled HTTP session to the API server """
+
+    def __init__(self, host, api_key=None, username=None, password=None, ssl_ca_cert=None, cert_file=None,
+                 key_file=None, verify_ssl=True, pool_size=DEFAULT_WORKERS):
+        self.host = host.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = (api_key if api_key.lower().startswith('bearer ')
+                                                     else 'Bearer %s' % api_key)
+        elif username:
+            self.session.auth = (username, password or '')
+        if cert_file:
+            self.session.cert = (cert_file, key_file) if key_file else cert_file
+        self.session.verify = (ssl_ca_cert or True) if verify_ssl else False
+
+    @staticmethod
+    def _data_file(data):
+        fd, path = tempfile.mkstemp(prefix='ac-k8s-')
+        with os.fdopen(fd, 'wb') as ofs:
+            ofs.write(base64.b64decode(data))
+        return path
+
+    @classmethod
+    def from_kubeconfig(cls, config_file, context=None, **kwargs):
+        """ Connection settings for a context of a kubeconfig file, the current context by default """
+        with open(config_file) as ifs:
+            kubeconfig = yaml.safe_load(ifs) or {}
+
+        def _named(section, name):
+            for entry in kubeconfig.get(section) or []:
+                if entry.get('name') == name:
+                    return entry.get(section[:-1]) or {}
+            return {}
+
+        context = _named('contexts', context or kubeconfig.get('current-context'))
+        cluster = _named('clusters', context.get('cluster'))
+        user = _named('users', context.get('user'))
+        settings = {
+            'host': cluster.get('server'),
+            'verify_ssl': not cluster.get('insecure-skip-tls-verify', False),
+            'ssl_ca_cert': cluster.get('certificate-authority'),
+            'api_key': user.get('token'),
+            'username': user.get('username'),
+            'password': user.get('password'),
+            'cert_file': user.get('client-certificate'),
+            'key_file': user.get('client-key'),
+        }
+        for key, data_key, section in (('ssl_ca_cert', 'certificate-authority-data', cluster),
+                                       ('cert_file', 'client-certificate-data', user),
+                                       ('key_file', 'client-key-data', user)):
+            if section.get(data_key):
+                settings[key] = cls._data_file(section[data_key])
+        settings.update((key, value) for key, value in iteritems(kwargs) if value is not None)
+        return settings
+
+    @classmethod
+    def from_environment(cls, environ=None, pool_size=DEFAULT_WORKERS):
+        """ Connect with the K8S_AUTH_* variables set for the Ansible Kubernetes modules """
+        environ = os.environ if environ is None else environ
+        k8s_auth = dict((key, environ.get('K8S_AUTH_%s' % key.upper()))
+                        for key in ('host', 'api_key', 'username', 'password', 'ssl_ca_cert',
+                                    'cert_file', 'key_file', 'verify_ssl', 'context'))
+        k8s_auth['config_file'] = environ.get('K8S_AUTH_KUBECONFIG')
+        return cls.from_settings(k8s_auth, pool_size=pool_size)
+
+    @classmethod
+    def from_settings(cls, k8s_auth, pool_size=DEFAULT_WORKERS):
+        """
+        Connect with k8s_auth settings, as found in container.yml, falling back to the kubeconfig
+        file for anything they leave out.
+        """
+        overrides = dict((key, k8s_auth.get(key))
+                         for key in ('host', 'api_key', 'username', 'password', 'ssl_ca_cert',
+                                     'cert_file', 'key_file'))
+        verify_ssl = k8s_auth.get('verify_ssl')
+        if verify_ssl not in (None, ''):
+            overrides['verify_ssl'] = (verify_ssl if isinstance(verify_ssl, bool)
+                                       else text_type(verify_ssl).lower() in ('1', 'true', 'yes'))
+        config_file = os.path.expanduser(k8s_auth.get('config_file') or '~/.kube/config')
+        if os.path.isfile(config_file):
+            settings = cls.from_kubeconfig(config_file, context=k8s_auth.get('context'), **overrides)
+        else:
+            settings = dict((key, value) for key, value in iteritems(overrides) if value is not None)
+        if not settings.get('host'):
+            raise exceptions.AnsibleContainerConfigException(
+                u'Unable to find the API server. Set k8s_auth in container.yml, or provide a kubeconfig file.')
+        return cls(pool_size=pool_size, **settings)
+
+    def request(self, method, path, body=None, content_type='application/json', allow_missing=False):
+        response = self.session.request(method, self.host + path,
+                                        data=json.dumps(body) if body is not None else None,
+                                        headers={'Content-Type': content_type})
+        if response.status_code == 404 and allow_missing:
+            return None
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise exceptions.AnsibleContainerDeployException(
+                u'{} {} failed with status {}: {}'.format(method, path, response.status_code, message))
+        return response.json() if response.content else {}
+
+    def watch(self, path, resource_version=None, timeout=None, **params):
+        """
+        Watch a collection from a resource version, yielding (type, object) for each event until
+        the server closes the stream.
+        """
+        params['watch'] = 'true'
+        if resource_version:
+            params['resourceVersion'] = resource_version
+        if timeout:
+            params['timeoutSeconds'] = int(timeout)
+        response = self.session.get(self.host + path, params=params, stream=True)
+        try:
+            if response.status_code >= 400:
+                raise exceptions.AnsibleContainerDeployException(
+                    u'Watching {} failed with status {}: {}'.format(path, response.status_code, response.text))
+            for line in response.iter_lines():
+                if line:
+                    event = json.loads(line.decode('utf-8'))
+                    yield event.get('type'), event.get('object') or {}
+        finally:
+            response.close()
+
+
+class WaveApplier(object):
+    """
+    Applies waves of resources in order. The resources within a wave must not depend on one
+    another, and are applied concurrently. Each resource is annotated with the digest of its
+    definition, and left alone while the digest on the server matches.
+    """
+
+    def __init__(self, client, workers=None):
+        self.client = client
+        self.workers = workers or DEFAULT_WORKERS
+        # Collection path to {name: (digest, resourceVersion)}, for collections listed up front
+        self.existing = {}
+
+    @staticmethod
+    def _paths(resource):
+        kind = resource['kind']
+        metadata = resource.get('metadata') or {}
+        namespace = metadata.get('namespace')
+        name = metadata.get('name')
+        if kind == 'ProjectRequest':
+            return (resource_path(resource['apiVersion'], 'Project', name=name),
+                    resource_path(resource['apiVersion'], kind))
+        return (resource_path(resource['apiVersion'], kind, namespace, name),
+                resource_path(resource['apiVersion'], kind, namespace))
+
+    @staticmethod
+    def _list_path(resource):
+        if resource['kind'] == 'ProjectRequest':
+            return resource_path(resource['apiVersion'], 'Project')
+        return resource_path(resource['apiVersion'], resource['kind'], (resource.get('metadata') or {}).get('namespace'))
+
+    def _list(self, list_path):
+        listing = self.client.request('GET', list_path, allow_missing=True) or {}
+        existing = {}
+        for item in listing.get('items') or []:
+            metadata = item.get('metadata') or {}
+            existing[metadata.get('name')] = ((metadata.get('annotations') or {}).get(DIGEST_ANNOTATION_KEY),
+                                              metadata.get('resourceVersion'))
+        return list_path, existing
+
+    def _existing(self, resource, path):
+        """ The digest and resourceVersion of a resource on the server, or None if it doesn't exist """
+        list_path = self._list_path(resource)
+        if list_path in self.existing:
+            return self.existing[list_path].get(resource['metadata']['name'])
+        existing = self.client.request('GET', path, allow_missing=True)
+        if existing is None:
+            return None
+        metadata = existing.get('metadata') or {}
+        return (metadata.get('annotations') or {}).get(DIGEST_ANNOTATION_KEY), metadata.get('resourceVersion')
+
+    def _record(self, resource, response=None):
+        """
+        Keep the listed collections current after a write, so a later wave compares against what
+        is on the server now rather than what was there before the first wave
+        """
+        existing = self.existing.get(self._list_path(resource))
+        if existing is None:
+            return
+        name = resource['metadata']['name']
+        if response is None:
+            existing.pop(name, None)
+        else:
+            metadata = response.get('metadata') or {}
+            existing[name] = ((metadata.get('annotations') or {}).get(DIGEST_ANNOTATION_KEY),
+                              metadata.get('resourceVersion'))
+
+    def apply(self, state, resource, force=False):
+        """ Bring a resource to the desired state, returning what was done """
+        path, collection_path = self._paths(resource)
+        if state == 'absent':
+            if resource['kind'] == 'ProjectRequest':
+                path = resource_path(resource['apiVersion'], 'Project', name=resource['metadata']['name'])
+            deleted = self.client.request('DELETE', path, allow_missing=True)
+            self._record(resource)
+            return 'deleted' if deleted is not None else 'absent'
+        digest = resource_digest(resource)
+        resource = copy.deepcopy(resource)
+        resource.setdefault('metadata', {})
+        if resource['kind'] not in ('ProjectRequest', 'Namespace'):
+            resource['metadata'].setdefault('annotations', {})[DIGEST_ANNOTATION_KEY] = digest
+        existing = self._existing(resource, path)
+        if existing is None:
+            self._record(resource, self.client.request('POST', collection_path, resource))
+            return 'created'
+        existing_digest, resource_version = existing
+        if resource['kind'] in ('ProjectRequest', 'Namespace') or existing_digest == digest:
+            return 'unchanged'
+        if force:
+            resource['metadata']['resourceVersion'] = resource_version
+            self._record(resource, self.client.request('PUT', path, resource))
+            return 'replaced'
+        self._record(resource, self.client.request('PATCH', path, resource,
+                                                   content_type='application/merge-patch+json'))
+        return 'patched'
+
+    def run(self, waves):
+        """
+        :param waves: list of lists of (state, resource, force) tuples
+        :return: list of (kind, name, outcome, seconds) tuples, in the order applied
+        """
+        results = []
+
+        def timed(item):
+            state, resource, force = item
+            start = time.time()
+            outcome = self.apply(state, resource, force)
+            elapsed = round(time.time() - start, 3)
+            logger.debug(u'Applied resource', kind=resource['kind'], name=resource['metadata']['name'],
+                         outcome=outcome, seconds=elapsed)
+            return resource['kind'], resource['metadata']['name'], outcome, elapsed
+
+        pool = ThreadPool(self.workers)
+        try:
+            # One list call per kind and namespace, rather than a read per resource
+            list_paths = set(self._list_path(resource) for wave in waves
+                             for state, resource, force in wave if state == 'present')
+            self.existing = dict(pool.map(self._list, sorted(list_paths)))
+            for index, wave in enumerate(waves):
+                if not wave:
+                    continue
+                logger.info(u'Applying wave %d of %d: %d resource(s)', index + 1, len(waves), len(wave))
+                results.extend(pool.map(timed, wave))
+        finally:
+            pool.close()
+            pool.join()
+        return results
@@ -9,7 +9,7 @@ import string_utils
 
 from abc import ABCMeta, abstractmethod
 
-from six import iteritems, string_types, add_metaclass
+from six import iteritems, string_types, text_type, add_metaclass
 from ruamel.yaml.comments import CommentedMap, CommentedSeq
 
 from container.utils.visibility import getLogger
@@ -20,6 +20,63 @@ Translate the container.yml derived config into an Ansible playbook/role
 to deploy the services.
 """
 
+_CAMEL_CASE = {}
+
+
+def camel_case(key):
+    """ snake_case_to_camel for a key, memoized, as the same few keys recur across services """
+    try:
+        return _CAMEL_CASE[key]
+    except KeyError:
+        camel = _CAMEL_CASE[key] = string_utils.snake_case_to_camel(key, upper_case_first=False)
+        return camel
+
+
+def _port_range(port):
+    """ (low, high) for a port number, or a range like 10000-20000 """
+    low, _, high = text_type(port).partition('-')
+    return int(low), int(high or low)
+
+
+class _FrozenMap(tuple):
+    """ A dict, as a tuple of (key, value) pairs """
+
+
+class _FrozenCommentedMap(tuple):
+    """ A CommentedMap, as a tuple of (key, value) pairs """
+
+
+class _FrozenList(tuple):
+    pass
+
+
+class _FrozenCommentedSeq(tuple):
+    pass
+
+
+_FREEZE = {dict: _FrozenMap, CommentedMap: _FrozenCommentedMap}
+_THAW = {_FrozenMap: dict, _FrozenCommentedMap: CommentedMap, _FrozenList: list, _FrozenCommentedSeq: CommentedSeq}
+
+
+def _freeze(value):
+    """ Immutable copy of a template, that can be cached and shared """
+    if isinstance(value, dict):
+        return _FREEZE.get(type(value), _FrozenMap)((key, _freeze(item)) for key, item in iteritems(value))
+    if isinstance(value, list):
+        return (_FrozenCommentedSeq if isinstance(value, CommentedSeq) else _FrozenList)(
+            _freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    """ Mutable copy of a frozen template, much cheaper than a deepcopy of the original """
+    cls = _THAW.get(type(value))
+    if cls is None:
+        return value
+    if cls is dict or cls is CommentedMap:
+        return cls([(key, _thaw(item)) for key, item in value])
+    return cls([_thaw(item) for item in value])
+
 
 @add_metaclass(ABCMeta)
 class K8sBaseDeploy(object):
@@ -37,6 +94,8 @@ class K8sBaseDeploy(object):
         self._volumes = volumes
         self._secrets = secrets
         self._auth = auth
+        # Frozen deployment templates and their replicas, by service and service definition
+        self._compiled_deployments = {}
 
     @property
     def auth(self):
@@ -231,6 +290,7 @@ class K8sBaseDeploy(object):
         'volumes_from',   # TODO: figure out how to map?
         'from',
         'roles',
+        'slim',
         'k8s',
         'openshift',
     ]
@@ -378,8 +438,7 @@ class K8sBaseDeploy(object):
                 if vol['name'] not in existing_names:
                     existing_volumes.append(vol)
 
-        templates = CommentedSeq()
-        for name, service_config in iteritems(self._services):
+        def _compile(name, service_config):
             containers = []
             volumes = []
             pod = {}
@@ -401,46 +460,61 @@ class K8sBaseDeploy(object):
                             if deployment_key != 'force':
                                 self.copy_attribute(pod, deployment_key, deployment_value)
 
+            # Freezing copies the labels, so they can be shared while compiling
             labels = CommentedMap([
                 ('app', self._namespace_name),
                 ('service', name)
             ])
 
+            template = CommentedMap()
+            template['apiVersion'] = default_api
+            template['kind'] = default_kind
+            template['force'] = service_config.get(self.CONFIG_KEY, {}).get('deployment', {}).get('force', False)
+            template['metadata'] = CommentedMap([
+                ('name', name),
+                ('labels', labels),
+                ('namespace', self._namespace_name)
+            ])
+            template['spec'] = CommentedMap()
+            template['spec']['template'] = CommentedMap()
+            template['spec']['template']['metadata'] = CommentedMap([('labels', labels)])
+            template['spec']['template']['spec'] = CommentedMap([
+                ('containers', containers)
+            ])
+            # Replicas depend on the engine state, and are set for each task group
+            template['spec']['replicas'] = 1
+            if default_strategy:
+                template['spec']['strategy'] = {}
+                for service_key, service_value in iteritems(default_strategy):
+                    self.copy_attribute(template['spec']['strategy'], service_key, service_value)
+
+            if volumes:
+                template['spec']['template']['spec']['volumes'] = volumes
+
+            if pod:
+                for key, value in iteritems(pod):
+                    if key == 'securityContext':
+                        template['spec']['template']['spec'][key] = value
+                    else:
+                        template['spec'][key] = value
+            return _freeze(template), template['spec']['replicas']
+
+        templates = CommentedSeq()
+        for name, service_config in iteritems(self._services):
             state = service_config.get(self.CONFIG_KEY, {}).get('state', 'present')
-            if state == 'present':
-                template = CommentedMap()
-                template['apiVersion'] = default_api
-                template['kind'] = default_kind
-                template['force'] = service_config.get(self.CONFIG_KEY, {}).get('deployment', {}).get('force', False)
-                template['metadata'] = CommentedMap([
-                    ('name', name),
-                    ('labels', copy.deepcopy(labels)),
-                    ('namespace', self._namespace_name)
-                ])
-                template['spec'] = CommentedMap()
-                template['spec']['template'] = CommentedMap()
-                template['spec']['template']['metadata'] = CommentedMap([('labels', copy.deepcopy(labels))])
-                template['spec']['template']['spec'] = CommentedMap([
-                    ('containers', containers)
-                ])
-                # When the engine requests a 'stop', set replicas to 0, stopping all containers
-                template['spec']['replicas'] = 1 if not engine_state == 'stop' else 0
-                if default_strategy:
-                    template['spec']['strategy'] = {}
-                    for service_key, service_value in iteritems(default_strategy):
-                        self.copy_attribute(template['spec']['strategy'], service_key, service_value)
-
-                if volumes:
-                    template['spec']['template']['spec']['volumes'] = volumes
-
-                if pod:
-                    for key, value in iteritems(pod):
-                        if key == 'securityContext':
-                            template['spec']['template']['spec'][key] = value
-                        elif key != 'replicas' or (key == 'replicas' and engine_state != 'stop'):
-                            # Leave replicas at 0 when engine_state is 'stop'
-                            template['spec'][key] = value
-                templates.append(template)
+            if state != 'present':
+                continue
+            # The compiled form is reused while the service, including the image set for it, and the
+            # namespace are unchanged
+            key = (name, repr(service_config), self._namespace_name, default_api, default_kind,
+                   repr(default_strategy))
+            if key not in self._compiled_deployments:
+                self._compiled_deployments[key] = _compile(name, service_config)
+            compiled, replicas = self._compiled_deployments[key]
+            template = _thaw(compiled)
+            # When the engine requests a 'stop', set replicas to 0, stopping all containers
+            template['spec']['replicas'] = replicas if engine_state != 'stop' else 0
+            templates.append(template)
         return templates
 
     @abstractmethod
@@ -611,27 +685,32 @@ class K8sBaseDeploy(object):
     @staticmethod
     def get_service_ports(service):
         ports = []
-
-        def _port_in_list(host, container, protocol):
-            found = [p for p in ports if p['port'] == int(host) and
-                     p['targetPort'] == container and p['protocol'] == protocol]
-            return len(found) > 0
+        seen = set()
 
         def _append_port(host, container, protocol):
-            if not _port_in_list(host, container, protocol):
-                ports.append(dict(
-                    port=int(host),
-                    targetPort=int(container),
-                    protocol=protocol,
-                    name='port-%s-%s' % (host, protocol.lower())
-                ))
+            # Services have no port ranges, so a range becomes one port per container port
+            host_low, host_high = _port_range(host)
+            container_low, container_high = _port_range(container)
+            paired = host_high - host_low == container_high - container_low
+            for offset in range(container_high - container_low + 1):
+                host_port = host_low + offset if paired else host_low
+                key = (host_port, container_low + offset, protocol)
+                if key not in seen:
+                    seen.add(key)
+                    ports.append(dict(
+                        port=host_port,
+                        targetPort=container_low + offset,
+                        protocol=protocol,
+                        name='port-%s-%s' % (host_port, protocol.lower())
+                    ))
 
         for port in service.get('ports', []):
             protocol = 'TCP'
             if isinstance(port, string_types) and '/' in port:
                 port, protocol = port.split('/')
             if isinstance(port, string_types) and ':' in port:
-                host, container = port.split(':')
+                host, container = port.rsplit(':', 1)
+                host = host.rsplit(':', 1)[-1]
             else:
                 host = container = port
             _append_port(host, container, protocol)
@@ -662,18 +741,19 @@ class K8sBaseDeploy(object):
     @staticmethod
     def add_container_ports(ports, existing_ports):
         """ Determine list of ports to expose at the container level, and add to existing_ports """
-        def _port_exists(port, protocol):
-            found = [p for p in existing_ports if p['containerPort'] == int(port) and p['protocol'] == protocol]
-            return len(found) > 0
-
+        seen = set((p['containerPort'], p['protocol']) for p in existing_ports)
         for port in ports:
             protocol = 'TCP'
             if isinstance(port, string_types) and '/' in port:
                 port, protocol = port.split('/')
             if isinstance(port, string_types) and ':' in port:
-                _, port = port.split(':')
-            if not _port_exists(port, protocol):
-                existing_ports.append({'containerPort': int(port), 'protocol': protocol.upper()})
+                port = port.rsplit(':', 1)[-1]
+            protocol = protocol.upper()
+            low, high = _port_range(port)
+            for container_port in range(low, high + 1):
+                if (container_port, protocol) not in seen:
+                    seen.add((container_port, protocol))
+                    existing_ports.append({'containerPort': container_port, 'protocol': protocol})
 
     DOCKER_VOL_PERMISSIONS = ['rw', 'ro', 'z', 'Z']
 
@@ -794,12 +874,12 @@ class K8sBaseDeploy(object):
     @classmethod
     def copy_attribute(cls, target, src_key, src_value):
         """ copy values from src_value to target[src_key], converting src_key and sub keys to camel case """
-        src_key_camel = string_utils.snake_case_to_camel(src_key, upper_case_first=False)
+        src_key_camel = camel_case(src_key)
         if isinstance(src_value, dict):
             if not target.get(src_key_camel):
                 target[src_key_camel] = {}
             for key, value in iteritems(src_value):
-                camel_key = string_utils.snake_case_to_camel(key, upper_case_first=False)
+                camel_key = camel_case(key)
                 if isinstance(value, dict):
                     target[src_key_camel][camel_key] = {}
                     cls.copy_attribute(target[src_key_camel], key, value)
@@ -812,7 +892,7 @@ class K8sBaseDeploy(object):
                 if isinstance(element, dict):
                     new_item = {}
                     for key, value in iteritems(element):
-                        camel_key = string_utils.snake_case_to_camel(key, upper_case_first=False)
+                        camel_key = camel_case(key)
                         cls.copy_attribute(new_item, camel_key, value)
                     target[src_key_camel].append(new_item)
                 else:
@@ -4,20 +4,43 @@ from __future__ import absolute_import
 import logging
 plainLogger = logging.getLogger(__name__)
 
+import copy
 import os
+import shutil
 import subprocess
+import time
 
 from abc import ABCMeta, abstractproperty, abstractmethod
+from multiprocessing.pool import ThreadPool
+
+from ruamel import yaml
 from ruamel.yaml.comments import CommentedMap, CommentedSeq
 from six import add_metaclass, iteritems
 
 from container import conductor_only, host_only
 from container import exceptions
 from container.docker.engine import Engine as DockerEngine, log_runs
+from container.k8s.apply import WaveApplier, K8sApiClient, resource_from_task, retarget_waves, summarize
+from container.k8s.rollout import RolloutWatcher
 from container.utils.visibility import getLogger
 
 logger = getLogger(__name__)
 
+# The Kubernetes modules role is installed in the Conductor image from conductor-requirements.yml.
+# Keep the version here in step with it.
+K8S_MODULES_ROLE = 'ansible.kubernetes-modules'
+K8S_MODULES_VERSION = 'v0.3.1-6'
+CONDUCTOR_ROLES_PATH = '/etc/ansible/roles'
+
+
+def installed_role_version(role_path):
+    """ Version recorded by ansible-galaxy when it installed a role, or None """
+    try:
+        with open(os.path.join(role_path, 'meta', '.galaxy_install_info')) as ifs:
+            return (yaml.safe_load(ifs) or {}).get('version')
+    except (IOError, OSError):
+        return None
+
 
 @add_metaclass(ABCMeta)
 class K8sBaseEngine(DockerEngine):
@@ -32,6 +55,9 @@ class K8sBaseEngine(DockerEngine):
     CAP_PUSH = True
     CAP_RUN = True
     CAP_VERSION = False
+    CAP_NATIVE_ORCHESTRATION = True
+    CAP_WAIT_FOR_ROLLOUT = True
+    CAP_DEPLOY_TARGETS = True
 
     display_name = u'K8s'
 
@@ -45,6 +71,7 @@ class K8sBaseEngine(DockerEngine):
         self.namespace_name = k8s_namespace.get('name', None) or project_name
         self.namespace_display_name = k8s_namespace.get('display_name')
         self.namespace_description = k8s_namespace.get('description')
+        self.targets = settings.get('k8s_targets') or []
         super(K8sBaseEngine, self).__init__(project_name, services, debug, selinux=selinux, **kwargs)
         logger.debug("k8s namespace", namspace=self.namespace_name, display_name=self.namespace_display_name,
                      description=self.namespace_description)
@@ -64,18 +91,40 @@ class K8sBaseEngine(DockerEngine):
     def k8s_config_path(self):
         return os.path.normpath(os.path.expanduser('~/.kube/config'))
 
+    @conductor_only
+    def write_secrets(self, **kwargs):
+        # Secrets are created as K8s objects by the orchestration playbook
+        return False
+
+    @conductor_only
+    def remove_project_images(self, workers=None, **kwargs):
+        # Images live in the registry the cluster pulls from, not in the local daemon
+        return 0, 0
+
     @conductor_only
     def pre_deployment_setup(self, project_name, services, deployment_output_path=None, **kwargs):
-        # Prior to running the playbook, install the ansible.kubernetes-modules role
+        # Prior to running the playbook, put the ansible.kubernetes-modules role next to it
 
         if not os.path.isdir(os.path.join(deployment_output_path, 'roles')):
             # Create roles subdirectory
             os.mkdir(os.path.join(deployment_output_path, 'roles'), 0o777)
 
-        role_path = os.path.join(deployment_output_path, 'roles', 'ansible.kubernetes-modules')
+        role_path = os.path.join(deployment_output_path, 'roles', K8S_MODULES_ROLE)
+        baked_path = os.path.join(CONDUCTOR_ROLES_PATH, K8S_MODULES_ROLE)
+        if os.path.isdir(baked_path):
+            # Copy the role from the Conductor image, replacing one left by a different version
+            baked_version = installed_role_version(baked_path)
+            if os.path.exists(role_path):
+                if installed_role_version(role_path) in (None, baked_version):
+                    return
+                shutil.rmtree(role_path)
+            logger.debug('Copying role from the Conductor image', role=K8S_MODULES_ROLE, version=baked_version)
+            shutil.copytree(baked_path, role_path, symlinks=True)
+            return
+
         if deployment_output_path and not os.path.exists(role_path):
-            # Install the role, if not already installed
-            ansible_cmd = "ansible-galaxy -vvv install -p ./roles ansible.kubernetes-modules"
+            # Conductor images built by earlier releases don't have the role. Install the pinned version.
+            ansible_cmd = "ansible-galaxy -vvv install -p ./roles %s,%s" % (K8S_MODULES_ROLE, K8S_MODULES_VERSION)
             logger.debug('Running ansible-galaxy', command=ansible_cmd, cwd=deployment_output_path)
             process = subprocess.Popen(ansible_cmd,
                                        shell=True,
@@ -112,12 +161,19 @@ class K8sBaseEngine(DockerEngine):
         # Mount the config_file to the conductor
         volumes[k8s_auth['config_file']] = {'bind': '/root/.kube/config', 'mode': 'ro'}
 
+        # check if we need to mount any other paths
+        path_params = ['config_file', 'ssl_ca_cert', 'cert_file', 'key_file']
         if k8s_auth:
-            # check if we need to mount any other paths
-            path_params = ['config_file', 'ssl_ca_cert', 'cert_file', 'key_file']
             for param in path_params:
                 if k8s_auth.get(param, None) is not None:
                     volumes[k8s_auth[param]] = {'bind': k8s_auth[param], 'mode': 'ro'}
+        # Files for other targets are mounted at the same path, and found through the settings
+        for target in config.get('settings', {}).get('k8s_targets') or []:
+            target_auth = target.get('k8s_auth') or {}
+            for param in path_params:
+                if target_auth.get(param):
+                    target_auth[param] = os.path.abspath(os.path.expanduser(target_auth[param]))
+                    volumes[target_auth[param]] = {'bind': target_auth[param], 'mode': 'ro'}
 
         # Add k8s_auth settings as environment variables in the conductor
         if not params.get('with_variables'):
@@ -131,18 +187,8 @@ class K8sBaseEngine(DockerEngine):
                                                         engine_name=engine_name,
                                                         volumes=volumes)
 
-    @conductor_only
-    def generate_orchestration_playbook(self, url=None, namespace=None, settings=None, repository_prefix=None,
-                                        pull_from_url=None, tag=None, vault_files=None, **kwargs):
-        """
-        Generate an Ansible playbook to orchestrate services.
-        :param url: registry URL where images were pushed.
-        :param namespace: registry namespace
-        :param repository_prefix: prefix to use for the image name
-        :param settings: settings dict from container.yml
-        :param pull_from_url: if url to pull from is different than url
-        :return: playbook dict
-        """
+    def _set_service_images(self, url=None, namespace=None, repository_prefix=None, pull_from_url=None, tag=None):
+        """ Set the image of each service, and of each container of multi-container services """
 
         def _update_service(service_name, service_config):
             if url and namespace:
@@ -188,6 +234,21 @@ class K8sBaseEngine(DockerEngine):
             else:
                 service['image'] = service['from']
 
+    @conductor_only
+    def generate_orchestration_playbook(self, url=None, namespace=None, settings=None, repository_prefix=None,
+                                        pull_from_url=None, tag=None, vault_files=None, **kwargs):
+        """
+        Generate an Ansible playbook to orchestrate services.
+        :param url: registry URL where images were pushed.
+        :param namespace: registry namespace
+        :param repository_prefix: prefix to use for the image name
+        :param settings: settings dict from container.yml
+        :param pull_from_url: if url to pull from is different than url
+        :return: playbook dict
+        """
+        self._set_service_images(url=url, namespace=namespace, repository_prefix=repository_prefix,
+                                 pull_from_url=pull_from_url, tag=tag)
+
         play = CommentedMap()
         play['name'] = u'Manage the lifecycle of {} on {}'.format(self.project_name, self.display_name)
         play['hosts'] = 'localhost'
@@ -197,7 +258,7 @@ class K8sBaseEngine(DockerEngine):
         play['vars_files'] = CommentedSeq()
         play['tasks'] = CommentedSeq()
         role = CommentedMap([
-            ('role', 'ansible.kubernetes-modules')
+            ('role', K8S_MODULES_ROLE)
         ])
         if vault_files:
             play['vars_files'].extend(vault_files)
@@ -219,3 +280,178 @@ class K8sBaseEngine(DockerEngine):
 
         logger.debug(u'Created playbook to run project', playbook=playbook)
         return playbook
+
+    def resource_waves(self, desired_state):
+        """
+        Group the tasks of the orchestration playbook for a desired state into waves of
+        independent resources: the namespace, then secrets and claims, then services, and
+        then deployments.
+        :return: list of lists of (state, resource, force) tuples
+        """
+        deploy = self.deploy
+        if desired_state == 'start':
+            waves = [[deploy.get_namespace_task(state='present')],
+                     list(deploy.get_secret_tasks()) + list(deploy.get_pvc_tasks()),
+                     list(deploy.get_service_tasks()),
+                     list(deploy.get_deployment_tasks())]
+        elif desired_state == 'stop':
+            waves = [list(deploy.get_deployment_tasks(engine_state='stop'))]
+        elif desired_state == 'restart':
+            waves = [list(deploy.get_deployment_tasks(engine_state='stop')),
+                     list(deploy.get_deployment_tasks())]
+        elif desired_state == 'destroy':
+            waves = [[deploy.get_namespace_task(state='absent')]]
+        else:
+            raise exceptions.AnsibleContainerException(u'Unknown desired state {}'.format(desired_state))
+        return [[resource_from_task(task) for task in wave] for wave in waves]
+
+    def _render_secrets(self, waves, vault_files=None, vault_password=None, vault_password_file=None):
+        """ Resolve the vault variables referenced by Secret resources """
+        from ansible.template import Templar
+
+        loader, variables = self._load_vault_variables(vault_files, vault_password=vault_password,
+                                                       vault_password_file=vault_password_file)
+        templar = Templar(loader=loader, variables=variables)
+        for wave in waves:
+            for state, resource, force in wave:
+                if resource['kind'] == 'Secret' and resource.get('data'):
+                    resource['data'] = templar.template(resource['data'])
+
+    def deployment_targets(self, names):
+        """
+        Look up targets by name in the k8s_targets setting. Anything a target leaves out of its
+        k8s_namespace comes from the project's. A target without k8s_auth uses the project's.
+        :return: list of dicts of name, namespace, display_name, description and k8s_auth
+        """
+        by_name = dict((target.get('name'), target) for target in self.targets)
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise exceptions.AnsibleContainerConfigException(
+                u'Targets not found in the k8s_targets setting: {}'.format(u', '.join(unknown)))
+        targets = []
+        for name in names:
+            k8s_namespace = by_name[name].get('k8s_namespace') or {}
+            targets.append(dict(name=name,
+                                namespace=k8s_namespace.get('name') or self.namespace_name,
+                                display_name=k8s_namespace.get('display_name') or self.namespace_display_name,
+                                description=k8s_namespace.get('description') or self.namespace_description,
+                                k8s_auth=by_name[name].get('k8s_auth')))
+        return targets
+
+    @staticmethod
+    def _target_client(target):
+        if target.get('k8s_auth'):
+            return K8sApiClient.from_settings(target['k8s_auth'])
+        return K8sApiClient.from_environment()
+
+    def _orchestrate_targets(self, desired_state, waves, targets):
+        """ Apply the same rendered waves to each target concurrently, and report on each """
+
+        def _apply(target):
+            start = time.time()
+            try:
+                results = WaveApplier(self._target_client(target)).run(
+                    retarget_waves(waves, target['namespace'], display_name=target['display_name'],
+                                   description=target['description']))
+                return target, summarize(results), round(time.time() - start, 2), None
+            except Exception as exc:
+                logger.debug(u'Orchestration failed', target=target['name'], exc_info=True)
+                return target, None, round(time.time() - start, 2), exc
+
+        pool = ThreadPool(len(targets))
+        try:
+            outcomes = pool.map(_apply, targets)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = []
+        plainLogger.info(u'%-20s %-24s %8s %8s %10s %8s %9s', u'TARGET', u'NAMESPACE', u'CREATED', u'UPDATED',
+                         u'UNCHANGED', u'DELETED', u'TIME')
+        for target, summary, seconds, error in outcomes:
+            if error is None:
+                plainLogger.info(u'%-20s %-24s %8d %8d %10d %8d %8.2fs', target['name'], target['namespace'],
+                                 summary['created'], summary['updated'], summary['unchanged'], summary['deleted'],
+                                 seconds)
+            else:
+                failed.append(target['name'])
+                plainLogger.info(u'%-20s %-24s failed after %.2fs: %s', target['name'], target['namespace'],
+                                 seconds, error)
+        if failed:
+            raise exceptions.AnsibleContainerDeployException(
+                u'Orchestration failed for targets: {}'.format(u', '.join(failed)))
+        logger.info(u'Orchestration finished for %d target(s)', len(targets), state=desired_state)
+        return dict((target['name'], seconds) for target, summary, seconds, error in outcomes)
+
+    @conductor_only
+    def orchestrate(self, desired_state, remove_orphans=False, url=None, namespace=None, repository_prefix=None,
+                    pull_from_url=None, tag=None, vault_files=None, vault_password=None, vault_password_file=None,
+                    targets=None, **kwargs):
+        """
+        Apply the resources for the desired state straight to the API server, one wave at a time,
+        with the resources in each wave applied concurrently. Given the names of k8s_targets, the
+        resources are rendered once and applied to all of the targets at the same time, and the
+        seconds taken by each target are returned.
+        """
+        if desired_state in ('start', 'restart'):
+            self._set_service_images(url=url, namespace=namespace, repository_prefix=repository_prefix,
+                                     pull_from_url=pull_from_url, tag=tag)
+        waves = self.resource_waves(desired_state)
+        if desired_state == 'start' and self.secrets:
+            self._render_secrets(waves, vault_files=vault_files, vault_password=vault_password,
+                                 vault_password_file=vault_password_file)
+        if targets:
+            return self._orchestrate_targets(desired_state, waves, self.deployment_targets(targets))
+        applier = WaveApplier(K8sApiClient.from_environment())
+        start = time.time()
+        results = applier.run(waves)
+        logger.info(u'Orchestration finished in %.2fs', time.time() - start, state=desired_state,
+                    resources=len(results),
+                    slowest=[(u'%s/%s' % (kind, name), seconds)
+                             for kind, name, outcome, seconds in sorted(results, key=lambda r: -r[3])[:5]])
+        summary = summarize(results)
+        plainLogger.info(u'Created: %d, updated: %d, unchanged: %d, deleted: %d', summary['created'],
+                         summary['updated'], summary['unchanged'], summary['deleted'])
+        return dict((u'%s/%s' % (kind, name), seconds) for kind, name, outcome, seconds in results)
+
+    @conductor_only
+    def wait_for_rollout(self, timeout=None, targets=None, **kwargs):
+        """
+        Follow the rollout of each deployment through watch streams, reporting progress as it
+        changes, until all of them are ready. Given the names of k8s_targets, the targets are
+        followed at the same time, and a dict of results is returned for each.
+        """
+        resources = []
+        for template in self.deploy.get_deployment_templates():
+            template.pop('force', None)
+            resources.append(template)
+        if not resources:
+            return {}
+        if not targets:
+            ready = RolloutWatcher(K8sApiClient.from_environment(), timeout=timeout).wait(resources)
+            plainLogger.info(u'%-30s %10s', u'SERVICE', u'READY')
+            for name, seconds in sorted(ready.items(), key=lambda item: item[1]):
+                plainLogger.info(u'%-30s %9.2fs', name, seconds)
+            return ready
+
+        def _wait(target):
+            retargeted = copy.deepcopy(resources)
+            for resource in retargeted:
+                resource['metadata']['namespace'] = target['namespace']
+            try:
+                return target['name'], RolloutWatcher(self._target_client(target), timeout=timeout).wait(retargeted)
+            except exceptions.AnsibleContainerDeployException as exc:
+                raise exceptions.AnsibleContainerDeployException(u'{}: {}'.format(target['name'], exc))
+
+        targets = self.deployment_targets(targets)
+        pool = ThreadPool(len(targets))
+        try:
+            ready = dict(pool.map(_wait, targets))
+        finally:
+            pool.close()
+            pool.join()
+        plainLogger.info(u'%-20s %-30s %10s', u'TARGET', u'SERVICE', u'READY')
+        for target in targets:
+            for name, seconds in sorted(ready[target['name']].items(), key=lambda item: item[1]):
+                plainLogger.info(u'%-20s %-30s %9.2fs', target['name'], name, seconds)
+        return ready
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Wait for Deployments and DeploymentConfigs to finish rolling out, following watch streams on
+them and on their pods rather than polling each object.
+"""
+
+from __future__ import absolute_import
+
+from container.utils.visibility import getLogger
+logger = getLogger(__name__)
+
+import threading
+import time
+
+from six.moves import queue
+from six.moves.urllib.parse import urlencode
+
+from container import exceptions
+from container.k8s.apply import camel_kind, resource_path
+
+DEFAULT_ROLLOUT_TIMEOUT = 600
+
+# Container waiting reasons that won't resolve without a change to the deployment
+FAILURE_REASONS = frozenset(['CrashLoopBackOff', 'ErrImagePull', 'ImagePullBackOff', 'InvalidImageName',
+                             'CreateContainerConfigError', 'CreateContainerError', 'RunContainerError'])
+
+
+def rollout_status(resource):
+    """
+    Rollout progress of a Deployment or DeploymentConfig.
+    :return: (ready, updated, available, desired) tuple
+    """
+    metadata = resource.get('metadata') or {}
+    spec = resource.get('spec') or {}
+    status = resource.get('status') or {}
+    desired = spec.get('replicas', 1)
+    updated = status.get('updatedReplicas', 0)
+    available = status.get('availableReplicas', 0)
+    observed = status.get('observedGeneration', 0) >= metadata.get('generation', 0)
+    ready = (observed and updated >= desired and available >= desired and
+             status.get('replicas', 0) <= desired)
+    return ready, updated, available, desired
+
+
+def pod_failure(pod):
+    """ Why a pod's containers are failing to start, or None """
+    if (pod.get('metadata') or {}).get('deletionTimestamp'):
+        return None
+    status = pod.get('status') or {}
+    for container in (status.get('initContainerStatuses') or []) + (status.get('containerStatuses') or []):
+        waiting = (container.get('state') or {}).get('waiting') or {}
+        if waiting.get('reason') in FAILURE_REASONS:
+            return u'{} in container {}: {}'.format(waiting['reason'], container.get('name'),
+                                                     waiting.get('message', ''))
+    return None
+
+
+class RolloutWatcher(object):
+    """
+    Follows one watch stream per kind and namespace of the deployments being rolled out, and one
+    per namespace for their pods, until every rollout completes, a pod fails to start, or the
+    timeout passes.
+    """
+
+    def __init__(self, client, timeout=None):
+        self.client = client
+        self.timeout = timeout or DEFAULT_ROLLOUT_TIMEOUT
+        self._stopped = threading.Event()
+
+    def _follow(self, kind, path, events, **params):
+        """ List a collection, then watch it from there, putting (kind, type, object) events on the queue """
+        resource_version = None
+        try:
+            while not self._stopped.is_set():
+                if resource_version is None:
+                    listing = self.client.request('GET', path + ('?' + urlencode(params) if params else ''))
+                    for item in listing.get('items') or []:
+                        events.put((kind, 'ADDED', item))
+                    resource_version = (listing.get('metadata') or {}).get('resourceVersion')
+                for event_type, obj in self.client.watch(path, resource_version, timeout=self.timeout,
+                                                         **dict(params)):
+                    if self._stopped.is_set():
+                        return
+                    if event_type == 'ERROR':
+                        # Most likely the resource version expired. Start over from a fresh list.
+                        resource_version = None
+                        break
+                    resource_version = (obj.get('metadata') or {}).get('resourceVersion', resource_version)
+                    events.put((kind, event_type, obj))
+        except Exception as exc:
+            if not self._stopped.is_set():
+                events.put((None, 'ERROR', exc))
+
+    def wait(self, resources):
+        """
+        :param resources: Deployment or DeploymentConfig definitions
+        :return: dict of seconds until each deployment was ready, by name
+        """
+        pending = {}
+        streams = set()
+        for resource in resources:
+            kind = camel_kind(resource['kind'])
+            namespace = resource['metadata'].get('namespace')
+            pending[(kind, resource['metadata']['name'])] = namespace
+            app = (resource['metadata'].get('labels') or {}).get('app', namespace)
+            streams.add((kind, resource_path(resource['apiVersion'], kind, namespace), ()))
+            streams.add(('Pod', resource_path('v1', 'Pod', namespace), (('labelSelector', 'app=%s' % app),)))
+
+        events = queue.Queue()
+        for kind, path, params in sorted(streams):
+            thread = threading.Thread(target=self._follow, args=(kind, path, events), kwargs=dict(params))
+            # Blocked reads on a stream end when the server closes it, or with the process
+            thread.daemon = True
+            thread.start()
+
+        start = time.time()
+        ready = {}
+        progress = {}
+        try:
+            while len(ready) < len(pending):
+                remaining = start + self.timeout - time.time()
+                if remaining <= 0:
+                    raise exceptions.AnsibleContainerDeployException(
+                        u'Timed out after {}s waiting for {} to be ready'.format(
+                            self.timeout, u', '.join(sorted(name for key, name in set(pending) - set(ready)))))
+                try:
+                    kind, event_type, obj = events.get(timeout=min(remaining, 1))
+                except queue.Empty:
+                    continue
+                if event_type == 'ERROR':
+                    raise obj
+                metadata = obj.get('metadata') or {}
+                if kind == 'Pod':
+                    service = (metadata.get('labels') or {}).get('service')
+                    failure = event_type != 'DELETED' and pod_failure(obj)
+                    if failure and any(name == service for key, name in pending):
+                        raise exceptions.AnsibleContainerDeployException(
+                            u'{} failed to start: {}'.format(service, failure))
+                    continue
+                key = (kind, metadata.get('name'))
+                if key not in pending or key in ready:
+                    continue
+                is_ready, updated, available, desired = rollout_status(obj)
+                if progress.get(key) != (updated, available):
+                    progress[key] = (updated, available)
+                    logger.info(u'%s: %d of %d replicas updated, %d available', key[1], updated, desired,
+                                available, kind=kind)
+                if is_ready:
+                    ready[key] = round(time.time() - start, 2)
+                    logger.info(u'%s is ready after %.2fs', key[1], ready[key], kind=kind)
+        finally:
+            self._stopped.set()
+        return dict((name, seconds) for (kind, name), seconds in ready.items())
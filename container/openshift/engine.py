@@ -3,6 +3,7 @@ from __future__ import absolute_import
 
 from .deploy import Deploy
 from ..k8s.base_engine import K8sBaseEngine
+from ..k8s.apply import resource_from_task
 
 from container import conductor_only, __version__
 
@@ -54,3 +55,10 @@ class Engine(K8sBaseEngine):
         if routes:
             playbook[0]['tasks'].extend(routes)
         return playbook
+
+    def resource_waves(self, desired_state):
+        waves = super(Engine, self).resource_waves(desired_state)
+        if desired_state == 'start':
+            # Routes only depend on the services they point at
+            waves[-1].extend(resource_from_task(task) for task in self.deploy.get_route_tasks())
+        return waves
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Ansible plugins loaded by ansible-playbook runs inside the Conductor
+"""
+from __future__ import absolute_import
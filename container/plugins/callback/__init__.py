@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import os
+
+CALLBACK_PLUGINS_PATH = os.path.dirname(os.path.abspath(__file__))
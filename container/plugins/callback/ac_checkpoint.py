@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    callback: ac_checkpoint
+    type: notification
+    short_description: Commit checkpoints of the build container while a role is applied
+    description:
+      - Used by Ansible Container during builds. Every N tasks, or after any task carrying
+        the checkpoint tag, the build container is committed as a checkpoint image labeled
+        with the layer fingerprint and the name of the next task to run.
+      - When a later build of the same layer finds a checkpoint, it resumes the role from that
+        task with --start-at-task rather than applying the whole role again.
+    requirements:
+      - ANSIBLE_CONTAINER_CHECKPOINT_* environment variables set by the Conductor
+'''
+
+import os
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'notification'
+    CALLBACK_NAME = 'ac_checkpoint'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+        self.engine_name = os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_ENGINE')
+        self.project_name = os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_PROJECT')
+        self.container_id = os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_CONTAINER')
+        self.fingerprint = os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_FINGERPRINT')
+        self.every = int(os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_EVERY') or 0)
+        self.tag = os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_TAG') or None
+        # Continue numbering from the checkpoint we resumed from, if any
+        self.index = int(os.environ.get('ANSIBLE_CONTAINER_CHECKPOINT_INDEX') or 0)
+        self.disabled = not (self.container_id and self.fingerprint and (self.every or self.tag))
+
+        self._engine = None
+        self._previous_task = None
+        self._tasks_since_checkpoint = 0
+        self._checkpoint_due = False
+        self._seen_task_names = set()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from container.utils.loader import load_engine
+            self._engine = load_engine(['BUILD'], self.engine_name, self.project_name, {})
+        return self._engine
+
+    def _checkpoint(self, start_at_task):
+        self.index += 1
+        try:
+            image_id = self.engine.commit_checkpoint(self.container_id, self.fingerprint,
+                                                     start_at_task, self.index)
+        except Exception as exc:
+            self._display.warning(u'Failed to commit build checkpoint: %s' % exc)
+            return
+        self._display.display(u'Checkpoint %s committed as %s. Resume point: %s' % (
+            self.index, image_id, start_at_task))
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        if self.disabled:
+            return
+        task_name = task.get_name().strip()
+        if self._previous_task is not None:
+            self._tasks_since_checkpoint += 1
+            if self.every and self._tasks_since_checkpoint >= self.every:
+                self._checkpoint_due = True
+            if self.tag and self.tag in (self._previous_task.tags or []):
+                self._checkpoint_due = True
+        # --start-at-task resumes at the first task matching the name, so only a task whose
+        # name hasn't been seen yet in this run can safely serve as a resume point.
+        if self._checkpoint_due and task_name not in self._seen_task_names:
+            self._checkpoint(task_name)
+            self._checkpoint_due = False
+            self._tasks_since_checkpoint = 0
+        self._seen_task_names.add(task_name)
+        self._previous_task = task
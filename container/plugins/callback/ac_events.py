@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    callback: ac_events
+    type: stdout
+    short_description: Emit playbook progress as JSON events
+    description:
+      - Used by Ansible Container. Writes one JSON event per line to stdout for playbook
+        start and end, task start, and the result of each task on each host, including
+        its status and duration. Each line is prefixed with a marker, so the host can pick
+        the events out of the Conductor's log stream.
+      - Replaces the default stdout callback, so the events are all that's shown of the run,
+        apart from warnings and errors. A failed task's event carries its error message.
+'''
+
+import json
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+from container.utils.events import EVENT_MARKER
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'stdout'
+    CALLBACK_NAME = 'ac_events'
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+        self._playbook = None
+        self._play = None
+        self._task_started = {}
+
+    def _emit(self, event, **data):
+        data.update(event=event, ts=round(time.time(), 3))
+        self._display.display(EVENT_MARKER + json.dumps(data, sort_keys=True))
+
+    def v2_playbook_on_start(self, playbook):
+        self._playbook = getattr(playbook, '_file_name', None)
+        self._emit('playbook_start', playbook=self._playbook)
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = play.get_name().strip()
+        self._emit('play_start', play=self._play)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._task_started[task._uuid] = time.time()
+        self._emit('task_start', task=task.get_name().strip(), task_id=task._uuid,
+                   action=task.action, play=self._play)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def _task_end(self, result, status):
+        task = result._task
+        started = self._task_started.get(task._uuid)
+        data = {}
+        if status in ('failed', 'unreachable'):
+            # With the default stdout callback replaced, this is the only place the error shows
+            data['msg'] = result._result.get('msg') or result._result.get('stderr') or ''
+        self._emit('task_end',
+                   task=task.get_name().strip(),
+                   task_id=task._uuid,
+                   action=task.action,
+                   host=result._host.get_name(),
+                   status=status,
+                   changed=bool(result._result.get('changed', False)),
+                   failed=status in ('failed', 'unreachable'),
+                   duration=round(time.time() - started, 3) if started else None,
+                   **data)
+
+    def v2_runner_on_ok(self, result):
+        self._task_end(result, 'changed' if result._result.get('changed', False) else 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._task_end(result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self._task_end(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self._task_end(result, 'unreachable')
+
+    def v2_playbook_on_stats(self, stats):
+        self._emit('playbook_end', playbook=self._playbook,
+                   stats=dict((host, stats.summarize(host)) for host in sorted(stats.processed.keys())))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    callback: ac_stats
+    type: aggregate
+    short_description: Hand the per-host summary of a playbook run to Ansible Container
+    description:
+      - Used by Ansible Container when the Conductor runs playbooks in its own process.
+        At the end of each playbook, the ok, changed, failures, unreachable and skipped
+        counts for every host are recorded, to be returned along with the exit code.
+'''
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'ac_stats'
+
+    def v2_playbook_on_stats(self, stats):
+        from container.utils.executor import record_stats
+        record_stats(dict((host, stats.summarize(host))
+                          for host in sorted(stats.processed.keys())))
@@ -8,6 +8,7 @@ import os
 import hashlib
 import importlib
 import json
+import zlib
 
 from datetime import datetime
 from distutils import dir_util
@@ -19,6 +20,8 @@ from six import iteritems, string_types, text_type
 from ..exceptions import AnsibleContainerException, \
     AnsibleContainerNotInitializedException
 from .temp import MakeTempDir
+from .ignore import PathIgnorer
+from .merkle import TreeHasher
 from . import _text as text
 import container
 
@@ -43,7 +46,8 @@ __all__ = ['conductor_dir', 'make_temp_dir', 'get_config', 'assert_initialized',
            'get_role_fingerprint', 'get_content_from_role',
            'get_metadata_from_role', 'get_defaults_from_role', 'text',
            'ordereddict_to_list', 'list_to_ordereddict', 'modules_to_install',
-           'roles_to_install', 'ansible_config_exists', 'create_file']
+           'roles_to_install', 'ansible_config_exists', 'create_file',
+           'parse_port_ranges', 'encode_conductor_payload', 'decode_conductor_payload']
 
 conductor_dir = os.path.dirname(container.__file__)
 make_temp_dir = MakeTempDir
@@ -106,22 +110,42 @@ def jinja_render_to_temp(template_dir, template_file, temp_dir, dest_file, **con
         rendered.encode('utf8'))
 
 
+def parse_port_ranges(list_of_ports):
+    """
+    The container side of port specs like 8080, '80:8080/udp' or '10000-20000:10000-20000',
+    as a sorted list of (low, high, protocol) ranges, with overlapping and adjacent ranges of
+    the same protocol merged. Ranges are never expanded.
+    """
+    by_protocol = {}
+    for port_spec in map(text_type, list_of_ports):
+        exposed_ports = port_spec.rsplit(':', 1)[-1]
+        protocol = 'tcp'
+        if '/' in exposed_ports:
+            exposed_ports, protocol = exposed_ports.split('/')
+        low, _, high = exposed_ports.partition('-')
+        by_protocol.setdefault(protocol, []).append((int(low), int(high or low)))
+
+    merged = []
+    for protocol, ranges in sorted(iteritems(by_protocol)):
+        ranges.sort()
+        start, end = ranges[0]
+        for low, high in ranges[1:]:
+            if low <= end + 1:
+                end = max(end, high)
+            else:
+                merged.append((start, end, protocol))
+                start, end = low, high
+        merged.append((start, end, protocol))
+    return merged
+
+
 def metadata_to_image_config(metadata):
 
     def ports_to_exposed_ports(list_of_ports):
-        to_return = {}
-        for port_spec in map(text_type, list_of_ports):
-            exposed_ports = port_spec.rsplit(':', 1)[-1]
-            protocol = 'tcp'
-            if '/' in exposed_ports:
-                exposed_ports, protocol = exposed_ports.split('/')
-            if '-' in exposed_ports:
-                low, high = exposed_ports.split('-', 1)
-                for port in range(int(low), int(high)+1):
-                    to_return['{}/{}'.format(str(port), protocol)] = {}
-            else:
-                to_return['{}/{}'.format(exposed_ports, protocol)] = {}
-        return to_return
+        # The image config has no notion of a range, so each port gets its own entry
+        return dict(('{}/{}'.format(port, protocol), {})
+                    for low, high, protocol in parse_port_ranges(list_of_ports)
+                    for port in range(low, high + 1))
 
     def format_environment(environment):
         to_return = dict(
@@ -253,37 +277,32 @@ def generate_playbook_for_role(service_name, vars, role):
     return playbook
 
 @container.conductor_only
-def get_role_fingerprint(role, service_name, config_vars):
+def get_role_fingerprint(role, service_name, config_vars, base_path='/src', hasher=None):
     """
     Given a role definition from a service's list of roles, returns a hexdigest based on the role definition,
-    the role contents, and the hexdigest of each dependency
+    the role contents, and the hexdigest of each dependency. Paths matching the project's .dockerignore or
+    .acignore patterns are left out.
+
+    Pass the same hasher for every role in a build, so that content shared between roles, like a common
+    dependency, is only hashed once.
     """
-    def hash_file(hash_obj, file_path):
-        blocksize = 64 * 1024
-        with open(file_path, 'rb') as ifs:
-            while True:
-                data = ifs.read(blocksize)
-                if not data:
-                    break
-                hash_obj.update(data)
-                hash_obj.update('::')
-
-    def hash_dir(hash_obj, dir_path):
-        for root, dirs, files in os.walk(dir_path, topdown=True):
-            for file_path in files:
-                abs_file_path = os.path.join(root, file_path)
-                hash_obj.update(abs_file_path)
-                hash_obj.update('::')
-                hash_file(hash_obj, abs_file_path)
-
-    def hash_role(hash_obj, role_path):
+    if hasher is None:
+        hasher = TreeHasher(PathIgnorer.from_project(base_path))
+
+    def hash_role(role_path):
         # Role content is easy to hash - the hash of the role content with the
         # hash of any role dependencies it has
-        hash_dir(hash_obj, role_path)
+        hash_obj = hashlib.sha256()
+        hash_obj.update(text.to_bytes(hasher.dir_digest(role_path)))
         for dependency in get_dependencies_for_role(role_path):
             if dependency:
-                dependency_path = resolve_role_to_path(dependency)
-                hash_role(hash_obj, dependency_path)
+                dependency_path = os.path.realpath(resolve_role_to_path(dependency))
+                hash_obj.update(b'::')
+                hash_obj.update(text.to_bytes(hasher.memoize(('role', dependency_path), hash_role,
+                                                             dependency_path)))
+        return hash_obj.hexdigest()
+
+    def hash_file_references(hash_obj):
         # However tasks within that role might reference files outside of the
         # role, like source code
         loader = DataLoader()
@@ -299,11 +318,9 @@ def get_role_fingerprint(role, service_name, config_vars):
             if task.action in FILE_COPY_MODULES:
                 src = task.args.get('src')
                 if not os.path.exists(src) or not src.startswith(('/', '..')): continue
-                src = os.path.realpath(src)
-                if os.path.isfile(src):
-                    hash_file(hash_obj, src)
-                else:
-                    hash_dir(hash_obj, src)
+                digest = hasher.path_digest(os.path.realpath(src))
+                if digest:
+                    hash_obj.update(text.to_bytes(src) + b'::' + text.to_bytes(digest) + b'::')
 
     def get_dependencies_for_role(role_path):
         meta_main_path = os.path.join(role_path, 'meta', 'main.yml')
@@ -318,9 +335,12 @@ def get_role_fingerprint(role, service_name, config_vars):
 
     hash_obj = hashlib.sha256()
     # Account for variables passed to the role by including the invocation string
-    hash_obj.update((json.dumps(role) if not isinstance(role, string_types) else role) + '::')
+    hash_obj.update(text.to_bytes((json.dumps(role, sort_keys=True) if not isinstance(role, string_types)
+                                   else role) + '::'))
     # Add each of the role's files and directories
-    hash_role(hash_obj, resolve_role_to_path(role))
+    role_path = os.path.realpath(resolve_role_to_path(role))
+    hash_obj.update(text.to_bytes(hasher.memoize(('role', role_path), hash_role, role_path)))
+    hash_file_references(hash_obj)
     return hash_obj.hexdigest()
 
 
@@ -368,6 +388,50 @@ def list_to_ordereddict(config):
             result[key] = value
     return result
 
+
+# Bump when the layout of the Conductor payload changes
+CONDUCTOR_PAYLOAD_VERSION = 1
+
+
+@container.host_only
+def encode_conductor_payload(config, params):
+    # Compressed JSON with the config and command parameters for the Conductor. Dicts, ordered
+    # or not, are written in order, and read back in order.
+    payload = json.dumps(dict(version=CONDUCTOR_PAYLOAD_VERSION, config=config, params=params),
+                         separators=(',', ':'))
+    return zlib.compress(payload.encode('utf-8'))
+
+
+def _plain_dicts(value):
+    # Nested ordereddicts would be dumped into playbooks as !!omap, which Ansible reads as a list
+    if isinstance(value, dict):
+        return dict((key, _plain_dicts(item)) for key, item in iteritems(value))
+    if isinstance(value, list):
+        return [_plain_dicts(item) for item in value]
+    return value
+
+
+@container.conductor_only
+def decode_conductor_payload(data):
+    # Returns the config and the command parameters. As with list_to_ordereddict, the order of
+    # the config's top-level sections and of the keys in each is preserved, and deeper mappings
+    # are plain dicts.
+    payload = json.loads(zlib.decompress(data).decode('utf-8'), object_pairs_hook=yaml.compat.ordereddict)
+    if payload.get('version') != CONDUCTOR_PAYLOAD_VERSION:
+        raise AnsibleContainerException(
+            u'The Conductor received a payload of version {}, but reads version {}. Make sure the '
+            u'Conductor image was built with this version of Ansible Container.'.format(
+                payload.get('version'), CONDUCTOR_PAYLOAD_VERSION))
+    config = yaml.compat.ordereddict()
+    for key, value in iteritems(payload['config']):
+        if isinstance(value, dict):
+            config[key] = yaml.compat.ordereddict(
+                (section_key, _plain_dicts(item)) for section_key, item in iteritems(value))
+        else:
+            config[key] = _plain_dicts(value)
+    return config, _plain_dicts(payload['params'])
+
+
 @container.host_only
 def roles_to_install(base_path):
     path = os.path.join(base_path, 'requirements.yml')
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import io
+import json
+
+from six import iteritems
+
+from ._text import to_text
+
+# Prefix marking a line of Conductor output as a JSON event, written by the
+# ac_events callback plugin, which imports it from here
+EVENT_MARKER = u'@@ac-event@@ '
+
+
+def parse_event(message):
+    """ Return the event dict carried by a line of Conductor output, or None """
+    idx = message.find(EVENT_MARKER)
+    if idx == -1:
+        return None
+    try:
+        event = json.loads(message[idx + len(EVENT_MARKER):])
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def render_event(event):
+    """ Return a compact, one line summary of an event, or None if it isn't worth showing """
+    kind = event.get('event')
+    if kind == 'task_end':
+        duration = event.get('duration')
+        line = u'{status:<11} {host:<24} {duration:>8}  {task}'.format(
+            status=event.get('status', ''),
+            host=event.get('host', ''),
+            duration=u'%.2fs' % duration if duration is not None else u'-',
+            task=event.get('task', ''))
+        if event.get('msg'):
+            line += u'\n{:<11} {}'.format(u'', event['msg'])
+        return line
+    if kind == 'play_start':
+        return u'PLAY {}'.format(event.get('play', ''))
+    if kind == 'playbook_end':
+        return u'\n'.join(
+            u'RECAP {host:<24} ok={ok} changed={changed} failed={failures} '
+            u'unreachable={unreachable} skipped={skipped}'.format(host=host, **summary)
+            for host, summary in sorted(iteritems(event.get('stats') or {})))
+    return None
+
+
+class EventLog(object):
+    """
+    Stands in for the logger receiving the Conductor's output. Lines carrying an event are
+    appended to an NDJSON file and shown as a compact progress line. All other output is
+    passed through to log_obj unchanged. The LogMultiplexer closes it once the output ends.
+    """
+
+    def __init__(self, path, log_obj):
+        self.path = path
+        self.log_obj = log_obj
+        self.ofs = io.open(path, 'a', encoding='utf-8')
+
+    def info(self, message):
+        event = parse_event(message)
+        if event is None:
+            self.log_obj.info(message)
+            return
+        self.ofs.write(to_text(json.dumps(event, sort_keys=True)) + u'\n')
+        self.ofs.flush()
+        line = render_event(event)
+        if line:
+            self.log_obj.info(line)
+
+    def close(self):
+        self.ofs.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from .visibility import getLogger
+logger = getLogger(__name__)
+
+import shlex
+
+from ansible import constants as C
+from ansible.cli import CLI
+from ansible.cli.playbook import PlaybookCLI
+from ansible.executor.playbook_executor import PlaybookExecutor
+from ansible.inventory.manager import InventoryManager
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import callback_loader
+from ansible.utils.vars import load_extra_vars, load_options_vars
+
+try:
+    from ansible.vars.manager import VariableManager
+except ImportError:
+    # Prior to ansible/ansible@8f97aef1a365, this was not in its own module
+    from ansible.vars import VariableManager
+
+from ..plugins.callback import CALLBACK_PLUGINS_PATH
+
+# Summaries recorded by the ac_stats callback plugin, one per playbook run
+_playbook_stats = []
+
+
+def record_stats(stats):
+    """
+    Called by the ac_stats callback plugin from v2_playbook_on_stats, with a dict of host
+    name to that host's summary.
+    """
+    _playbook_stats.append(stats)
+
+
+class PlaybookResult(int):
+    """
+    The exit code of a playbook run, carrying the per-host summary gathered by Ansible
+    (ok, changed, failures, unreachable, skipped) when it's available.
+    """
+
+    def __new__(cls, return_code, stats=None):
+        result = super(PlaybookResult, cls).__new__(cls, return_code)
+        result.stats = stats
+        return result
+
+    @property
+    def changed(self):
+        return sum(summary['changed'] for summary in (self.stats or {}).values())
+
+
+class InProcessPlaybookRunner(object):
+    """
+    Runs playbooks through Ansible's executor API within the Conductor's own process,
+    rather than starting ansible-playbook for each one. The loader, inventory and variable
+    manager, and with them the plugins Ansible has already loaded, are reused from one run
+    to the next. Hosts are added to the inventory as they are seen, and point at whichever
+    container they were handed on the latest run.
+    """
+
+    def __init__(self):
+        self.loader = DataLoader()
+        self.inventory = InventoryManager(loader=self.loader, sources=None)
+        self.variable_manager = VariableManager(loader=self.loader, inventory=self.inventory)
+        self.variable_manager.safe_basedir = True
+        callback_loader.add_directory(CALLBACK_PLUGINS_PATH)
+
+    @staticmethod
+    def supports(callbacks=None, extra_env=None, event_log=None):
+        """
+        Whether a run can happen in process. Callback plugins, the event log among them, and
+        extra environment are configured through the environment, which only a fresh
+        ansible-playbook process picks up.
+        """
+        return not (callbacks or extra_env or event_log)
+
+    def _parse_options(self, playbook_path, ansible_options):
+        cli = PlaybookCLI(['ansible-playbook'] + shlex.split(ansible_options) + [playbook_path])
+        cli.parse()
+        return cli.options
+
+    def _update_inventory(self, service_map, python_interpreter, options):
+        for service_name, container_id in service_map.items():
+            if not self.inventory.get_host(service_name):
+                self.inventory.add_host(service_name, group='all')
+            host = self.inventory.get_host(service_name)
+            host.set_variable('ansible_host', container_id)
+            if python_interpreter:
+                host.set_variable('ansible_python_interpreter', python_interpreter)
+            # Facts belong to the container the host pointed at previously
+            self.variable_manager.clear_facts(service_name)
+        self.inventory.remove_restriction()
+        self.inventory.clear_pattern_cache()
+        self.inventory.subset(options.subset)
+
+    def run(self, playbook_path, service_map, ansible_options='', python_interpreter=None):
+        """
+        Run a playbook against the containers in service_map.
+
+        :param playbook_path: path to the playbook file
+        :param service_map: dict of service name to container ID
+        :param ansible_options: additional ansible-playbook commandline options, as a string
+        :param python_interpreter: value for ansible_python_interpreter, or None to use the target's
+        :return: PlaybookResult
+        """
+        options = self._parse_options(playbook_path, ansible_options)
+        if options.vault_password_files or options.vault_ids:
+            self.loader.set_vault_secrets(CLI.setup_vault_secrets(
+                self.loader,
+                vault_ids=C.DEFAULT_VAULT_IDENTITY_LIST + options.vault_ids,
+                vault_password_files=options.vault_password_files,
+                ask_vault_pass=False,
+                auto_prompt=False))
+        self._update_inventory(service_map, python_interpreter, options)
+        self.variable_manager.extra_vars = load_extra_vars(loader=self.loader, options=options)
+        self.variable_manager.options_vars = load_options_vars(options, CLI.version_info(gitinfo=False))
+
+        logger.debug(u'Running playbook in process', playbook=playbook_path, options=ansible_options)
+        executor = PlaybookExecutor(playbooks=[playbook_path], inventory=self.inventory,
+                                    variable_manager=self.variable_manager, loader=self.loader,
+                                    options=options, passwords={})
+        del _playbook_stats[:]
+        return_code = executor.run()
+        stats = _playbook_stats[-1] if _playbook_stats else None
+        return PlaybookResult(return_code, stats=stats)
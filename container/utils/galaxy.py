@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import hashlib
 import shutil
 import os
+import tempfile
+
+from distutils.version import LooseVersion
+from multiprocessing.pool import ThreadPool
 
 import ansible.constants as C
+from ansible.errors import AnsibleError
 from ansible.galaxy import Galaxy
+from ansible.galaxy.api import GalaxyAPI
 from ansible.galaxy.role import GalaxyRole
 from ansible.playbook.role.requirement import RoleRequirement
 
@@ -20,6 +27,11 @@ logger = getLogger(__name__)
 
 ANSIBLE_CONTAINER_PATH = '/_src'
 
+ARCHIVE_EXTENSIONS = ('.tar.gz', '.tgz', '.tar')
+
+# Roles downloaded at the same time
+DEFAULT_WORKERS = 4
+
 
 class AttrDict(dict):
     def __init__(self, *args, **kwargs):
@@ -47,10 +59,96 @@ class InCaseOfFail(object):
                         os.path.join(ANSIBLE_CONTAINER_PATH, yml_file))
 
 
+class RoleArchiveCache(object):
+    """
+    Role tarballs stored under the SHA256 digest of their content, with a reference from each
+    role name and version to its tarball. Directories of tarballs named <role>-<version>.tar.gz
+    can be consulted as well, for installing without network access.
+    """
+
+    def __init__(self, path=None, archive_dirs=None):
+        self.path = path
+        self.archive_dirs = archive_dirs or []
+
+    def _ref_path(self, name, version):
+        return os.path.join(self.path, 'refs', name, version)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', 'sha256', digest)
+
+    def get(self, name, version):
+        """ Path to the tarball for a role version, or None """
+        if self.path and os.path.isfile(self._ref_path(name, version)):
+            with open(self._ref_path(name, version)) as ifs:
+                blob_path = self._blob_path(ifs.read().strip())
+            if os.path.isfile(blob_path):
+                return blob_path
+        for archive_dir in self.archive_dirs:
+            for ext in ARCHIVE_EXTENSIONS:
+                archive_path = os.path.join(archive_dir, '%s-%s%s' % (name, version, ext))
+                if os.path.isfile(archive_path):
+                    return archive_path
+        return None
+
+    def versions(self, name):
+        """ Versions of a role available without network access """
+        versions = set()
+        if self.path and os.path.isdir(os.path.join(self.path, 'refs', name)):
+            versions.update(os.listdir(os.path.join(self.path, 'refs', name)))
+        prefix = name + '-'
+        for archive_dir in self.archive_dirs:
+            if not os.path.isdir(archive_dir):
+                continue
+            for filename in os.listdir(archive_dir):
+                for ext in ARCHIVE_EXTENSIONS:
+                    if filename.startswith(prefix) and filename.endswith(ext):
+                        versions.add(filename[len(prefix):-len(ext)])
+        return sorted(versions, key=LooseVersion)
+
+    def put(self, name, version, archive_path):
+        """ Store a downloaded tarball, returning its path in the cache """
+        if not self.path:
+            return archive_path
+        digest = hashlib.sha256()
+        with open(archive_path, 'rb') as ifs:
+            for chunk in iter(lambda: ifs.read(1024 * 1024), b''):
+                digest.update(chunk)
+        blob_path = self._blob_path(digest.hexdigest())
+        ref_path = self._ref_path(name, version)
+        for dir_path in (os.path.dirname(blob_path), os.path.dirname(ref_path)):
+            if not os.path.isdir(dir_path):
+                try:
+                    os.makedirs(dir_path)
+                except OSError:
+                    # Created by another download in the meantime
+                    pass
+        # Write to a temporary name and rename, so concurrent installs never see a partial file
+        if not os.path.isfile(blob_path):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+            os.close(fd)
+            shutil.copyfile(archive_path, tmp_path)
+            os.rename(tmp_path, blob_path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(ref_path))
+        with os.fdopen(fd, 'w') as ofs:
+            ofs.write(digest.hexdigest())
+        os.rename(tmp_path, ref_path)
+        return blob_path
+
+
 class AnsibleContainerGalaxy(object):
     _galaxy = None
 
+    def __init__(self, cache_path=None, archive_dirs=None, offline=False, workers=None):
+        self.cache = RoleArchiveCache(cache_path, archive_dirs)
+        self.offline = offline
+        self.workers = workers or DEFAULT_WORKERS
+
     def install(self, roles):
+        """
+        Install roles and their dependencies, a level of the dependency tree at a time. Roles in
+        each level are downloaded in parallel, before container.yml and requirements.yml are
+        updated for them in turn.
+        """
         roles_to_install = list(roles)
         with MakeTempDir() as temp_dir:
             self._galaxy = Galaxy(AttrDict(api_server=C.GALAXY_SERVER,
@@ -59,37 +157,127 @@ class AnsibleContainerGalaxy(object):
                                            no_deps=False,
                                            roles_path=[temp_dir],
                                            token=None))     # FIXME: support tokens
-            roles_processed = []
+            roles_processed = set()
             role_failure = False
-            with InCaseOfFail(temp_dir):
-                while roles_to_install:
-                    try:
-                        role_to_install = roles_to_install.pop()
-                        role_obj, installed = self._role_to_temp_space(role_to_install)
-                        if installed:
-                            deps = role_obj.metadata.get('dependencies', [])
-                            for dep in deps:
-                                if dep not in roles_to_install + roles_processed:
-                                    roles_to_install.append(dep)
-                            self._update_container_yml(role_obj)
-                            self._update_requirements_yml(role_obj)
-                        roles_processed.append(role_to_install)
-                    except exceptions.AnsibleContainerGalaxyFatalException as exc:
-                        logger.error(exc)
-                        raise
-                    except exceptions.AnsibleContainerGalaxyRoleException as exc:
-                        logger.error(exc)
-                        role_failure = True
-                        continue
+            pool = ThreadPool(self.workers)
+            try:
+                with InCaseOfFail(temp_dir):
+                    while roles_to_install:
+                        level = []
+                        for role_to_install in roles_to_install:
+                            role_req_kwargs = self._parse_requirement(role_to_install)
+                            if role_req_kwargs['name'] not in roles_processed:
+                                roles_processed.add(role_req_kwargs['name'])
+                                level.append(role_req_kwargs)
+                        roles_to_install = []
+                        for role_obj, installed, exc in pool.map(self._install_quietly, level):
+                            if isinstance(exc, exceptions.AnsibleContainerGalaxyFatalException):
+                                logger.error(exc)
+                                raise exc
+                            if exc is not None:
+                                logger.error(exc)
+                                role_failure = True
+                                continue
+                            if installed:
+                                roles_to_install.extend(role_obj.metadata.get('dependencies', []))
+                                self._update_container_yml(role_obj)
+                                self._update_requirements_yml(role_obj)
+            finally:
+                pool.close()
+                pool.join()
         if role_failure:
             raise exceptions.AnsibleContainerGalaxyRoleException('One or more roles failed.')
 
-    def _role_to_temp_space(self, role_req):
-        role_req_kwargs = RoleRequirement.role_yaml_parse(role_req.strip())
+    @staticmethod
+    def _parse_requirement(role_req):
+        if isinstance(role_req, dict):
+            # role_yaml_parse modifies the dict it is given
+            return RoleRequirement.role_yaml_parse(dict(role_req))
+        return RoleRequirement.role_yaml_parse(role_req.strip())
+
+    def _install_quietly(self, role_req_kwargs):
+        try:
+            role_obj, installed = self._role_to_temp_space(role_req_kwargs)
+        except exceptions.AnsibleContainerException as exc:
+            return None, False, exc
+        except AnsibleError as exc:
+            return None, False, exceptions.AnsibleContainerGalaxyRoleException(
+                u'Failed to install role {}: {}'.format(role_req_kwargs.get('name'), exc))
+        return role_obj, installed, None
+
+    def _role_to_temp_space(self, role_req_kwargs):
         role_obj = GalaxyRole(self._galaxy, **role_req_kwargs)
-        installed = role_obj.install()
+        archive_path, temporary = self._role_archive(role_obj)
+        if archive_path:
+            # Install from the local tarball, keeping the requirement's src for requirements.yml
+            src = role_obj.src
+            role_obj.src = archive_path
+            try:
+                installed = role_obj.install()
+            finally:
+                role_obj.src = src
+                if temporary:
+                    os.unlink(archive_path)
+        else:
+            installed = role_obj.install()
         return role_obj, installed
 
+    def _role_archive(self, role_obj):
+        """
+        Path to a tarball of the role from the cache, downloading it if need be, and whether
+        it is a temporary download to remove after installing. The path is None for roles
+        from SCM, URLs or local files, which are installed directly.
+        """
+        src = role_obj.src or ''
+        if role_obj.scm or '://' in src or os.path.isfile(src):
+            if self.offline and not os.path.isfile(src):
+                raise exceptions.AnsibleContainerGalaxyRoleException(
+                    u'Role {} is not available offline'.format(role_obj.name))
+            return None, False
+        version = role_obj.version if role_obj.version not in (None, '', 'master') else None
+        if self.offline:
+            version = version or (self.cache.versions(role_obj.src) or [None])[-1]
+            archive_path = version and self.cache.get(role_obj.src, version)
+            if not archive_path:
+                raise exceptions.AnsibleContainerGalaxyRoleException(
+                    u'Role {} is not available offline'.format(role_obj.src))
+            logger.info(u'Installing %s %s from local archive', role_obj.src, version)
+            role_obj.version = version
+            return archive_path, False
+        if version:
+            archive_path = self.cache.get(role_obj.src, version)
+            if archive_path:
+                logger.info(u'Installing %s %s from cache', role_obj.src, version)
+                return archive_path, False
+
+        api = GalaxyAPI(self._galaxy)
+        role_data = api.lookup_role_by_name(role_obj.src)
+        if not role_data:
+            raise exceptions.AnsibleContainerGalaxyRoleException(
+                u'Role {} was not found on {}'.format(role_obj.src, api.api_server))
+        if not version:
+            versions = [v.get('name') for v in api.fetch_role_related('versions', role_data['id'])]
+            if not versions:
+                # Only a branch to install, which can't be cached
+                return None, False
+            version = sorted(versions, key=LooseVersion)[-1]
+            archive_path = self.cache.get(role_obj.src, version)
+            if archive_path:
+                logger.info(u'Installing %s %s from cache', role_obj.src, version)
+                role_obj.version = version
+                return archive_path, False
+        role_obj.version = version
+        downloaded = role_obj.fetch(role_data)
+        if not downloaded:
+            raise exceptions.AnsibleContainerGalaxyRoleException(
+                u'Failed to download role {} {}'.format(role_obj.src, version))
+        if not self.cache.path:
+            return downloaded, True
+        try:
+            return self.cache.put(role_obj.src, version, downloaded), False
+        finally:
+            os.unlink(downloaded)
+
     @staticmethod
     def _get_container_yml_snippet(role_obj):
         container_yml_path = os.path.join(role_obj.path, 'meta', 'container.yml')
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from .visibility import getLogger
+logger = getLogger(__name__)
+
+import os
+import re
+
+# Files read from the root of the project (/src inside the Conductor). The
+# .dockerignore also filters the build context copied to /src, while
+# .acignore only affects fingerprinting.
+IGNORE_FILES = ['.dockerignore', '.acignore']
+
+# Ignore files whose lines are rsync filter rules, rather than only exclude patterns.
+# The Conductor merges .dockerignore with rsync's :- modifier, which reads every line
+# as an exclude pattern, so only .acignore gets the + and - prefixes.
+FILTER_RULE_FILES = ['.acignore']
+
+INCLUDE_PREFIX = '+ '
+EXCLUDE_PREFIX = '- '
+
+
+def read_ignore_file(path, filter_rules=False, patterns=None):
+    """
+    Return the patterns found in an ignore file, skipping blank lines and comments.
+    Returns an empty list when the file does not exist.
+
+    With filter_rules, lines follow rsync's filter rules: a pattern prefixed with "- " is
+    excluded, one prefixed with "+ " is included, and is kept as a pattern starting with
+    "+ ", and a line holding only "!" clears the patterns before it, including those
+    passed in as patterns.
+    """
+    patterns = list(patterns or [])
+    if not os.path.isfile(path):
+        return patterns
+    with open(path) as ifs:
+        for line in ifs:
+            line = line.strip()
+            if not line or line.startswith(('#', ';')):
+                continue
+            if filter_rules:
+                if line == '!':
+                    del patterns[:]
+                    continue
+                if line.startswith(EXCLUDE_PREFIX):
+                    line = line[len(EXCLUDE_PREFIX):].strip()
+            patterns.append(line)
+    return patterns
+
+
+def _pattern_to_regex(pattern):
+    """
+    Translate an exclude pattern to a regular expression, following the rules rsync
+    applies to the .dockerignore when copying the build context:
+
+    - a leading / anchors the pattern to the directory holding the ignore file
+    - a trailing / matches directories only
+    - a pattern without a / matches the final path component at any depth
+    - * and ? do not match /, ** matches anything
+    """
+    anchored = pattern.startswith('/')
+    dir_only = pattern.endswith('/')
+    if pattern.endswith('/***'):
+        # rsync's way of saying "the directory and everything in it"
+        pattern = pattern[:-4]
+    body = pattern.strip('/')
+    regex = ''
+    i = 0
+    while i < len(body):
+        c = body[i]
+        if body.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = body.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                regex += body[i:end + 1]
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    if anchored:
+        regex = '^' + regex
+    else:
+        regex = '(^|/)' + regex
+    return re.compile(regex + '$'), dir_only
+
+
+class PathIgnorer(object):
+    """
+    Decides which paths to leave out of a fingerprint. Patterns are relative to base_path.
+    Anchored patterns only apply within base_path, while unanchored patterns, like
+    *.pyc or .git/, also apply to directories outside of it. As with rsync, the first
+    pattern matching a path decides, and a path matching a pattern starting with "+ "
+    is kept.
+    """
+
+    def __init__(self, base_path, patterns):
+        self.base_path = os.path.abspath(base_path)
+        self.patterns = list(patterns)
+        self._compiled = []
+        for pattern in self.patterns:
+            include = pattern.startswith(INCLUDE_PREFIX)
+            body = pattern[len(INCLUDE_PREFIX):].strip() if include else pattern
+            self._compiled.append((pattern, include, body) + _pattern_to_regex(body))
+
+    @classmethod
+    def from_project(cls, base_path):
+        patterns = []
+        for file_name in IGNORE_FILES:
+            patterns = read_ignore_file(os.path.join(base_path, file_name),
+                                        filter_rules=file_name in FILTER_RULE_FILES,
+                                        patterns=patterns)
+        return cls(base_path, patterns)
+
+    def __bool__(self):
+        return bool(self.patterns)
+    __nonzero__ = __bool__
+
+    def match(self, path, is_dir, walk_root=None):
+        """
+        Return the pattern excluding path, or None if the path should be fingerprinted.
+
+        :param path: absolute path to the file or directory
+        :param is_dir: whether path is a directory
+        :param walk_root: for paths outside base_path, the directory being walked
+        """
+        path = os.path.abspath(path)
+        inside = path == self.base_path or path.startswith(self.base_path.rstrip('/') + '/')
+        if inside:
+            rel_path = os.path.relpath(path, self.base_path)
+        elif walk_root:
+            rel_path = os.path.relpath(path, walk_root)
+        else:
+            rel_path = os.path.basename(path)
+        rel_path = rel_path.replace(os.sep, '/')
+        for pattern, include, body, regex, dir_only in self._compiled:
+            if dir_only and not is_dir:
+                continue
+            if body.startswith('/') and not inside:
+                continue
+            if regex.search(rel_path):
+                return None if include else pattern
+        return None
@@ -29,6 +29,10 @@ class LogMultiplexer(with_metaclass(Singleton, object)):
     def consumer(self):
         while True:
             log_obj, message = self.q.get(block=True)
+            if message is None:
+                # The iterator is exhausted, and everything it produced has been logged
+                log_obj.close()
+                continue
             log_obj.info(message)
 
     def start(self):
@@ -39,6 +43,8 @@ class LogMultiplexer(with_metaclass(Singleton, object)):
     def produce(self, iterator, log_obj):
         for message in iterator:
             self.q.put((log_obj, to_text(message).rstrip()))
+        if hasattr(log_obj, 'close'):
+            self.q.put((log_obj, None))
 
     def add_iterator(self, iterator, log_obj):
         producer_thread = threading.Thread(target=self.produce,
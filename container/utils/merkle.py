@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from .visibility import getLogger
+logger = getLogger(__name__)
+
+import hashlib
+import multiprocessing
+import os
+import stat
+
+from multiprocessing.pool import ThreadPool
+
+from ._text import to_bytes
+
+BLOCKSIZE = 64 * 1024
+
+
+def hash_file(file_path):
+    """ Return the sha256 hexdigest of a file's contents """
+    hash_obj = hashlib.sha256()
+    with open(file_path, 'rb') as ifs:
+        while True:
+            data = ifs.read(BLOCKSIZE)
+            if not data:
+                break
+            hash_obj.update(data)
+    return hash_obj.hexdigest()
+
+
+def default_workers():
+    try:
+        return min(8, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 2
+
+
+class TreeHasher(object):
+    """
+    Computes Merkle digests of directory trees. A directory's digest is built from the sorted
+    names, types and digests of its entries, so it depends only on content, and not on the
+    order in which the filesystem lists entries or on where the tree lives. File contents are
+    hashed on a pool of threads, and every file and directory digest is memoized, so trees
+    shared by several roles are only read once per instance. What's ignored beneath a directory
+    can depend on the directory the walk started from, so directory digests are memoized per
+    walk root.
+
+    :param ignorer: optional container.utils.ignore.PathIgnorer deciding which paths to skip
+    :param workers: number of threads used to hash file contents
+    """
+
+    def __init__(self, ignorer=None, workers=None):
+        self.ignorer = ignorer
+        self.workers = workers or default_workers()
+        self._file_digests = {}
+        self._dir_digests = {}
+        self._memo = {}
+
+    def memoize(self, key, func, *args, **kwargs):
+        """ Return func(*args, **kwargs), computing it only once per key """
+        if key not in self._memo:
+            self._memo[key] = func(*args, **kwargs)
+        return self._memo[key]
+
+    def is_ignored(self, path, is_dir, walk_root=None):
+        if not self.ignorer:
+            return False
+        pattern = self.ignorer.match(path, is_dir, walk_root=walk_root)
+        if pattern:
+            logger.debug(u'Excluded from role fingerprint', path=path, pattern=pattern)
+            return True
+        return False
+
+    def file_digest(self, file_path):
+        file_path = os.path.realpath(file_path)
+        if file_path not in self._file_digests:
+            self._file_digests[file_path] = hash_file(file_path)
+        return self._file_digests[file_path]
+
+    def path_digest(self, path):
+        """ Digest of a file or directory, or None when the path is ignored """
+        is_dir = os.path.isdir(path)
+        if self.is_ignored(path, is_dir):
+            return None
+        if is_dir:
+            return self.dir_digest(path)
+        return self.file_digest(path)
+
+    def dir_digest(self, dir_path):
+        dir_path = os.path.realpath(dir_path)
+        if (dir_path, dir_path) not in self._dir_digests:
+            tree = {}
+            self._scan(dir_path, dir_path, tree)
+            pending = sorted(set(path for entries in tree.values()
+                                 for kind, name, path in entries
+                                 if kind == 'f' and path not in self._file_digests))
+            for path, digest in zip(pending, self._map(hash_file, pending)):
+                self._file_digests[path] = digest
+            self._combine(dir_path, dir_path, tree)
+        return self._dir_digests[(dir_path, dir_path)]
+
+    def _scan(self, dir_path, walk_root, tree):
+        """
+        Record the sorted, non-ignored entries of dir_path and each directory beneath it,
+        skipping directories whose digest is already known.
+        """
+        entries = []
+        for name in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, name)
+            try:
+                mode = os.lstat(path).st_mode
+            except OSError:
+                continue
+            if stat.S_ISLNK(mode):
+                # Record links to directories, and dangling links, by their target rather
+                # than following them. Links to files are hashed by content.
+                if os.path.isfile(path):
+                    if not self.is_ignored(path, False, walk_root=walk_root):
+                        entries.append(('f', name, os.path.realpath(path)))
+                elif not self.is_ignored(path, os.path.isdir(path), walk_root=walk_root):
+                    entries.append(('l', name, os.readlink(path)))
+            elif stat.S_ISDIR(mode):
+                if self.is_ignored(path, True, walk_root=walk_root):
+                    continue
+                entries.append(('d', name, path))
+                if (walk_root, path) not in self._dir_digests:
+                    self._scan(path, walk_root, tree)
+            elif stat.S_ISREG(mode):
+                if not self.is_ignored(path, False, walk_root=walk_root):
+                    entries.append(('f', name, path))
+        tree[dir_path] = entries
+
+    def _combine(self, dir_path, walk_root, tree):
+        key = (walk_root, dir_path)
+        if key in self._dir_digests:
+            return self._dir_digests[key]
+        hash_obj = hashlib.sha256()
+        for kind, name, path in tree[dir_path]:
+            if kind == 'f':
+                digest = self._file_digests[path]
+            elif kind == 'd':
+                digest = self._combine(path, walk_root, tree)
+            else:
+                digest = hashlib.sha256(to_bytes(path)).hexdigest()
+            hash_obj.update(to_bytes(kind) + b' ' + to_bytes(name) + b'\0' + to_bytes(digest) + b'\n')
+        self._dir_digests[key] = hash_obj.hexdigest()
+        return self._dir_digests[key]
+
+    def _map(self, func, items):
+        if len(items) < 2 or self.workers < 2:
+            return [func(item) for item in items]
+        # hashlib releases the GIL while digesting, so threads give real parallelism here
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from .visibility import getLogger
+logger = getLogger(__name__)
+
+import json
+import os
+import re
+
+from six import string_types
+
+from ..exceptions import AnsibleContainerConfigException
+
+# Paths removed from every layer, regardless of the distribution. Each entry is
+# a shell glob evaluated inside the build container. As * skips dotfiles, they
+# get globs of their own, which leave out . and ..
+SLIM_COMMON_PATHS = [
+    '/tmp/*',
+    '/tmp/.[!.]*',
+    '/var/tmp/*',
+    '/var/tmp/.[!.]*',
+    '/root/.ansible/tmp',
+    '/root/.cache/pip',
+]
+
+# Package manager caches and indexes, keyed by the ID / ID_LIKE values found
+# in the build container's /etc/os-release
+SLIM_DISTRO_PATHS = {
+    'debian': [
+        '/var/lib/apt/lists/*',
+        '/var/cache/apt/archives/*.deb',
+        '/var/cache/apt/*.bin',
+    ],
+    'fedora': [
+        '/var/cache/dnf/*',
+        '/var/cache/yum/*',
+    ],
+    'rhel': [
+        '/var/cache/yum/*',
+    ],
+    'alpine': [
+        '/var/cache/apk/*',
+    ],
+}
+
+SLIM_PATH_RE = re.compile(r'^/[A-Za-z0-9_@%+=,.*?!\[\]/-]+$')
+GLOB_CHARS = ('*', '?', '[')
+
+
+def _normalize_slim_setting(value, source):
+    """
+    Turn a `slim` directive into a dict with keys enabled, paths and keep. The directive
+    may be a boolean or a mapping of those keys.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return dict(enabled=value, paths=[], keep=[])
+    if not isinstance(value, dict):
+        raise AnsibleContainerConfigException(
+            u"Expecting 'slim' in {} to be a boolean or a mapping.".format(source))
+    result = dict(enabled=value.get('enabled', True),
+                  paths=list(value.get('paths') or []),
+                  keep=list(value.get('keep') or []))
+    for path in result['paths'] + result['keep']:
+        if not isinstance(path, string_types) or not SLIM_PATH_RE.match(path) or \
+                '..' in path.split('/') or path.rstrip('/') == '':
+            raise AnsibleContainerConfigException(
+                u"Invalid slim path {!r} in {}. Expecting an absolute path or "
+                u"shell glob.".format(path, source))
+    return result
+
+
+def distro_families(os_release):
+    """ Given the parsed contents of /etc/os-release, return the list of distro IDs it claims. """
+    if not os_release:
+        return []
+    families = [os_release.get('ID', '')]
+    families += os_release.get('ID_LIKE', '').split()
+    return [f.strip('"\'').lower() for f in families if f]
+
+
+def _resolve_slim_settings(settings_slim, service_slim, service_name):
+    """ Normalize both `slim` directives, and decide whether slimming is enabled for the service. """
+    project = _normalize_slim_setting(settings_slim, 'settings')
+    service = _normalize_slim_setting(service_slim, 'service {}'.format(service_name))
+    if service is not None:
+        enabled = service['enabled']
+    else:
+        enabled = bool(project and project['enabled'])
+    return project, service, enabled
+
+
+def get_slim_paths(os_release, settings_slim=None, service_slim=None, service_name=None):
+    """
+    Resolve the list of paths to remove from a build container before committing a layer.
+
+    :param os_release: dict of key/values from the build container's /etc/os-release
+    :param settings_slim: the `slim` directive from the settings section of container.yml
+    :param service_slim: the `slim` directive from the service definition
+    :param service_name: name of the service, used in error messages
+    :return: list of shell globs. Empty when slimming is disabled.
+    """
+    project, service, enabled = _resolve_slim_settings(settings_slim, service_slim, service_name)
+    if not enabled:
+        return []
+
+    paths = list(SLIM_COMMON_PATHS)
+    for family in distro_families(os_release):
+        for path in SLIM_DISTRO_PATHS.get(family, []):
+            if path not in paths:
+                paths.append(path)
+
+    keep = []
+    for config in (project, service):
+        if config:
+            paths += [p for p in config['paths'] if p not in paths]
+            keep += config['keep']
+    return [p for p in paths if p not in keep]
+
+
+def get_slim_fingerprint(settings_slim=None, service_slim=None, service_name=None):
+    """
+    Return the effective `slim` config as text, to be added to a service's layer fingerprint,
+    so that changing it invalidates layers committed under the old config. Empty when slimming
+    is disabled, leaving the fingerprints of unslimmed builds as they were.
+    """
+    project, service, enabled = _resolve_slim_settings(settings_slim, service_slim, service_name)
+    if not enabled:
+        return u''
+    return json.dumps({'settings': project, 'service': service}, sort_keys=True)
+
+
+def _static_prefix(path):
+    """ Return the leading part of a glob that contains no wildcards """
+    parts = []
+    for part in path.split('/'):
+        if any(c in part for c in GLOB_CHARS):
+            break
+        parts.append(part)
+    return '/'.join(parts) or '/'
+
+
+def filter_mounted_paths(paths, mount_points):
+    """
+    Drop any path that is, contains, or lives inside a mounted volume. Removing those
+    would reach through to the volume rather than to the layer being committed.
+    """
+    result = []
+    for path in paths:
+        prefix = os.path.normpath(_static_prefix(path))
+        clashes = [m for m in mount_points
+                   if m == prefix or m.startswith(prefix.rstrip('/') + '/') or
+                   prefix.startswith(m.rstrip('/') + '/')]
+        if clashes:
+            logger.debug(u'Not slimming path backed by a volume', path=path, mounts=clashes)
+            continue
+        result.append(path)
+    return result
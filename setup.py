@@ -52,7 +52,9 @@ class PrebakeConductors(distutils.cmd.Command):
         ('debug', None, 'Enable debug output'),
         ('no-cache', None, 'Cache me offline, how bout dat?'),
         ('ignore-errors', None, 'Ignore build failures and continue building other distros'),
-        ('distros=', None, 'Only pre-bake certain supported distros. Comma-separated.')
+        ('distros=', None, 'Only pre-bake certain supported distros. Comma-separated.'),
+        ('workers=', None, 'Number of distros to pre-bake at the same time. Defaults to 4.'),
+        ('full', None, 'Keep compilers and headers in the pre-baked images, building them in one stage')
     ]
 
     def initialize_options(self):
@@ -61,10 +63,13 @@ class PrebakeConductors(distutils.cmd.Command):
         self.debug = False
         self.ignore_errors = False
         self.distros = ''
+        self.workers = None
+        self.full = False
 
     def finalize_options(self):
         self.distros = self.distros.strip().split(',') if self.distros else []
         self.cache = not getattr(self, 'no_cache', False)
+        self.workers = int(self.workers) if self.workers else None
 
     def run(self):
         """Run command."""
@@ -75,7 +80,8 @@ class PrebakeConductors(distutils.cmd.Command):
             LOGGING['loggers']['container']['level'] = 'DEBUG'
         config.dictConfig(LOGGING)
         core.hostcmd_prebake(self.distros, debug=self.debug, cache=self.cache,
-                             ignore_errors=self.ignore_errors)
+                             ignore_errors=self.ignore_errors, workers=self.workers,
+                             slim=not self.full)
 
 if container.ENV == 'host':
     install_reqs = parse_requirements('requirements.txt', session=False)
@@ -0,0 +1,79 @@
+"""
+Build a prebaked Conductor image for a distro both in one stage, with the build toolchain, and
+in two stages, shipping only the virtualenv and Python runtime, and compare their size, the
+bytes of their layers, and how long a container takes to start and run the Conductor's CLI.
+Needs a Docker daemon that supports multi-stage builds (17.05 or later).
+
+    PYTHONPATH=. python test/benchmarks/bench_conductor_image.py [--distro centos:7]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import os
+import tarfile
+import time
+
+from container import utils
+from container.utils import CONDUCTOR_PAYLOAD_VERSION
+from container.docker.engine import Engine, DOCKER_VERSION, TEMPLATES_PATH
+
+
+def build(engine, distro, slim, cache=True):
+    tag = 'container-conductor-bench:%s-%s' % (distro.replace(':', '-'), 'slim' if slim else 'full')
+    with utils.make_temp_dir() as temp_dir:
+        tarball_path = os.path.join(temp_dir, 'context.tar')
+        with open(tarball_path, 'wb') as tarball_file:
+            tarball = tarfile.TarFile(fileobj=tarball_file, mode='w')
+            engine._add_conductor_source(os.getcwd(), temp_dir, tarball)
+            engine._add_prebake_docs(temp_dir, tarball)
+            utils.jinja_render_to_temp(TEMPLATES_PATH, 'conductor-src-dockerfile.j2', temp_dir,
+                                       'Dockerfile', conductor_base=distro,
+                                       docker_version=DOCKER_VERSION, environment=[],
+                                       payload_version=CONDUCTOR_PAYLOAD_VERSION, slim=slim)
+            tarball.add(os.path.join(temp_dir, 'Dockerfile'), arcname='Dockerfile')
+            tarball.close()
+        start = time.time()
+        with open(tarball_path, 'rb') as context:
+            engine._stream_build(context, tag, cache=cache)
+    return engine.client.images.get(tag), time.time() - start
+
+
+def pull_bytes(image):
+    """ Bytes of the image's layers, as `docker save` streams them """
+    return sum(len(chunk) for chunk in image.save())
+
+
+def start_seconds(engine, image):
+    """ Seconds from creating a container until `conductor --help` exits """
+    start = time.time()
+    container_obj = engine.client.containers.create(image.id, command=['conductor', '--help'])
+    try:
+        container_obj.start()
+        container_obj.wait()
+        return time.time() - start
+    finally:
+        container_obj.remove(force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--distro', default='centos:7')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-cache', action='store_false', dest='cache')
+    args = parser.parse_args()
+
+    engine = Engine('bench', {})
+    engine.client.images.pull(*args.distro.split(':', 1))
+    print('%s Conductor image, start times best of %d' % (args.distro, args.repeat))
+    print('  %-10s %10s %12s %12s %12s %10s' % ('', 'build s', 'size MB', 'saved MB',
+                                               'first start', 'start s'))
+    for label, slim in (('one stage', False), ('two stage', True)):
+        image, built = build(engine, args.distro, slim, cache=args.cache)
+        first = start_seconds(engine, image)
+        best = min(start_seconds(engine, image) for _ in range(args.repeat))
+        print('  %-10s %10.1f %12.1f %12.1f %12.2f %10.2f' % (
+            label, built, image.attrs.get('Size', 0) / 1e6, pull_bytes(image) / 1e6, first, best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Time generating the deployment tasks of the K8s orchestration playbook for a project with many
+services, compiling every manifest from scratch against reusing the compiled manifests, as
+generate_orchestration_playbook does for its stop and start task groups.
+
+    PYTHONPATH=. python test/benchmarks/bench_k8s_manifests.py [--services 1000]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import timeit
+
+from container.k8s.deploy import Deploy
+
+
+def make_services(count):
+    services = {}
+    for i in range(count):
+        services['svc%04d' % i] = {
+            'image': 'registry.example.com/bench/svc%04d:20171001' % i,
+            'command': 'gunicorn --bind 0.0.0.0:%d --workers 4 app:application' % (8000 + i),
+            'entrypoint': ['/usr/bin/dumb-init', '--'],
+            'ports': ['%d:8000' % (8000 + i), '%d/udp' % (9000 + i)],
+            'environment': ['INDEX=%d' % i, 'DEBUG=0', 'DATABASE_URL=postgres://db:5432/bench'],
+            'volumes': ['data%d:/var/lib/data' % i, '/tmp/cache:/cache:ro', '/scratch'],
+            'working_dir': '/srv',
+            'k8s': {
+                'deployment': {
+                    'replicas': 2,
+                    'min_ready_seconds': 5,
+                    'security_context': {'run_as_user': 1000, 'fs_group': 1000},
+                },
+            },
+        }
+    return services
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--services', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    services = make_services(args.services)
+    deploy = Deploy(services, 'bench', namespace_name='bench')
+
+    def task_groups():
+        deploy.get_deployment_tasks(engine_state='stop', tags=['stop', 'restart'])
+        deploy.get_deployment_tasks(tags=['start', 'restart'])
+
+    def cold():
+        # Each task group compiles every manifest again, as before manifests were cached
+        deploy._compiled_deployments.clear()
+        deploy.get_deployment_tasks(engine_state='stop', tags=['stop', 'restart'])
+        deploy._compiled_deployments.clear()
+        deploy.get_deployment_tasks(tags=['start', 'restart'])
+
+    task_groups()
+    print('%d services, best of %d' % (args.services, args.repeat))
+    for label, func in (('compile every manifest, stop + start', cold),
+                        ('reuse compiled manifests, stop + start', task_groups)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('  %-40s %9.2f ms' % (label, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Time translating services that expose large port ranges, such as RTP ranges, for image commits
+and K8s manifests, comparing against the linear scans used to de-duplicate ports before.
+
+    PYTHONPATH=. python test/benchmarks/bench_port_ranges.py [--ports 10000]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import timeit
+
+from container.k8s.base_deploy import K8sBaseDeploy
+from container.utils import parse_port_ranges
+
+
+def scan_add_container_ports(ports, existing_ports):
+    for port in ports:
+        protocol = 'TCP'
+        if '/' in port:
+            port, protocol = port.split('/')
+        found = [p for p in existing_ports if p['containerPort'] == int(port) and p['protocol'] == protocol]
+        if not found:
+            existing_ports.append({'containerPort': int(port), 'protocol': protocol.upper()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ports', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    high = 10000 + args.ports - 1
+    ranges = ['10000-%d/udp' % high, '10000-%d/udp' % (10000 + args.ports // 2), '8080', '8443:443']
+    # The scan only understood single ports, so ranges had to be written out
+    expanded = ['%d/UDP' % port for port in range(10000, high + 1)] + ['8080/TCP', '443/TCP']
+
+    def expose_ranges():
+        return [u'EXPOSE %s-%s/%s' % port_range for port_range in parse_port_ranges(ranges)]
+
+    def container_ports():
+        K8sBaseDeploy.add_container_ports(ranges, [])
+
+    def service_ports():
+        K8sBaseDeploy.get_service_ports({'ports': ranges})
+
+    def scan_container_ports():
+        scan_add_container_ports(expanded, [])
+
+    print('%d ports in range, best of %d' % (args.ports, args.repeat))
+    print('  %d EXPOSE changes for an image commit' % len(expose_ranges()))
+    for label, func in (('parse and merge ranges', expose_ranges),
+                        ('K8s container ports, set dedupe', container_ports),
+                        ('K8s service ports, set dedupe', service_ports),
+                        ('K8s container ports, scanned', scan_container_ports)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('  %-36s %9.2f ms' % (label, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
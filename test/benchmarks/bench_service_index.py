@@ -0,0 +1,73 @@
+"""
+Time image name, container name and run kwargs lookups on the Docker engine for a project
+with many services, comparing against a scan of the service definitions on every call, as
+the engine used to do.
+
+    PYTHONPATH=. python test/benchmarks/bench_service_index.py [--services 500]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import timeit
+
+from six import iteritems
+
+from container.docker.engine import Engine
+
+
+def make_services(count):
+    services = {}
+    for i in range(count):
+        services['svc%04d' % i] = {
+            'from': 'centos:7',
+            'roles': ['role%d' % i] if i % 2 else [],
+            'ports': ['%d:80' % (8000 + i), '%d:443' % (9000 + i)],
+            'environment': ['INDEX=%d' % i],
+            'command': ['/bin/false'],
+            'dev_overrides': {'environment': ['DEBUG=1']},
+        }
+    return services
+
+
+def scan_image_name(project_name, services, service_name):
+    for name, service in iteritems(services):
+        if name == service_name:
+            if service.get('roles'):
+                return u'%s-%s' % (project_name.lower(), name.lower())
+            return service.get('from')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--services', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    services = make_services(args.services)
+    names = sorted(services)
+
+    def build():
+        return Engine('bench', services)
+
+    engine = build()
+
+    def index_lookups():
+        for name in names:
+            engine.image_name_for_service(name)
+            engine.container_name_for_service(name)
+            engine.run_kwargs_for_service(name)
+
+    def scan_lookups():
+        for name in names:
+            scan_image_name('bench', services, name)
+
+    print('%d services, best of %d' % (args.services, args.repeat))
+    for label, func in (('build engine and index', build),
+                        ('indexed lookups, all services', index_lookups),
+                        ('scanned image names, all services', scan_lookups)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('  %-36s %9.2f ms' % (label, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
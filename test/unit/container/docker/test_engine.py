@@ -0,0 +1,290 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import pytest
+
+from docker import errors as docker_errors
+
+import container
+from container.docker.engine import Engine, CONDUCTOR_PAYLOAD_PATH, GALAXY_CACHE_PATH
+from container.docker.orchestrator import DIGEST_LABEL_KEY, container_digest
+from container import exceptions
+
+
+class FakeImagesApi(object):
+    """ Removes images by tag or ID, refusing to delete one that a container uses, as Docker does """
+
+    def __init__(self, images, in_use=()):
+        # Image ID to list of tags
+        self.tags = images
+        self.in_use = set(in_use)
+        self.filters = None
+
+    def images(self, filters=None):
+        self.filters = filters
+        return [{'Id': image_id, 'ParentId': '', 'Size': 1, 'RepoTags': list(tags) or None}
+                for image_id, tags in self.tags.items()]
+
+    def remove_image(self, image, force=False, noprune=False):
+        if image in self.tags:
+            if self.tags[image] and not force:
+                raise docker_errors.APIError('conflict: image is referenced in multiple repositories')
+            if image in self.in_use:
+                raise docker_errors.APIError('conflict: image is being used by running container')
+            del self.tags[image]
+            return
+        for image_id, tags in list(self.tags.items()):
+            if image in tags:
+                tags.remove(image)
+                if not tags and image_id not in self.in_use:
+                    del self.tags[image_id]
+                return
+        raise docker_errors.NotFound('No such image: %s' % image)
+
+
+class FakeImage(object):
+
+    def __init__(self, image_id, labels, tags=()):
+        self.id = self.short_id = image_id
+        self.labels = labels
+        self.tags = list(tags)
+
+    @property
+    def attrs(self):
+        return {'Config': {'Labels': self.labels or None}}
+
+
+class FakeImages(object):
+    """ Lists images by label, as `docker images --filter label=key=value` does """
+
+    def __init__(self):
+        self.images = {}
+        self.registry = {}
+
+    def pull(self, repository, tag=None):
+        name = '%s:%s' % (repository, tag)
+        if name not in self.registry:
+            raise docker_errors.ImageNotFound('pull access denied for %s' % repository)
+        image = self.images[self.registry[name].id] = self.registry[name]
+        return image
+
+    def list(self, all=False, filters=None):
+        key, value = filters['label'].split('=', 1)
+        return [image for image in self.images.values() if image.labels.get(key) == value]
+
+    def remove(self, image_id, force=False):
+        del self.images[image_id]
+
+    def get(self, image_id):
+        for image in self.images.values():
+            if image_id == image.id or image_id in image.tags:
+                return image
+        raise docker_errors.ImageNotFound('No such image: %s' % image_id)
+
+
+class FakeContainer(object):
+    """ Commits inherit the labels of the image the container was run from """
+
+    def __init__(self, images, image_id):
+        self.images = images
+        self.image_id = image_id
+
+    def commit(self, repository=None, tag=None, message=None, conf=None, changes=None):
+        labels = dict(self.images.images[self.image_id].labels)
+        labels.update(conf.get('Labels') or {})
+        image = FakeImage('image%d' % (len(self.images.images) + 1), labels)
+        self.images.images[image.id] = image
+        return image
+
+
+class FakeContainers(object):
+
+    def __init__(self):
+        self.containers = {}
+
+    def get(self, container_id):
+        return self.containers[container_id]
+
+
+class FakeClient(object):
+
+    def __init__(self, api=None):
+        self.api = api
+        self.images = FakeImages()
+        self.containers = FakeContainers()
+
+    def df(self):
+        return {'LayersSize': None}
+
+
+class TestRemoveProjectImages(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'conductor'
+
+    def tearDown(self):
+        container.ENV = self.env
+
+    def test_untag_and_remove(self):
+        api = FakeImagesApi({'web1': ['demo-web:20171001', 'demo-web:latest'],
+                             'conductor1': ['demo-conductor:latest'],
+                             'shared1': ['demo-conductor:old', 'container-conductor:0123abcd']},
+                            in_use=['conductor1'])
+        engine = Engine('demo', {'web': {'roles': ['apache']}})
+        engine._client = FakeClient(api)
+        removed, reclaimed = engine.remove_project_images()
+        self.assertEqual(api.filters, {'reference': ['demo-web', 'demo-conductor']})
+        self.assertEqual(removed, 1)
+        # The running Conductor's image is untagged, and the shared image keeps its other tag
+        self.assertEqual(api.tags, {'conductor1': [], 'shared1': ['container-conductor:0123abcd']})
+
+
+class TestCheckpointLabels(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'conductor'
+        self.engine = Engine('demo', {'web': {'roles': ['apache']}})
+        self.client = self.engine._client = FakeClient()
+        self.client.images.images['base'] = FakeImage('base', {})
+
+    def tearDown(self):
+        container.ENV = self.env
+
+    def run_container(self, container_id, image_id):
+        self.client.containers.containers[container_id] = FakeContainer(self.client.images, image_id)
+
+    def test_resumed_layer_is_not_a_checkpoint(self):
+        # The previous layer, then a checkpoint of a failed attempt at the next one
+        self.run_container('build1', 'base')
+        parent_id = self.engine.commit_role_as_layer('build1', 'web', 'fp1', 'common', {})
+        self.run_container('build2', parent_id)
+        checkpoint_id = self.engine.commit_checkpoint('build2', 'fp2', 'apache : install', 1)
+        self.assertIsNone(self.engine.get_image_id_by_fingerprint('fp2'))
+        self.assertEqual(self.engine.get_image_id_by_fingerprint('fp1'), parent_id)
+
+        # The next attempt resumes from the checkpoint, and commits the layer
+        self.run_container('build3', checkpoint_id)
+        image_id = self.engine.commit_role_as_layer('build3', 'web', 'fp2', 'apache', {})
+        self.assertEqual(self.engine.get_image_id_by_fingerprint('fp2'), image_id)
+        self.assertEqual([i.id for i in self.engine._get_checkpoint_images('fp2')], [checkpoint_id])
+        self.engine.remove_checkpoints('fp2', keep=image_id)
+        self.assertEqual(sorted(self.client.images.images), sorted(['base', parent_id, image_id]))
+
+
+class TestConductorInput(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'host'
+        self.engine = Engine('demo', {'web': {'roles': ['apache']}})
+        self.client = self.engine._client = FakeClient()
+
+    def tearDown(self):
+        container.ENV = self.env
+
+    def conductor_input(self, labels):
+        self.client.images.images['conductor'] = FakeImage('conductor', labels)
+        return self.engine._conductor_input('conductor', {'version': '2'}, {'debug': True})
+
+    def test_payload(self):
+        args, payload = self.conductor_input({Engine.CONDUCTOR_PAYLOAD_LABEL_KEY: '1'})
+        self.assertEqual(args, ['--payload', CONDUCTOR_PAYLOAD_PATH])
+        self.assertTrue(payload)
+
+    def test_image_predating_payloads(self):
+        args, payload = self.conductor_input({})
+        self.assertEqual(args[::2], ['--params', '--config', '--encoding'])
+        self.assertIsNone(payload)
+
+    def test_payload_version_mismatch(self):
+        with pytest.raises(exceptions.AnsibleContainerConductorException):
+            self.conductor_input({Engine.CONDUCTOR_PAYLOAD_LABEL_KEY: '2'})
+
+
+class TestConductorManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'host'
+        self.engine = Engine('demo', {'web': {'roles': ['apache']}})
+        self.engine._client = FakeClient()
+        self.temp_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.temp_dir, 'requirements.yml'), 'w') as ofs:
+            ofs.write('- src: geerlingguy.apache\n')
+
+    def tearDown(self):
+        container.ENV = self.env
+        shutil.rmtree(self.temp_dir)
+
+    def install_commands(self, cache):
+        with tarfile.open(os.path.join(self.temp_dir, 'context.tar'), 'w') as tarball:
+            commands, _ = self.engine._prepare_conductor_manifest(self.temp_dir, 'centos:7', self.temp_dir,
+                                                                  tarball, build_cache=True, cache=cache)
+        return ' && '.join(commands)
+
+    def test_roles_cache(self):
+        self.assertIn(GALAXY_CACHE_PATH, self.install_commands(cache=True))
+        # Unpinned roles are installed afresh
+        self.assertNotIn(GALAXY_CACHE_PATH, self.install_commands(cache=False))
+
+
+class TestSharedConductorTag(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'host'
+        self.engine = Engine('demo', {'web': {'roles': ['apache']}})
+        self.client = self.engine._client = FakeClient()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        container.ENV = self.env
+        shutil.rmtree(self.temp_dir)
+
+    def test_pulls_prebaked_image(self):
+        conductor_base = 'ansible/%s' % Engine.prebaked_conductor_tag('centos:7')
+        self.client.images.registry[conductor_base] = FakeImage('prebaked', {}, tags=[conductor_base])
+        # Before and after the pull, the tag is the same
+        tag = self.engine.shared_conductor_tag(self.temp_dir, 'centos:7')
+        self.assertIn('prebaked', self.client.images.images)
+        self.assertEqual(self.engine.shared_conductor_tag(self.temp_dir, 'centos:7'), tag)
+
+    def test_missing_prebaked_image(self):
+        self.assertIsNone(self.engine.shared_conductor_tag(self.temp_dir, 'centos:7'))
+
+
+class TestSecretsPlay(unittest.TestCase):
+
+    def test_task_names_are_unique(self):
+        engine = Engine('demo', {'web': {'roles': ['apache'],
+                                         'secrets': {'docker': [{'source': 'db_password',
+                                                                 'target': 'web_db_password'}]}}},
+                        secrets={'db': {'password': 'vault_db_password', 'user': 'vault_db_user'}})
+        names = [task['name'] for task in engine.generate_secrets_play()['tasks']]
+        self.assertEqual(len(names), 6)
+        self.assertEqual(len(set(names)), len(names))
+        self.assertIn('Write secret db_password to %s/web_db_password' % engine.secrets_mount_path, names)
+
+
+class TestOrchestrationPlaybook(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'conductor'
+
+    def tearDown(self):
+        container.ENV = self.env
+
+    def test_digest_label(self):
+        services = {'web': {'from': 'centos:7', 'links': ['db'], 'labels': ['tier=front']},
+                    'db': {'from': 'postgres:9.6', 'network_mode': 'bridge'}}
+        engine = Engine('demo', services)
+        client = engine._client = FakeClient()
+        client.images.images['centos:7'] = FakeImage('sha256:c7', {}, tags=['centos:7'])
+        playbook = engine.generate_orchestration_playbook()
+        definition = playbook[-1]['tasks'][0]['docker_service']['definition']['services']
+        # The same digest native orchestration labels the container with
+        self.assertEqual(definition['web']['labels'],
+                         {'tier': 'front', DIGEST_LABEL_KEY: container_digest('sha256:c7', services['web'])})
+        # An image that isn't local yet is digested by its name
+        self.assertEqual(definition['db']['labels'][DIGEST_LABEL_KEY],
+                         container_digest('postgres:9.6', services['db']))
@@ -0,0 +1,119 @@
+import unittest
+
+import pytest
+
+import container
+from container.docker.engine import Engine
+from container.docker.orchestrator import (DockerOrchestrator, dependency_waves, compose_project_name,
+                                          container_digest, removal_waves, repository_matches)
+from container.exceptions import AnsibleContainerConfigException
+
+
+class TestDependencyWaves(unittest.TestCase):
+
+    def test_waves(self):
+        services = {
+            'web': {'depends_on': ['api'], 'links': ['cache:redis']},
+            'api': {'depends_on': ['db']},
+            'worker': {'links': ['db']},
+            'db': {},
+            'cache': {},
+        }
+        self.assertEqual(dependency_waves(services),
+                         [['cache', 'db'], ['api', 'worker'], ['web']])
+
+    def test_missing_dependencies_are_ignored(self):
+        self.assertEqual(dependency_waves({'web': {'depends_on': ['db']}}), [['web']])
+
+    def test_cycle(self):
+        services = {'a': {'depends_on': ['b']}, 'b': {'links': ['a']}, 'c': {}}
+        with pytest.raises(AnsibleContainerConfigException):
+            dependency_waves(services)
+
+    def test_compose_project_name(self):
+        self.assertEqual(compose_project_name('My_Project-1'), 'myproject1')
+
+
+class TestContainerDigest(unittest.TestCase):
+
+    def test_stable(self):
+        a = container_digest('sha256:1', {'environment': ['A=1'], 'ports': {'80/tcp': [('0.0.0.0', 8080)]}})
+        b = container_digest('sha256:1', {'ports': {'80/tcp': [('0.0.0.0', 8080)]}, 'environment': ['A=1']})
+        self.assertEqual(a, b)
+
+    def test_changes(self):
+        base = container_digest('sha256:1', {'environment': ['A=1']})
+        self.assertNotEqual(base, container_digest('sha256:2', {'environment': ['A=1']}))
+        self.assertNotEqual(base, container_digest('sha256:1', {'environment': ['A=2']}))
+        # Links and network_mode aren't create options, but still count
+        self.assertNotEqual(base, container_digest('sha256:1', {'environment': ['A=1'], 'links': ['db']}))
+        self.assertNotEqual(base, container_digest('sha256:1', {'environment': ['A=1'], 'network_mode': 'host'}))
+
+
+class TestImageRemoval(unittest.TestCase):
+
+    def test_children_before_parents(self):
+        parents = {'a': '', 'b': 'a', 'c': 'b', 'd': 'a', 'e': 'base'}
+        self.assertEqual(removal_waves(parents), [['c', 'd', 'e'], ['b'], ['a']])
+
+    def test_repository_matches(self):
+        self.assertTrue(repository_matches('proj-web:20170901120000', 'proj-web'))
+        self.assertTrue(repository_matches('centos:7', 'centos:7'))
+        self.assertFalse(repository_matches('centos:6', 'centos:7'))
+        self.assertFalse(repository_matches('proj-web-old:latest', 'proj-web'))
+        self.assertFalse(repository_matches('registry:5000/proj-web', 'registry'))
+
+
+class FakeContainer(object):
+
+    def __init__(self, container_id, labels):
+        self.id = container_id
+        self.labels = labels
+
+
+class FakeNetworkApi(object):
+    """ Records the networks containers are created on and connected to """
+
+    def __init__(self):
+        self.networks = {}
+
+    def create(self, image, name=None, detach=False, network=None, network_mode=None, labels=None, **kwargs):
+        container = FakeContainer(name, labels)
+        self.networks[container.id] = {network or network_mode or 'bridge': {}}
+        return container
+
+    def disconnect_container_from_network(self, container_id, network):
+        del self.networks[container_id][network]
+
+    def connect_container_to_network(self, container_id, network, aliases=None, links=None):
+        self.networks[container_id][network] = {'aliases': aliases, 'links': links}
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.api = self.containers = FakeNetworkApi()
+
+
+class TestProjectNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.env, container.ENV = container.ENV, 'conductor'
+
+    def tearDown(self):
+        container.ENV = self.env
+
+    def test_only_on_project_network(self):
+        services = {'web': {'from': 'centos:7', 'links': ['db:database']},
+                    'db': {'from': 'postgres:9.6'},
+                    'host': {'from': 'centos:7', 'network_mode': 'host'}}
+        engine = Engine('demo', services)
+        client = engine._client = FakeClient()
+        orchestrator = DockerOrchestrator(engine, services)
+        for service_name in services:
+            orchestrator._create_container(service_name, FakeContainer('sha256:1', None),
+                                           orchestrator.create_kwargs_for_service(service_name))
+        self.assertEqual(client.api.networks['demo_web'],
+                         {'demo_default': {'aliases': ['web'], 'links': [('demo_db', 'database')]}})
+        self.assertEqual(list(client.api.networks['demo_db']), ['demo_default'])
+        self.assertEqual(list(client.api.networks['demo_host']), ['host'])
@@ -0,0 +1,196 @@
+import json
+import threading
+import unittest
+
+from six.moves import BaseHTTPServer, socketserver
+
+from container.k8s.apply import (DIGEST_ANNOTATION_KEY, K8sApiClient, WaveApplier, resource_digest,
+                                 resource_from_task, resource_path, retarget_waves, summarize)
+
+
+class FakeApiServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Keeps resources in memory by path, and records each request made """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeApiHandler)
+        self.resources = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+
+class FakeApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    collections = ('namespaces', 'secrets', 'persistentvolumeclaims', 'services', 'deployments', 'projects')
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body or {}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+
+    def _handle(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            if self.command == 'GET':
+                if self.path in server.resources:
+                    return self._reply(200, server.resources[self.path])
+                if self.path.rsplit('/', 1)[-1] in self.collections:
+                    prefix = self.path + '/'
+                    return self._reply(200, {'items': [body for path, body in sorted(server.resources.items())
+                                                       if path.startswith(prefix) and '/' not in path[len(prefix):]]})
+                return self._reply(404, {'message': 'not found'})
+            if self.command == 'POST':
+                body = self._body()
+                body.setdefault('metadata', {})['resourceVersion'] = '1'
+                server.resources['%s/%s' % (self.path, body['metadata']['name'])] = body
+                return self._reply(201, body)
+            if self.command in ('PUT', 'PATCH'):
+                if self.path not in server.resources:
+                    return self._reply(404, {'message': 'not found'})
+                body = self._body()
+                if self.command == 'PATCH':
+                    metadata = dict(server.resources[self.path]['metadata'], **body['metadata'])
+                    body = dict(server.resources[self.path], **body)
+                    body['metadata'] = metadata
+                server.resources[self.path] = body
+                return self._reply(200, body)
+            if self.command == 'DELETE':
+                if server.resources.pop(self.path, None) is None:
+                    return self._reply(404, {'message': 'not found'})
+                return self._reply(200, {'status': 'Success'})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+def task(module_name, **params):
+    return {'name': 'task', module_name: params}
+
+
+class TestResources(unittest.TestCase):
+
+    def test_resource_path(self):
+        self.assertEqual(resource_path('v1', 'Service', 'demo', 'web'), '/api/v1/namespaces/demo/services/web')
+        self.assertEqual(resource_path('apps/v1beta1', 'Deployment', 'demo'),
+                         '/apis/apps/v1beta1/namespaces/demo/deployments')
+        self.assertEqual(resource_path('v1', 'DeploymentConfig', 'demo', 'web'),
+                         '/oapi/v1/namespaces/demo/deploymentconfigs/web')
+        self.assertEqual(resource_path('v1', 'Namespace', 'demo', 'demo'), '/api/v1/namespaces/demo')
+
+    def test_resource_from_task(self):
+        state, resource, force = resource_from_task(task(
+            'k8s_apps_v1beta1_deployment', state='present', force=True,
+            resource_definition={'apiVersion': 'apps/v1beta1', 'kind': 'deployment',
+                                 'metadata': {'name': 'web', 'namespace': 'demo'}}))
+        self.assertEqual((state, resource['kind'], force), ('present', 'Deployment', True))
+
+        state, resource, force = resource_from_task(task('openshift_v1_deployment_config', state='absent',
+                                                         name='web', namespace='demo'))
+        self.assertEqual(resource, {'apiVersion': 'v1', 'kind': 'DeploymentConfig',
+                                    'metadata': {'name': 'web', 'namespace': 'demo'}})
+
+        state, resource, force = resource_from_task(task('openshift_v1_project', state='present', name='demo',
+                                                         display_name='Demo'))
+        self.assertEqual((resource['kind'], resource['displayName']), ('ProjectRequest', 'Demo'))
+
+    def test_retarget_waves(self):
+        waves = [[('present', {'apiVersion': 'v1', 'kind': 'ProjectRequest', 'metadata': {'name': 'demo'}}, False)],
+                 [('present', {'apiVersion': 'v1', 'kind': 'Service',
+                               'metadata': {'name': 'web', 'namespace': 'demo', 'labels': {'app': 'demo'}}}, False)]]
+        retargeted = retarget_waves(waves, 'staging', display_name='Staging')
+        self.assertEqual(retargeted[0][0][1], {'apiVersion': 'v1', 'kind': 'ProjectRequest',
+                                               'metadata': {'name': 'staging'}, 'displayName': 'Staging'})
+        self.assertEqual(retargeted[1][0][1]['metadata'],
+                         {'name': 'web', 'namespace': 'staging', 'labels': {'app': 'demo'}})
+        self.assertEqual(waves[1][0][1]['metadata']['namespace'], 'demo')
+
+
+class TestWaveApplier(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeApiServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        client = K8sApiClient('http://127.0.0.1:%d' % self.server.server_address[1], api_key='secret', pool_size=4)
+        self.applier = WaveApplier(client, workers=4)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def waves(self, force=False):
+        def resource(kind, name, api_version='v1'):
+            return ('present', {'apiVersion': api_version, 'kind': kind,
+                                'metadata': {'name': name, 'namespace': 'demo'}}, force)
+        return [[('present', {'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': 'demo'}}, False)],
+                [resource('Secret', 'creds'), resource('PersistentVolumeClaim', 'data')],
+                [resource('Service', 'web'), resource('Service', 'db')],
+                [resource('Deployment', 'web', 'apps/v1beta1'), resource('Deployment', 'db', 'apps/v1beta1')]]
+
+    def test_create_in_waves(self):
+        results = self.applier.run(self.waves())
+        self.assertEqual([outcome for _, _, outcome, _ in results], ['created'] * 7)
+        self.assertIn('/api/v1/namespaces/demo/services/web', self.server.resources)
+        self.assertIn('/apis/apps/v1beta1/namespaces/demo/deployments/db', self.server.resources)
+        posts = [path for method, path in self.server.requests if method == 'POST']
+        self.assertEqual(posts[0], '/api/v1/namespaces')
+        self.assertTrue(all(path.endswith('/deployments') for path in posts[-2:]))
+
+    def test_unchanged_resources_are_skipped(self):
+        self.applier.run(self.waves())
+        del self.server.requests[:]
+        results = self.applier.run(self.waves())
+        self.assertEqual([outcome for _, _, outcome, _ in results], ['unchanged'] * 7)
+        self.assertEqual(set(method for method, _ in self.server.requests), set(['GET']))
+        # One list call per kind
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(summarize(results), {'created': 0, 'updated': 0, 'unchanged': 7, 'deleted': 0})
+
+    def test_update(self):
+        self.applier.run(self.waves())
+        waves = self.waves()
+        waves[2][0][1]['spec'] = {'ports': [{'port': 8080}]}
+        results = self.applier.run(waves)
+        self.assertEqual([outcome for _, _, outcome, _ in results].count('patched'), 1)
+        service = self.server.resources['/api/v1/namespaces/demo/services/web']
+        self.assertEqual(service['metadata']['annotations'][DIGEST_ANNOTATION_KEY], resource_digest(waves[2][0][1]))
+        waves[2][0][1]['spec'] = {'ports': [{'port': 8081}]}
+        waves[2][0] = waves[2][0][:2] + (True,)
+        results = self.applier.run(waves)
+        self.assertEqual(summarize(results), {'created': 0, 'updated': 1, 'unchanged': 6, 'deleted': 0})
+        self.assertEqual(self.server.resources['/api/v1/namespaces/demo/services/web']['metadata']['resourceVersion'],
+                         '1')
+
+    def test_restart(self):
+        def deployment(replicas):
+            return ('present', {'apiVersion': 'apps/v1beta1', 'kind': 'Deployment',
+                                'metadata': {'name': 'web', 'namespace': 'demo'},
+                                'spec': {'replicas': replicas}}, False)
+        self.applier.run([[deployment(1)]])
+        # The stop wave scales down, and the start wave scales back up, in a single run
+        results = self.applier.run([[deployment(0)], [deployment(1)]])
+        self.assertEqual([outcome for _, _, outcome, _ in results], ['patched', 'patched'])
+        deployment_path = '/apis/apps/v1beta1/namespaces/demo/deployments/web'
+        self.assertEqual(self.server.resources[deployment_path]['spec']['replicas'], 1)
+
+    def test_resource_digest(self):
+        resource = {'apiVersion': 'v1', 'kind': 'Service', 'metadata': {'name': 'web'}}
+        stamped = {'apiVersion': 'v1', 'kind': 'Service',
+                   'metadata': {'name': 'web', 'annotations': {DIGEST_ANNOTATION_KEY: 'abc'}}}
+        self.assertEqual(resource_digest(resource), resource_digest(stamped))
+        self.assertNotEqual(resource_digest(resource), resource_digest(dict(resource, spec={})))
+
+    def test_delete(self):
+        self.applier.run(self.waves())
+        service = {'apiVersion': 'v1', 'kind': 'Service', 'metadata': {'name': 'web', 'namespace': 'demo'}}
+        self.assertEqual(self.applier.apply('absent', service), 'deleted')
+        self.assertEqual(self.applier.apply('absent', service), 'absent')
@@ -0,0 +1,103 @@
+import json
+import threading
+import unittest
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from container.exceptions import AnsibleContainerDeployException
+from container.k8s.apply import K8sApiClient
+from container.k8s.rollout import RolloutWatcher, pod_failure, rollout_status
+
+
+def deployment(name, updated=0, available=0, replicas=1, generation=1):
+    return {'apiVersion': 'apps/v1beta1', 'kind': 'Deployment',
+            'metadata': {'name': name, 'namespace': 'demo', 'generation': generation},
+            'spec': {'replicas': replicas},
+            'status': {'observedGeneration': generation, 'replicas': max(updated, replicas),
+                       'updatedReplicas': updated, 'availableReplicas': available}}
+
+
+def pod(service, reason=None):
+    state = {'waiting': {'reason': reason, 'message': 'back-off'}} if reason else {'running': {}}
+    return {'metadata': {'name': '%s-1' % service, 'labels': {'app': 'demo', 'service': service}},
+            'status': {'containerStatuses': [{'name': service, 'state': state}]}}
+
+
+class FakeWatchServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Lists the initial objects of each collection, then streams the queued events to a watch """
+    daemon_threads = True
+
+    def __init__(self, listings, events):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeWatchHandler)
+        self.listings = listings
+        self.events = events
+        self.watches = []
+
+
+class FakeWatchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        if 'watch' not in parse_qs(url.query):
+            items = self.server.listings.get(url.path, [])
+            self.wfile.write(json.dumps({'metadata': {'resourceVersion': '1'}, 'items': items}).encode('utf-8'))
+            return
+        self.server.watches.append(url.path)
+        for event in self.server.events.get(url.path, []):
+            self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class TestRolloutStatus(unittest.TestCase):
+
+    def test_rollout_status(self):
+        self.assertEqual(rollout_status(deployment('web', 1, 0)), (False, 1, 0, 1))
+        self.assertEqual(rollout_status(deployment('web', 1, 1)), (True, 1, 1, 1))
+        stale = deployment('web', 1, 1)
+        stale['metadata']['generation'] = 2
+        self.assertFalse(rollout_status(stale)[0])
+
+    def test_pod_failure(self):
+        self.assertIsNone(pod_failure(pod('web')))
+        self.assertIn('CrashLoopBackOff', pod_failure(pod('web', 'CrashLoopBackOff')))
+        self.assertIsNone(pod_failure(pod('web', 'ContainerCreating')))
+
+
+class TestRolloutWatcher(unittest.TestCase):
+
+    def serve(self, listings, events):
+        self.server = FakeWatchServer(listings, events)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        client = K8sApiClient('http://127.0.0.1:%d' % self.server.server_address[1])
+        return RolloutWatcher(client, timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_wait(self):
+        deployments = '/apis/apps/v1beta1/namespaces/demo/deployments'
+        watcher = self.serve({deployments: [deployment('web', 1, 1), deployment('db')]},
+                             {deployments: [{'type': 'MODIFIED', 'object': deployment('db', 1, 0)},
+                                            {'type': 'MODIFIED', 'object': deployment('db', 1, 1)}]})
+        ready = watcher.wait([deployment('web'), deployment('db')])
+        self.assertEqual(sorted(ready), ['db', 'web'])
+        self.assertIn(deployments, self.server.watches)
+
+    def test_crash_loop(self):
+        pods = '/api/v1/namespaces/demo/pods'
+        watcher = self.serve({pods: [pod('web')]},
+                             {pods: [{'type': 'MODIFIED', 'object': pod('web', 'CrashLoopBackOff')}]})
+        with pytest.raises(AnsibleContainerDeployException) as excinfo:
+            watcher.wait([deployment('web')])
+        self.assertIn('CrashLoopBackOff', str(excinfo.value))
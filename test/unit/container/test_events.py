@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from container.utils.events import EVENT_MARKER, EventLog, parse_event, render_event
+from container.utils.logmux import LogMultiplexer
+
+
+class ListLogger(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(message)
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_parse_event(self):
+        event = {'event': 'play_start', 'play': 'web'}
+        self.assertEqual(parse_event(u'web | ' + EVENT_MARKER + json.dumps(event)), event)
+        self.assertIsNone(parse_event(u'TASK [apache : install] ****'))
+        self.assertIsNone(parse_event(EVENT_MARKER + u'{not json'))
+        self.assertIsNone(parse_event(EVENT_MARKER + u'[1, 2]'))
+
+    def test_render_event(self):
+        line = render_event({'event': 'task_end', 'status': 'changed', 'host': 'web', 'duration': 1.5,
+                             'task': 'apache : install'})
+        self.assertEqual(line.split(), ['changed', 'web', '1.50s', 'apache', ':', 'install'])
+        self.assertIn(' - ', render_event({'event': 'task_end', 'host': 'web', 'task': 'x'}))
+        failed = render_event({'event': 'task_end', 'status': 'failed', 'host': 'web', 'task': 'x',
+                               'msg': 'No package matching apache'})
+        self.assertEqual(failed.splitlines()[1].strip(), 'No package matching apache')
+        self.assertEqual(render_event({'event': 'play_start', 'play': 'web'}), u'PLAY web')
+        recap = render_event({'event': 'playbook_end', 'stats': {
+            'web': {'ok': 3, 'changed': 1, 'failures': 0, 'unreachable': 0, 'skipped': 2}}})
+        self.assertEqual(recap.split(), ['RECAP', 'web', 'ok=3', 'changed=1', 'failed=0', 'unreachable=0',
+                                         'skipped=2'])
+        self.assertIsNone(render_event({'event': 'task_start'}))
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'events.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_closed_when_output_ends(self):
+        log_obj = ListLogger()
+        event_log = EventLog(self.path, log_obj)
+        closed = threading.Event()
+        close = event_log.close
+
+        def close_and_signal():
+            close()
+            closed.set()
+        event_log.close = close_and_signal
+
+        event = {'event': 'play_start', 'play': 'web'}
+        LogMultiplexer().add_iterator(iter([b'Parsing conductor CLI args.\n', EVENT_MARKER + json.dumps(event)]),
+                                      event_log)
+        self.assertTrue(closed.wait(5))
+        self.assertTrue(event_log.ofs.closed)
+        self.assertEqual(log_obj.messages, [u'Parsing conductor CLI args.', u'PLAY web'])
+        with open(self.path) as ifs:
+            self.assertEqual([json.loads(line) for line in ifs], [event])
@@ -0,0 +1,52 @@
+import unittest
+
+from container.utils.executor import InProcessPlaybookRunner, PlaybookResult
+
+
+class TestPlaybookResult(unittest.TestCase):
+
+    def test_compares_as_return_code(self):
+        self.assertEqual(PlaybookResult(0), 0)
+        self.assertFalse(PlaybookResult(0))
+        self.assertTrue(PlaybookResult(2))
+        self.assertEqual(PlaybookResult(2, stats={}), 2)
+        self.assertEqual('%d' % PlaybookResult(4), '4')
+
+    def test_changed(self):
+        stats = {'web': {'ok': 3, 'changed': 2, 'failures': 0, 'unreachable': 0, 'skipped': 1},
+                 'db': {'ok': 1, 'changed': 1, 'failures': 0, 'unreachable': 0, 'skipped': 0}}
+        self.assertEqual(PlaybookResult(0, stats=stats).changed, 3)
+        self.assertEqual(PlaybookResult(0).changed, 0)
+
+
+class TestSupports(unittest.TestCase):
+
+    def test_in_process(self):
+        self.assertTrue(InProcessPlaybookRunner.supports())
+        self.assertTrue(InProcessPlaybookRunner.supports(callbacks=[], extra_env={}))
+
+    def test_subprocess_fallbacks(self):
+        self.assertFalse(InProcessPlaybookRunner.supports(callbacks=['checkpoint']))
+        self.assertFalse(InProcessPlaybookRunner.supports(extra_env={'ANSIBLE_CONTAINER_CHECKPOINT_EVERY': '5'}))
+        self.assertFalse(InProcessPlaybookRunner.supports(event_log='/src/events.jsonl'))
+
+
+class FakeStats(object):
+
+    def __init__(self, summaries):
+        self.processed = dict((host, 1) for host in summaries)
+        self.summaries = summaries
+
+    def summarize(self, host):
+        return self.summaries[host]
+
+
+class TestStatsCallback(unittest.TestCase):
+
+    def test_records_summary(self):
+        from container.plugins.callback.ac_stats import CallbackModule
+        from container.utils import executor
+        summary = {'ok': 2, 'changed': 1, 'failures': 0, 'unreachable': 0, 'skipped': 0}
+        del executor._playbook_stats[:]
+        CallbackModule().v2_playbook_on_stats(FakeStats({'web': summary}))
+        self.assertEqual(executor._playbook_stats, [{'web': summary}])
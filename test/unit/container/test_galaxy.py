@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytest
+
+from container.utils import galaxy
+from container.utils.galaxy import AnsibleContainerGalaxy, RoleArchiveCache
+from container import exceptions
+
+
+class FakeRole(object):
+
+    def __init__(self, src, version=None, scm=None, dependencies=()):
+        self.src = src
+        self.name = src
+        self.version = version
+        self.scm = scm
+        self.metadata = {'dependencies': list(dependencies)}
+
+
+class TestRoleArchiveCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.temp_dir, 'download.tar.gz')
+        with open(self.archive, 'wb') as ofs:
+            ofs.write(b'role tarball')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_and_get(self):
+        cache = RoleArchiveCache(os.path.join(self.temp_dir, 'cache'))
+        self.assertIsNone(cache.get('geerlingguy.apache', '2.0.0'))
+        blob_path = cache.put('geerlingguy.apache', '2.0.0', self.archive)
+        # Another version with the same content shares the blob
+        self.assertEqual(cache.put('geerlingguy.apache', '2.0.1', self.archive), blob_path)
+        self.assertEqual(cache.get('geerlingguy.apache', '2.0.0'), blob_path)
+        self.assertEqual(cache.versions('geerlingguy.apache'), ['2.0.0', '2.0.1'])
+        with open(blob_path, 'rb') as ifs:
+            self.assertEqual(ifs.read(), b'role tarball')
+
+    def test_archive_dirs(self):
+        archive_dir = os.path.join(self.temp_dir, 'archives')
+        os.mkdir(archive_dir)
+        for filename in ('geerlingguy.apache-1.9.0.tgz', 'geerlingguy.apache-1.10.0.tar.gz', 'other-1.0.tar'):
+            shutil.copyfile(self.archive, os.path.join(archive_dir, filename))
+        cache = RoleArchiveCache(archive_dirs=[archive_dir])
+        self.assertEqual(cache.get('geerlingguy.apache', '1.9.0'),
+                         os.path.join(archive_dir, 'geerlingguy.apache-1.9.0.tgz'))
+        self.assertIsNone(cache.get('geerlingguy.apache', '2.0.0'))
+        self.assertEqual(cache.versions('geerlingguy.apache'), ['1.9.0', '1.10.0'])
+
+
+class TestOffline(unittest.TestCase):
+
+    def test_missing_role(self):
+        installer = AnsibleContainerGalaxy(offline=True)
+        with pytest.raises(exceptions.AnsibleContainerGalaxyRoleException):
+            installer._role_archive(FakeRole('geerlingguy.apache'))
+
+    def test_missing_scm_role(self):
+        installer = AnsibleContainerGalaxy(offline=True)
+        with pytest.raises(exceptions.AnsibleContainerGalaxyRoleException):
+            installer._role_archive(FakeRole('https://github.com/example/role.git', scm='git'))
+
+    def test_role_without_src(self):
+        installer = AnsibleContainerGalaxy()
+        self.assertEqual(installer._role_archive(FakeRole(None, scm='git')), (None, False))
+
+
+class TestInstallLevels(unittest.TestCase):
+
+    def test_dependencies_install_after_their_dependents(self):
+        roles = {'web': FakeRole('web', dependencies=['common', 'nginx']),
+                 'db': FakeRole('db', dependencies=['common']),
+                 'nginx': FakeRole('nginx', dependencies=['common']),
+                 'common': FakeRole('common')}
+        installed = []
+
+        class Installer(AnsibleContainerGalaxy):
+
+            @staticmethod
+            def _parse_requirement(role_req):
+                return {'name': role_req}
+
+            def _install_quietly(self, role_req_kwargs):
+                return roles[role_req_kwargs['name']], True, None
+
+            def _update_container_yml(self, role_obj):
+                installed.append(role_obj.name)
+
+            def _update_requirements_yml(self, role_obj):
+                pass
+
+        galaxy_class = galaxy.Galaxy
+        galaxy.Galaxy = lambda options: None
+        try:
+            Installer(workers=2).install(['web', 'db'])
+        finally:
+            galaxy.Galaxy = galaxy_class
+        # A level at a time, and each role once
+        self.assertEqual(installed, ['web', 'db', 'common', 'nginx'])
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from container.utils.ignore import PathIgnorer
+
+
+class TestPathIgnorer(unittest.TestCase):
+
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        with open(os.path.join(self.base_path, '.dockerignore'), 'w') as ofs:
+            ofs.write('# build output\n/dist\n\n*.pyc\n')
+        with open(os.path.join(self.base_path, '.acignore'), 'w') as ofs:
+            ofs.write('.git/\ndocs/**/*.md\n')
+        self.ignorer = PathIgnorer.from_project(self.base_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def path(self, *parts):
+        return os.path.join(self.base_path, *parts)
+
+    def test_reads_both_files(self):
+        self.assertEqual(self.ignorer.patterns, ['/dist', '*.pyc', '.git/', 'docs/**/*.md'])
+
+    def test_anchored_pattern(self):
+        self.assertEqual(self.ignorer.match(self.path('dist'), True), '/dist')
+        self.assertIsNone(self.ignorer.match(self.path('roles', 'web', 'dist'), True))
+        self.assertIsNone(self.ignorer.match('/etc/ansible/roles/web/dist', True,
+                                             walk_root='/etc/ansible/roles/web'))
+
+    def test_unanchored_pattern(self):
+        self.assertEqual(self.ignorer.match(self.path('roles', 'web', 'x.pyc'), False), '*.pyc')
+        self.assertEqual(self.ignorer.match('/etc/ansible/roles/web/files/x.pyc', False,
+                                            walk_root='/etc/ansible/roles/web'), '*.pyc')
+        self.assertIsNone(self.ignorer.match(self.path('roles', 'web', 'x.py'), False))
+
+    def test_directory_only_pattern(self):
+        self.assertEqual(self.ignorer.match(self.path('roles', 'web', '.git'), True), '.git/')
+        self.assertIsNone(self.ignorer.match(self.path('roles', 'web', '.git'), False))
+
+    def test_double_star(self):
+        self.assertEqual(self.ignorer.match(self.path('docs', 'a', 'b', 'c.md'), False), 'docs/**/*.md')
+        self.assertIsNone(self.ignorer.match(self.path('docs', 'c.rst'), False))
+
+    def test_no_ignore_files(self):
+        self.assertFalse(PathIgnorer.from_project(self.path('missing')))
+
+    def test_filter_rules(self):
+        with open(self.path('.acignore'), 'w') as ofs:
+            ofs.write('!\n+ keep.pyc\n- *.log\n')
+        ignorer = PathIgnorer.from_project(self.base_path)
+        # The .dockerignore patterns are cleared, and the first matching rule decides
+        self.assertEqual(ignorer.patterns, ['+ keep.pyc', '*.log'])
+        self.assertIsNone(ignorer.match(self.path('dist'), True))
+        self.assertIsNone(ignorer.match(self.path('roles', 'web', 'keep.pyc'), False))
+        self.assertEqual(ignorer.match(self.path('roles', 'web', 'build.log'), False), '*.log')
+
+    def test_dockerignore_lines_are_excludes(self):
+        # rsync reads the .dockerignore with the :- modifier, so prefixes aren't rules there
+        with open(self.path('.dockerignore'), 'w') as ofs:
+            ofs.write('!\n')
+        self.assertEqual(PathIgnorer.from_project(self.base_path).patterns[0], '!')
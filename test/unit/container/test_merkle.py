@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from container.utils.ignore import PathIgnorer
+from container.utils.merkle import TreeHasher
+
+
+class TestTreeHasher(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_tree(self, name, files):
+        root = os.path.join(self.temp_dir, name)
+        for rel_path, content in files:
+            path = os.path.join(root, rel_path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as ofs:
+                ofs.write(content)
+        return root
+
+    def test_independent_of_location_and_order(self):
+        files = [('tasks/main.yml', 'tasks'), ('files/a', 'a'), ('files/b', 'b')]
+        first = self.make_tree('first', files)
+        second = self.make_tree('second', list(reversed(files)))
+        self.assertEqual(TreeHasher().dir_digest(first), TreeHasher(workers=1).dir_digest(second))
+
+    def test_content_and_names_matter(self):
+        base = TreeHasher().dir_digest(self.make_tree('base', [('files/a', 'a')]))
+        changed = TreeHasher().dir_digest(self.make_tree('changed', [('files/a', 'A')]))
+        renamed = TreeHasher().dir_digest(self.make_tree('renamed', [('files/b', 'a')]))
+        self.assertEqual(len(set([base, changed, renamed])), 3)
+
+    def test_subtrees_are_memoized(self):
+        root = self.make_tree('role', [('files/a', 'a'), ('tasks/main.yml', 'tasks')])
+        hasher = TreeHasher()
+        subtree = hasher.dir_digest(os.path.join(root, 'files'))
+        with open(os.path.join(root, 'files', 'a'), 'w') as ofs:
+            ofs.write('changed')
+        hasher.dir_digest(root)
+        self.assertEqual(hasher.dir_digest(os.path.join(root, 'files')), subtree)
+        self.assertNotEqual(TreeHasher().dir_digest(os.path.join(root, 'files')), subtree)
+
+    def test_ignored_paths(self):
+        root = self.make_tree('role', [('tasks/main.yml', 'tasks')])
+        expected = TreeHasher().dir_digest(root)
+        self.make_tree('role', [('.git/HEAD', 'ref'), ('tasks/main.yml.swp', 'x')])
+        ignorer = PathIgnorer(self.temp_dir, ['.git/', '*.swp'])
+        self.assertEqual(TreeHasher(ignorer).dir_digest(root), expected)
+
+    def test_memoized_per_walk_root(self):
+        # Outside the project, patterns match paths relative to the directory walked
+        root = self.make_tree('shared', [('files/a.bak', 'a'), ('files/b', 'b')])
+        ignorer = PathIgnorer(os.path.join(self.temp_dir, 'project'), ['files/*.bak'])
+        hasher = TreeHasher(ignorer)
+        hasher.dir_digest(root)
+        self.assertEqual(hasher.dir_digest(os.path.join(root, 'files')),
+                         TreeHasher(ignorer).dir_digest(os.path.join(root, 'files')))
+        self.assertNotEqual(hasher.dir_digest(os.path.join(root, 'files')),
+                            TreeHasher().dir_digest(self.make_tree('b', [('b', 'b')])))
@@ -0,0 +1,57 @@
+import fnmatch
+import unittest
+
+import pytest
+
+from container.utils.slim import get_slim_paths, get_slim_fingerprint, filter_mounted_paths, SLIM_COMMON_PATHS
+from container.exceptions import AnsibleContainerConfigException
+
+
+class TestSlimPaths(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertEqual(get_slim_paths({'ID': 'centos'}), [])
+
+    def test_distro_defaults(self):
+        paths = get_slim_paths({'ID': 'ubuntu', 'ID_LIKE': 'debian'}, settings_slim=True)
+        self.assertIn('/var/lib/apt/lists/*', paths)
+        self.assertNotIn('/var/cache/yum/*', paths)
+        for path in SLIM_COMMON_PATHS:
+            self.assertIn(path, paths)
+
+    def test_service_overrides_settings(self):
+        paths = get_slim_paths({'ID': 'alpine'}, settings_slim=True, service_slim=False)
+        self.assertEqual(paths, [])
+        paths = get_slim_paths({'ID': 'alpine'}, settings_slim={'paths': ['/usr/share/doc/*']},
+                               service_slim={'keep': ['/var/cache/apk/*']})
+        self.assertIn('/usr/share/doc/*', paths)
+        self.assertNotIn('/var/cache/apk/*', paths)
+
+    def test_invalid_path(self):
+        with pytest.raises(AnsibleContainerConfigException):
+            get_slim_paths({}, settings_slim={'paths': ['/tmp; rm -rf /']})
+        with pytest.raises(AnsibleContainerConfigException):
+            get_slim_paths({}, settings_slim={'paths': ['relative/path']})
+
+    def test_fingerprint(self):
+        # Unslimmed builds keep their fingerprints
+        self.assertEqual(get_slim_fingerprint(), u'')
+        self.assertEqual(get_slim_fingerprint(settings_slim=True, service_slim=False), u'')
+        fingerprints = set([get_slim_fingerprint(settings_slim=True),
+                            get_slim_fingerprint(settings_slim={'paths': ['/usr/share/doc/*']}),
+                            get_slim_fingerprint(settings_slim=True, service_slim={'keep': ['/tmp/*']})])
+        self.assertEqual(len(fingerprints), 3)
+        self.assertEqual(get_slim_fingerprint(settings_slim=True),
+                         get_slim_fingerprint(settings_slim={'enabled': True}))
+
+    def test_mounted_paths_are_skipped(self):
+        paths = filter_mounted_paths(['/tmp/*', '/var/cache/yum/*', '/var/tmp/*'],
+                                     ['/tmp/data', '/var/cache/yum', '/_usr'])
+        self.assertEqual(paths, ['/var/tmp/*'])
+
+    def test_dotfiles_in_tmp(self):
+        paths = get_slim_paths({}, settings_slim=True)
+        self.assertIn('/tmp/.[!.]*', paths)
+        self.assertIn('/var/tmp/.[!.]*', paths)
+        self.assertTrue(fnmatch.fnmatch('/tmp/.ansible-tmp', '/tmp/.[!.]*'))
+        self.assertFalse(fnmatch.fnmatch('/tmp/..', '/tmp/.[!.]*'))
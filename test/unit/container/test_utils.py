@@ -4,8 +4,14 @@ from os import path
 import unittest
 import os
 import pytest
-from container.utils import assert_initialized
-from container.exceptions import AnsibleContainerNotInitializedException
+import zlib
+import yaml
+from ruamel import yaml as ruamel_yaml
+from ruamel.yaml.compat import ordereddict
+import container
+from container.utils import (assert_initialized, metadata_to_image_config, parse_port_ranges,
+                             encode_conductor_payload, decode_conductor_payload)
+from container.exceptions import AnsibleContainerException, AnsibleContainerNotInitializedException
 
 
 class TestMissingFiles(unittest.TestCase):
@@ -29,3 +35,54 @@ class TestMissingFiles(unittest.TestCase):
         f.write('')
         with pytest.raises(AnsibleContainerNotInitializedException):
             assert_initialized(self.test_dir)
+
+
+class TestPortRanges(unittest.TestCase):
+
+    def test_parse_port_ranges(self):
+        ports = ['8080', '80:8081', '127.0.0.1:5000-5010:6000-6010/udp', '6005-6020/udp', 6021, '9000-9001']
+        self.assertEqual(parse_port_ranges(ports),
+                         [(6021, 6021, 'tcp'), (8080, 8081, 'tcp'), (9000, 9001, 'tcp'), (6000, 6020, 'udp')])
+
+    def test_exposed_ports(self):
+        config = metadata_to_image_config({'ports': ['10000-10002/udp', '80']})
+        self.assertEqual(sorted(config['ExposedPorts']), ['10000/udp', '10001/udp', '10002/udp', '80/tcp'])
+
+
+class TestConductorPayload(unittest.TestCase):
+
+    def decode(self, data):
+        # The payload is written on the host and read in the Conductor
+        env, container.ENV = container.ENV, 'conductor'
+        try:
+            return decode_conductor_payload(data)
+        finally:
+            container.ENV = env
+
+    def test_round_trip(self):
+        services = ordereddict([('web', {'image': 'centos:7'}), ('db', {'image': 'postgres:9.6'})])
+        config = ordereddict([('version', '2'), ('services', services)])
+        decoded_config, params = self.decode(encode_conductor_payload(config, {'debug': True}))
+        self.assertEqual(list(decoded_config['services']), ['web', 'db'])
+        self.assertIsInstance(decoded_config['services'], ordereddict)
+        self.assertEqual(params, {'debug': True})
+
+    def test_version_mismatch(self):
+        data = zlib.compress(b'{"version":0,"config":{},"params":{}}')
+        with pytest.raises(AnsibleContainerException):
+            self.decode(data)
+
+    def test_nested_mappings_are_plain(self):
+        web = ordereddict([('image', 'centos:7'),
+                           ('environment', ordereddict([('DEBUG', '1')])),
+                           ('roles', [ordereddict([('role', 'apache'), ('port', 80)])])])
+        config = ordereddict([('version', '2'), ('services', ordereddict([('web', web)]))])
+        decoded_config, params = self.decode(encode_conductor_payload(config, {'vars': {'a': {'b': 1}}}))
+        self.assertIs(type(decoded_config['services']['web']['environment']), dict)
+        self.assertIs(type(params['vars']['a']), dict)
+        # Each service is dumped and templated as the config is processed, and the result ends up
+        # in playbooks that Ansible loads
+        dumped = ruamel_yaml.round_trip_dump(decoded_config['services']['web'])
+        self.assertNotIn('!!omap', dumped)
+        self.assertEqual(yaml.safe_load(dumped), {'image': 'centos:7', 'environment': {'DEBUG': '1'},
+                                                  'roles': [{'role': 'apache', 'port': 80}]})